@@ -4,18 +4,81 @@
 #     ;COMMENT
 #     $DATA
 
-import re
+import os
 import sys
+import time
+import struct
+import hashlib
 import argparse
+import hotreload
 
 
-REGEX_CMD = re.compile('(RET|JMP(?:V0)?|IF_(?:N?EQ|KEY|NOTKEY)|CALL|CLEAR_SCREEN|JMP|LD[IR]?|ADDC?|X?OR|AND|SUB[C2]|SH[LR]|STR|BCD|CHAR|GET_DELAY|SET_(?:DELAY|SOUND)|WAITKEY|RANDOM|DRAW)',
-    flags=re.IGNORECASE
-)
-REGEX_V = re.compile('[vV]([0-9a-fA-F])')
-REGEX_REG = re.compile('[vV]([0-9a-fA-F])|([iI])')
 ORG = None
 LABEL_DICT = {}
+# where a linked ROM image starts.
+ROM_BASE = 0x200
+# seconds between two checks for changed sources in --watch mode.
+WATCH_INTERVAL = 0.2
+
+# the instruction set, one row per encoding; same mnemonics as the DISASM
+# column of disasm_mnemonics.txt. operand kinds:
+#     V  register; the first one goes to X, the second one to Y
+#     I  the literal I
+#     N  byte
+#     A  12-bit address or #label
+#     S  nibble
+#     K  register count, goes to X (STR/LDR)
+INSTRUCTIONS = (
+    ('CLEAR_SCREEN', '',    0x00e0),
+    ('RET',          '',    0x00ee),
+    ('JMP',          'A',   0x1000),
+    ('CALL',         'A',   0x2000),
+    ('IF_NEQ',       'VN',  0x3000),
+    ('IF_EQ',        'VN',  0x4000),
+    ('IF_NEQ',       'VV',  0x5000),
+    ('LD',           'VN',  0x6000),
+    ('ADD',          'VN',  0x7000),
+    ('LD',           'VV',  0x8000),
+    ('OR',           'VV',  0x8001),
+    ('AND',          'VV',  0x8002),
+    ('XOR',          'VV',  0x8003),
+    ('ADDC',         'VV',  0x8004),
+    ('SUBC',         'VV',  0x8005),
+    ('SHR',          'VV',  0x8006),
+    ('SUB2',         'VV',  0x8007),
+    ('SHL',          'VV',  0x800e),
+    ('IF_EQ',        'VV',  0x9000),
+    ('LDI',          'A',   0xa000),
+    ('JMPV0',        'A',   0xb000),
+    ('RANDOM',       'VN',  0xc000),
+    ('DRAW',         'VVS', 0xd000),
+    ('IF_NOTKEY',    'V',   0xe09e),
+    ('IF_KEY',       'V',   0xe0a1),
+    ('GET_DELAY',    'V',   0xf007),
+    ('WAITKEY',      'V',   0xf00a),
+    ('SET_DELAY',    'V',   0xf015),
+    ('SET_SOUND',    'V',   0xf018),
+    ('ADD',          'IV',  0xf01e),
+    ('CHAR',         'V',   0xf029),
+    ('BCD',          'V',   0xf033),
+    ('STR',          'K',   0xf055),
+    ('LDR',          'K',   0xf065),
+)
+
+# token kinds.
+T_ORG = 0
+T_LABEL = 1
+T_DATA = 2
+T_INSTR = 3
+
+# source line -> token. tokenize() only looks at the line itself, so the
+# same text always gives the same token, in this source or the next one.
+TOKEN_CACHE = {}
+TOKEN_CACHE_MAX = 1 << 18
+_UNCACHED = object()
+
+# register operand -> register number, in every spelling.
+REGISTERS = {f'{v}{d}': int(d, 16) for v in 'vV' for d in '0123456789abcdefABCDEF'}
 
 def _N(s: str) -> int:
     r = 0
@@ -34,268 +97,444 @@ def _int(s: str) -> int:
         else 10
     )
 
-def compile_source(s: str):
-    global ORG
-    res = []
-    current_pos = 0
-    cmd_list = s.split('\n')
-    for _line, cmd in enumerate(cmd_list):
-        cmd = cmd.strip()
-        if not cmd: continue
-        elif cmd[0] == ';': continue
-        elif cmd[0] == '@':
-            ORG = _N(cmd[1:])
+def _encodings() -> dict:
+    # (mnemonic, operand shape) -> (base opcode, ((shift, mask), ...)).
+    # the shape only tells registers ('V'), I ('I') and values ('n')
+    # apart; mask None marks an operand that adds no bits.
+    res = {}
+    for mnemonic, kinds, base in INSTRUCTIONS:
+        shape = ''
+        fields = []
+        regs = 0
+        for k in kinds:
+            if k == 'V':
+                shape += 'V'
+                fields.append((8 if regs == 0 else 4, 0xf))
+                regs += 1
+            elif k == 'I':
+                shape += 'I'
+                fields.append((0, None))
+            else:
+                shape += 'n'
+                fields.append({'N': (0, 0xff), 'A': (0, 0xfff), 'S': (0, 0xf), 'K': (8, 0xf)}[k])
+        res[(mnemonic, shape)] = (base, tuple(fields), 'A' in kinds)
+    return res
+
+ENCODINGS = _encodings()
+
+def tokenize(line: str):
+    # one source line -> None (blank or comment) or a token:
+    #     (T_ORG, address)
+    #     (T_LABEL, name)
+    #     (T_DATA, bytes)
+    #     (T_INSTR, opcode, label or None)
+    # an instruction token already has every operand but the label
+    # encoded. raises on malformed lines.
+    cmd = line.strip()
+    if not cmd: return None
+    c = cmd[0]
+    if c == ';': return None
+    elif c == '@': return (T_ORG, _N(cmd[1:]))
+    elif c == '#': return (T_LABEL, cmd[1:].strip())
+    elif c == '$':
+        data_source = cmd[1:].strip()
+        return (T_DATA, bytes([_int(d.strip()) for d in data_source.split(',')]) if data_source else b'')
+    parts = cmd.split(None, 1)
+    args = [a.strip() for a in parts[1].split(',')] if len(parts) > 1 else []
+    if '' in args:
+        raise Exception(f'Unsupported instruction: {cmd}')
+    shape = ''
+    values = []
+    for a in args:
+        r = REGISTERS.get(a)
+        if r is not None:
+            shape += 'V'; values.append(r)
+        elif a == 'I' or a == 'i':
+            shape += 'I'; values.append(0)
+        else:
+            shape += 'n'; values.append(a)
+    enc = ENCODINGS.get((parts[0].upper(), shape))
+    if enc is None:
+        raise Exception(f'Unsupported instruction: {cmd}')
+    opcode, fields, takes_label = enc
+    label = None
+    for a, (shift, mask) in zip(values, fields):
+        if mask is None: continue
+        elif a.__class__ is int: opcode |= a << shift
+        elif a[0] == '#':
+            if not takes_label: raise Exception(f'Unsupported instruction: {cmd}')
+            label = a[1:].strip()
+        else: opcode |= ((int(a) if a.isdigit() else _int(a)) & mask) << shift
+    return (T_INSTR, opcode, label)
+
+def assemble(s: str, name: str = '<source>', org_anywhere: bool = False, base: int = 0):
+    # assembles one source into an ObjectFile without resolving labels:
+    # every #label operand is left as zero and recorded as a relocation.
+    # returns None on a fatal error. an object is placed by an @ORG that
+    # comes before any code; one after code is an error unless
+    # org_anywhere, where (as for a single source) it only moves the
+    # addresses of the labels that follow. labels before any @ORG count
+    # from base: 0 for objects, which link() shifts to where they land.
+    global ORG, LABEL_DICT
+    # pass 1 tokenizes every line once, assigns addresses and collects
+    # labels; pass 2 only walks the tokens and writes into a buffer of
+    # the final size.
+    labels = {}
+    tokens = []
+    org = None
+    current_pos = base
+    size = 0
+    cache = TOKEN_CACHE
+    if len(cache) > TOKEN_CACHE_MAX:
+        cache.clear()
+    failed = False
+    for _line, cmd in enumerate(s.split('\n')):
+        t = cache.get(cmd, _UNCACHED)
+        if t is _UNCACHED:
+            try:
+                t = cache[cmd] = tokenize(cmd)
+            except Exception as e:
+                # keep going so every bad line gets reported.
+                print(f'{name}:(L{_line+1}) {e}')
+                failed = True
+                continue
+        if t is None: continue
+        kind = t[0]
+        if kind == T_INSTR:
+            tokens.append((size, _line, t))
+            current_pos += 2
+            size += 2
+        elif kind == T_DATA:
+            tokens.append((size, _line, t))
+            current_pos += len(t[1])
+            size += len(t[1])
+        elif kind == T_LABEL:
+            if t[1] in labels:
+                print(f'{name}:(L{_line+1}) Duplicated label {t[1]}')
+                return None
+            labels[t[1]] = current_pos
+        else:
+            if size and not org_anywhere:
+                print(f'{name}:(L{_line+1}) @ORG after code; only a leading @ORG can place an object')
+                return None
+            ORG = t[1]
             current_pos = ORG
-        elif cmd[0] == '#':
-            lbl_name = cmd[1:].strip()
-            if lbl_name in LABEL_DICT:
-                print(f'(L{_line+1}) Duplicated label {lbl_name}')
+            if not size: org = ORG
+    if failed:
+        return None
+    LABEL_DICT = labels
+
+    res = bytearray(size)
+    relocations = []
+    for offset, _line, t in tokens:
+        if t[0] == T_DATA:
+            res[offset:offset+len(t[1])] = t[1]
+            continue
+        _, opcode, label = t
+        if label is not None:
+            relocations.append((offset, _line, label))
+        res[offset] = opcode >> 8
+        res[offset+1] = opcode & 0xff
+    return ObjectFile(name, org, bytes(res), labels, relocations)
+
+def compile_source(s: str, name: str = '<source>') -> bytes:
+    # a single source on its own: labels resolve against the source's own
+    # @ORG addresses and the code is returned as is, without placing it.
+    # a source without a leading @ORG starts at ROM_BASE, where link()
+    # would place it too, so it assembles the same with or without -o.
+    # returns b'' on error.
+    obj = assemble(s, name, org_anywhere=True, base=ROM_BASE)
+    if obj is None: return b''
+    res = bytearray(obj.code)
+    ok = True
+    for offset, _line, label in obj.relocations:
+        if label not in obj.labels:
+            print(f'{name}:(L{_line+1}) Undefined label {label}')
+            ok = False
+        else:
+            _patch(res, offset, obj.labels[label])
+    return bytes(res) if ok else b''
+
+
+# object files.
+#
+# An object holds one assembled source: its code with every #label operand
+# left as zero, the labels it defines, and one relocation per #label
+# operand. An object whose source starts with @ORG is placed at that
+# address and its labels are absolute; one without is placed right after
+# the previous object and its labels are relative to where it lands. An
+# @ORG anywhere else in a source is rejected by assemble(). Linking fails
+# on overlapping objects, duplicated labels and undefined labels.
+#
+# Binary layout: OBJ_HEADER, the code, then per label OBJ_LABEL and the
+# name, then per relocation OBJ_RELOC and the name. Names are utf-8.
+OBJ_MAGIC = b'C8OB'
+OBJ_VERSION = 1
+# magic, version, flags, org, code length, label count, relocation count
+OBJ_HEADER = struct.Struct('>4sBBHHHI')
+# address, name length
+OBJ_LABEL = struct.Struct('>HB')
+# offset, source line, name length
+OBJ_RELOC = struct.Struct('>HIB')
+OBJ_ORG = 0x1
+
+class ObjectFile:
+    __slots__ = ('name', 'org', 'code', 'labels', 'relocations')
+
+    def __init__(self, name: str, org: int, code: bytes, labels: dict, relocations: list):
+        self.name = name
+        self.org = org
+        self.code = code
+        self.labels = labels
+        # (offset into code, source line, label)
+        self.relocations = relocations
+
+    def to_bytes(self) -> bytes:
+        res = [OBJ_HEADER.pack(
+            OBJ_MAGIC, OBJ_VERSION,
+            OBJ_ORG if self.org is not None else 0,
+            self.org or 0, len(self.code),
+            len(self.labels), len(self.relocations),
+        ), self.code]
+        for label, addr in self.labels.items():
+            b = label.encode('utf-8')
+            res.append(OBJ_LABEL.pack(addr & 0xffff, len(b)))
+            res.append(b)
+        for offset, _line, label in self.relocations:
+            b = label.encode('utf-8')
+            res.append(OBJ_RELOC.pack(offset, _line, len(b)))
+            res.append(b)
+        return b''.join(res)
+
+    @classmethod
+    def from_bytes(cls, data: bytes, name: str = '<object>'):
+        magic, version, flags, org, code_len, label_count, reloc_count = OBJ_HEADER.unpack_from(data)
+        if magic != OBJ_MAGIC:
+            raise Exception('Bad object file: wrong magic')
+        if version != OBJ_VERSION:
+            raise Exception(f'Unsupported object file version {version}')
+        i = OBJ_HEADER.size
+        code = bytes(data[i:i+code_len])
+        i += code_len
+        labels = {}
+        for _ in range(label_count):
+            addr, n = OBJ_LABEL.unpack_from(data, i)
+            i += OBJ_LABEL.size
+            labels[data[i:i+n].decode('utf-8')] = addr
+            i += n
+        relocations = []
+        for _ in range(reloc_count):
+            offset, _line, n = OBJ_RELOC.unpack_from(data, i)
+            i += OBJ_RELOC.size
+            relocations.append((offset, _line, data[i:i+n].decode('utf-8')))
+            i += n
+        return cls(name, org if flags & OBJ_ORG else None, code, labels, relocations)
+
+    def save(self, p: str):
+        with open(p, 'wb') as f:
+            f.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, p: str):
+        with open(p, 'rb') as f:
+            return cls.from_bytes(f.read(), p)
+
+def _patch(code: bytearray, offset: int, addr: int):
+    code[offset] |= (addr >> 8) & 0xf
+    code[offset+1] |= addr & 0xff
+
+def link(objects: list, base: int = ROM_BASE) -> bytes:
+    # places the objects, starting at base, and resolves every relocation
+    # against the labels of all of them. returns the ROM image from base,
+    # with gaps zero-filled, or b'' on error.
+    placed = []
+    symbols = {}
+    pos = base
+    for obj in objects:
+        at = pos if obj.org is None else obj.org
+        if at < base:
+            print(f'{obj.name}: @{at:X} is below the ROM base {base:X}')
+            return b''
+        shift = at if obj.org is None else 0
+        for label, addr in obj.labels.items():
+            if label in symbols:
+                print(f'{obj.name}: Duplicated label {label} (also in {symbols[label][1]})')
                 return b''
-            LABEL_DICT[lbl_name] = current_pos
-        elif cmd[0] == '$':
-            data_source = cmd[1:].strip()
-            if data_source:
-                current_pos += len(data_source.split(','))
+            symbols[label] = ((addr + shift) & 0xfff, obj.name)
+        placed.append((at, obj))
+        pos = max(pos, at + len(obj.code))
+
+    res = bytearray(pos - base)
+    end = base; last = None
+    for at, obj in sorted(placed, key=lambda x: x[0]):
+        if at < end:
+            print(f'{obj.name}: @{at:X} overlaps {last}')
+            return b''
+        end = at + len(obj.code); last = obj.name
+    ok = True
+    for at, obj in placed:
+        i = at - base
+        res[i:i+len(obj.code)] = obj.code
+        for offset, _line, label in obj.relocations:
+            if label not in symbols:
+                print(f'{obj.name}:(L{_line+1}) Undefined label {label}')
+                ok = False
+            else:
+                _patch(res, i + offset, symbols[label][0])
+    return bytes(res) if ok else b''
+
+
+class BuildCache:
+    # assembled objects keyed by the SHA-256 of their source, kept in
+    # memory and, given a directory, on disk as <digest>.c8o. only
+    # sources that changed since the last build are assembled again.
+    __slots__ = ('dir', 'objects', 'hits', 'misses')
+
+    def __init__(self, dir: str = None):
+        self.dir = dir
+        self.objects = {}
+        self.hits = 0
+        self.misses = 0
+        if dir is not None:
+            os.makedirs(dir, exist_ok=True)
+
+    def get(self, name: str, source: str):
+        key = hashlib.sha256(bytes([OBJ_VERSION]) + source.encode('utf-8')).hexdigest()
+        obj = self.objects.get(key)
+        p = os.path.join(self.dir, f'{key}.c8o') if self.dir is not None else None
+        if obj is None and p is not None and os.path.exists(p):
+            obj = ObjectFile.load(p)
+        if obj is not None:
+            self.hits += 1
         else:
-            current_pos += 2
-    
-    for _line, cmd in enumerate(cmd_list):
-        cmd = cmd.strip()
-        if not cmd: continue
-        elif cmd[0] in ';@#': continue
-        elif cmd[0] == '$':
-            data_source = cmd[1:].strip().split(',')
-            data_res = []
-            for d in data_source:
-                d = d.strip()
-                data_res.append(_int(d))
-            res.append(bytes(data_res))
+            self.misses += 1
+            obj = assemble(source, name)
+            if obj is None: return None
+            if p is not None: obj.save(p)
+        obj.name = name
+        self.objects[key] = obj
+        return obj
+
+def build(paths: list, cache: BuildCache = None) -> bytes:
+    # assembles (through cache, when given) and links the sources in
+    # order; .c8o files are linked as they are.
+    objects = []
+    for p in paths:
+        if p.endswith('.c8o'):
+            obj = ObjectFile.load(p)
         else:
-            z = REGEX_CMD.match(cmd)
-            if not z: print(f'(L{_line+1}) Unsupported instruction: {cmd}'); continue
-            zz = z[1].upper()
-            
-            if zz == 'CLEAR_SCREEN': res.append(b'\x00\xe0')
-            elif zz == 'RET': res.append(b'\x00\xee')
-            elif zz == 'JMP':
-                target = cmd[z.span()[1]:].strip()
-                if target.startswith('#'):
-                    target_label = target[1:].strip()
-                    if target_label not in LABEL_DICT:
-                        print(f'(L{_line+1}) Undefined label {target_label}')
-                        continue
-                    n = LABEL_DICT[target_label]&0xfff
-                else:
-                    n = _int(cmd[z.span()[1]:].strip())&0xfff
-                nnn_firstpart = (n >> 8) | 0x10
-                nnn_secondpart = n & 0xff
-                res.append(bytes([nnn_firstpart, nnn_secondpart]))
-            elif zz == 'CALL':
-                target = cmd[z.span()[1]:].strip()
-                if target.startswith('#'):
-                    target_label = target[1:].strip()
-                    if target_label not in LABEL_DICT:
-                        print(f'(L{_line+1}) Undefined label {target_label}')
-                        continue
-                    n = LABEL_DICT[target_label]&0xfff
-                else:
-                    n = _int(cmd[z.span()[1]:].strip())&0xfff
-                nnn_firstpart = (n >> 8) | 0x20
-                nnn_secondpart = n & 0xff
-                res.append(bytes([nnn_firstpart, nnn_secondpart]))
-            elif zz == 'IF_EQ':
-                arg_raw = cmd[z.span()[1]:]
-                arg_list = [i.strip() for i in arg_raw.strip().split(',')]
-                if len(arg_list) != 2:
-                    print(f'(L{_line+1}) Unsupported instruction: {cmd}')
-                    continue
-                m = REGEX_V.match(arg_list[0])
-                if not m: print(f'(L{_line+1}) Unsupported instruction: {cmd}'); continue
-                l = m[1]
-                m = REGEX_V.match(arg_list[1])
-                r = m[1] if m else _int(arg_list[1])
-                res.append(bytes([
-                    int(l,16)|(0x90 if type(r) is str else 0x40),
-                    _int(r)<<4 if type(r) is str else r
-                ]))
-            elif zz == 'IF_NEQ':
-                arg_raw = cmd[z.span()[1]:]
-                arg_list = [i.strip() for i in arg_raw.strip().split(',')]
-                if len(arg_list) != 2:
-                    print(f'(L{_line+1}) Unsupported instruction: {cmd}')
-                    continue
-                m = REGEX_V.match(arg_list[0])
-                if not m: print(f'(L{_line+1}) Unsupported instruction: {cmd}'); continue
-                l = m[1]
-                m = REGEX_V.match(arg_list[1])
-                r = m[1] if m else _int(arg_list[1])
-                res.append(bytes([
-                    int(l,16)|(0x50 if type(r) is str else 0x30),
-                    _int(r)<<4 if type(r) is str else r
-                ]))
-            elif zz == 'LD':
-                arg_raw = cmd[z.span()[1]:]
-                arg_list = [i.strip() for i in arg_raw.strip().split(',')]
-                if len(arg_list) != 2:
-                    print(f'(L{_line+1}) Unsupported instruction: {cmd}')
-                    continue
-                m = REGEX_V.match(arg_list[0])
-                if not m: print(f'(L{_line+1}) Unsupported instruction: {cmd}'); continue
-                l = m[1]
-                m = REGEX_V.match(arg_list[1])
-                r = m[1] if m else _int(arg_list[1])
-                res.append(bytes([
-                    int(l,16)|(0x80 if type(r) is str else 0x60),
-                    _int(r)<<4 if type(r) is str else r
-                ]))
-            elif zz == 'ADD':
-                arg_raw = cmd[z.span()[1]:]
-                arg_list = [i.strip() for i in arg_raw.strip().split(',')]
-                if len(arg_list) != 2: print(f'(L{_line+1}) Unsupported instruction: {cmd}'); continue
-                if arg_list[0].upper() == 'I':
-                    m = REGEX_V.match(arg_list[1])
-                    if not m: print(f'(L{_line+1}) Unsupported instruction: {cmd}'); continue
-                    res.append(bytes([int(m[1],16)|0xf0, 0x1e]))
-                else:
-                    m = REGEX_V.match(arg_list[0])
-                    if not m: print(f'(L{_line+1}) Unsupported instruction: {cmd}'); continue
-                    res.append(bytes([int(m[1], 16)|0x70, _int(arg_list[1])]))
-            elif zz in ['OR', 'AND', 'XOR', 'ADDC', 'SUBC', 'SHR', 'SUB2', 'SHL']:
-                arg_raw = cmd[z.span()[1]:]
-                arg_list = [i.strip() for i in arg_raw.strip().split(',')]
-                if len(arg_list) != 2: print(f'(L{_line+1}) Unsupported instruction: {cmd}'); continue
-                m = REGEX_V.match(arg_list[0])
-                if not m: print(f'(L{_line+1}) Unsupported instruction: {cmd}'); continue
-                l = int(m[1],16)&0x80
-                m = REGEX_V.match(arg_list[1])
-                if not m: print(f'(L{_line+1}) Unsupported instruction: {cmd}'); continue
-                r = (_int(m[1])<<4)|{
-                    'OR': 0x01,
-                    'AND': 0x02,
-                    'XOR': 0x03,
-                    'ADDC': 0x04,
-                    'SUBC': 0x05,
-                    'SHR': 0x06,
-                    'SUB2': 0x07,
-                    'SHL': 0x0e
-                }[zz]
-                res.append(bytes([l, r]))
-            elif zz == 'LDI':
-                target = cmd[z.span()[1]:].strip()
-                if target.startswith('#'):
-                    target_label = target[1:].strip()
-                    if target_label not in LABEL_DICT:
-                        print(f'(L{_line+1}) Undefined label {target_label}')
-                        continue
-                    n = LABEL_DICT[target_label]&0xfff
-                else:
-                    n = _int(cmd[z.span()[1]:].strip())&0xfff
-                nnn_firstpart = (n >> 8) | 0xa0
-                nnn_secondpart = n & 0xff
-                res.append(bytes([nnn_firstpart, nnn_secondpart]))
-            elif zz == 'JMPV0':
-                target = cmd[z.span()[1]:].strip()
-                if target.startswith('#'):
-                    target_label = target[1:].strip()
-                    if target_label not in LABEL_DICT:
-                        print(f'(L{_line+1}) Undefined label {target_label}')
-                        continue
-                    n = LABEL_DICT[target_label]&0xfff
-                else:
-                    n = _int(cmd[z.span()[1]:].strip())&0xfff
-                nnn_firstpart = (n >> 8) | 0xb0
-                nnn_secondpart = n & 0xff
-                res.append(bytes([nnn_firstpart, nnn_secondpart]))
-            elif zz == 'RANDOM':
-                arg_raw = cmd[z.span()[1]:]
-                arg_list = arg_raw.strip().split(',')
-                if len(arg_list) != 2:
-                    print(f'(L{_line+1}) Unsupported instruction: {cmd}')
-                    continue
-                m = REGEX_V.match(arg_list[0])
-                if not m: print(f'(L{_line+1}) Unsupported instruction: {cmd}'); continue
-                vn = int(m[1], 16)|0xc0
-                res.append(bytes([vn, _int(arg_list[1])]))
-            elif zz == 'DRAW':
-                arg_raw = cmd[z.span()[1]:]
-                arg_list = arg_raw.strip().split(',')
-                if len(arg_list) != 3:
-                    print(f'(L{_line+1}) Unsupported instruction: {cmd}')
-                    continue
-                m = REGEX_V.findall(arg_raw)
-                if not m: print(f'(L{_line+1}) Unsupported instruction: {cmd}'); continue
-                vn = int(m[0], 16)|0xd0
-                vn2 = int(m[1], 16) << 4
-                n = _int(arg_list[2])
-                res.append(bytes([vn, vn2|n]))
-            elif zz == 'IF_NOTKEY':
-                m = REGEX_V.findall(cmd[z.span()[1]:])
-                if not m: print(f'(L{_line+1}) Unsupported instruction: {cmd}'); continue
-                vn = int(m[0], 16)|0xe0
-                res.append(bytes([vn,0x9e]))
-            elif zz == 'IF_KEY':
-                m = REGEX_V.findall(cmd[z.span()[1]:])
-                if not m: print(f'(L{_line+1}) Unsupported instruction: {cmd}'); continue
-                vn = int(m[0], 16)|0xe0
-                res.append(bytes([vn,0xa1]))
-            elif zz == 'GET_DELAY':
-                m = REGEX_V.findall(cmd[z.span()[1]:])
-                if not m: print(f'(L{_line+1}) Unsupported instruction: {cmd}'); continue
-                vn = int(m[0], 16)|0xf0
-                res.append(bytes([vn,0x07]))
-            elif zz == 'WAITKEY':
-                m = REGEX_V.findall(cmd[z.span()[1]:])
-                if not m: print(f'(L{_line+1}) Unsupported instruction: {cmd}'); continue
-                vn = int(m[0], 16)|0xf0
-                res.append(bytes([vn,0x0a]))
-            elif zz == 'SET_DELAY':
-                m = REGEX_V.findall(cmd[z.span()[1]:])
-                if not m: print(f'(L{_line+1}) Unsupported instruction: {cmd}'); continue
-                vn = int(m[0], 16)|0xf0
-                res.append(bytes([vn,0x15]))
-            elif zz == 'SET_SOUND':
-                m = REGEX_V.findall(cmd[z.span()[1]:])
-                if not m: print(f'(L{_line+1}) Unsupported instruction: {cmd}'); continue
-                vn = int(m[0], 16)|0xf0
-                res.append(bytes([vn,0x18]))
-            elif zz == 'CHAR':
-                m = REGEX_V.findall(cmd[z.span()[1]:])
-                if not m: print(f'(L{_line+1}) Unsupported instruction: {cmd}'); continue
-                vn = int(m[0], 16)|0xf0
-                res.append(bytes([vn,0x29]))
-            elif zz == 'BCD':
-                m = REGEX_V.findall(cmd[z.span()[1]:])
-                if not m: print(f'(L{_line+1}) Unsupported instruction: {cmd}'); continue
-                vn = int(m[0], 16)|0xf0
-                res.append(bytes([vn,0x33]))
-            elif zz == 'STR':
-                n = cmd[z.span()[1]:].strip()
-                vn = _int(n)|0xf0
-                res.append(bytes([vn,0x55]))
-            elif zz == 'LDR':
-                n = cmd[z.span()[1]:].strip()
-                vn = _int(n)|0xf0
-                res.append(bytes([vn,0x65]))
-                
-
-
-    return b''.join(res)
+            with open(p, 'r') as f:
+                source = f.read()
+            obj = cache.get(p, source) if cache is not None else assemble(source, p)
+        if obj is None: return b''
+        objects.append(obj)
+    return link(objects)
+
+def watch(paths: list, out: str, push_port: int = None, keep_registers: bool = False, interval: float = WATCH_INTERVAL):
+    # rebuilds out whenever a source changes, until interrupted. objects
+    # of unchanged sources stay in memory, and in a changed one every
+    # line that was seen before reuses its cached token. with push_port
+    # each new image is sent to an emulator started with --listen.
+    cache = BuildCache()
+    seen = None
+    try:
+        while True:
+            mtimes = []
+            for p in paths:
+                try: mtimes.append(os.stat(p).st_mtime_ns)
+                except OSError: mtimes.append(None)
+            if mtimes != seen:
+                seen = mtimes
+                t = time.perf_counter()
+                res = build(paths, cache) if None not in mtimes else b''
+                dt = (time.perf_counter() - t) * 1000
+                if res:
+                    with open(out, 'wb') as f:
+                        f.write(res)
+                    msg = f'{time.strftime("%H:%M:%S")} {out}: {len(res)} bytes in {dt:.1f}ms'
+                    if push_port is not None:
+                        pushed = hotreload.push(res, keep_registers, push_port)
+                        msg += ', pushed' if pushed else ', no emulator listening'
+                    print(msg)
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='CHIP-8 ROM Assembler.')
     parser.add_argument('file',
         type=str,
+        nargs='+',
+        help='Sources, or .c8o objects when linking.',
+    )
+    parser.add_argument('-c',
+        dest='object',
+        default=False,
+        action='store_true',
+        help='Only assemble; write each source as <file>.c8o.',
+    )
+    parser.add_argument('-o', '--output',
+        type=str,
+        default=None,
+        help='Link the inputs into this ROM (default for several inputs: <first file>.ch8).',
+    )
+    parser.add_argument('--cache',
+        type=str,
+        default=None,
+        help='Keep assembled objects in this directory and reuse them while a source is unchanged.',
+    )
+    parser.add_argument('--watch',
+        default=False,
+        action='store_true',
+        help='Rebuild whenever a source changes, until interrupted.',
+    )
+    parser.add_argument('--push',
+        type=int,
+        nargs='?',
+        const=hotreload.RELOAD_PORT,
+        default=None,
+        help=f'With --watch, send every rebuild to an emulator started with --listen on this port (default: {hotreload.RELOAD_PORT}).',
+    )
+    parser.add_argument('--keep-registers',
+        default=False,
+        action='store_true',
+        help='With --push, keep the emulator running from its current state instead of restarting it.',
     )
     cmd = parser.parse_args(sys.argv[1:])
-    p = cmd.file
-    with open(p, 'r') as f:
-        source = f.read()
-    
-    res = compile_source(source)
+    if cmd.watch:
+        watch(cmd.file, cmd.output or f'{cmd.file[0]}.ch8', cmd.push, cmd.keep_registers)
+        sys.exit(0)
+    if cmd.object:
+        failed = 0
+        for p in cmd.file:
+            with open(p, 'r') as f:
+                obj = assemble(f.read(), p)
+            if obj is not None:
+                obj.save(f'{p}.c8o')
+            else:
+                failed += 1
+        sys.exit(1 if failed else 0)
+
+    if len(cmd.file) == 1 and cmd.output is None:
+        p = cmd.file[0]
+        with open(p, 'r') as f:
+            source = f.read()
+        res = compile_source(source, p)
+        out = f'{p}.ch8'
+    else:
+        t = time.perf_counter()
+        cache = BuildCache(cmd.cache)
+        res = build(cmd.file, cache)
+        out = cmd.output or f'{cmd.file[0]}.ch8'
+        print(f'{cache.misses} assembled, {cache.hits} cached, linked in {(time.perf_counter() - t) * 1000:.1f}ms')
+
+    if not res:
+        print(f'{out} not written.')
+        sys.exit(1)
 
     data_len = len(res)
     if 0x200+data_len > 0xfff:
-        res.append(f'# WARNING: data is {data_len} bytes, more than allowed {4096-0x200} bytes.')
+        print(f'# WARNING: data is {data_len} bytes, more than allowed {4096-0x200} bytes.')
 
-    with open(f'{p}.ch8', 'wb') as f:
+    with open(out, 'wb') as f:
         f.write(res)
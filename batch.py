@@ -0,0 +1,438 @@
+# Lockstep batch emulator: N independent CHIP-8 machines stepped together
+# with NumPy, for fuzzing and search workloads.
+#
+# State is stacked into arrays, one row per instance:
+#     MEM (N,4096) uint8, V (N,16) uint8, STK (N,16) uint16,
+#     PC/I (N,) uint16, SP (N,) uint8, DELAY/SOUND (N,) uint8,
+#     SCREEN (N,32) uint64 -- row y of instance k is SCREEN[k, y], bit 63
+#     is x=0, i.e. the same bitplane as Chip8.SCREEN read big-endian.
+#
+# step() fetches the current opcode of every instance, looks up its class
+# in CLASS_TABLE (the batch counterpart of OPCODE_TABLE) and runs one
+# vectorized handler per class that occurs, over the instances in that
+# class. Semantics are those of Chip8: SCHIP_COMPATIBLE_FLAG quirks,
+# DXYN clipping/wrapping and collision, the xorshift32 CXNN generator
+# (instance k seeded with seed + k, so machine(k) replays it exactly) and
+# FX0A blocking until key_down(). Where Chip8 raises (unsupported 0NNN,
+# stack over/underflow) the instance is marked HALTED instead and stays
+# at the faulting instruction; waiting and halted instances sit out
+# steps while the rest carry on.
+#
+# Every step costs a fixed amount of NumPy calls, so throughput grows with
+# N; the instances do not need to run the same code, but the fewer opcode
+# classes a step touches the cheaper it is.
+
+import random
+import numpy as np
+import chip8
+
+U8 = np.uint8
+U16 = np.uint16
+U64 = np.uint64
+
+# opcode class -> handler; classes without an entry are no-ops, exactly
+# as in chip8._decode. IDLE is the class of waiting and halted instances.
+IDLE = 0
+CLASSES = ['idle', 'nop']
+HANDLERS = [None, None]
+
+
+def handler(*classes):
+    def wrap(f):
+        for c in classes:
+            CLASSES.append(c)
+            HANDLERS.append(f)
+        return f
+    return wrap
+
+
+class BatchChip8:
+    __slots__ = (
+        'N', 'ROWS', 'MEM', 'V', 'I', 'STK', 'SP', 'DELAY', 'SOUND', 'SCREEN', 'PC',
+        'KEY_BUFFER', 'WAITKEY', 'WAITKEY_TARGET', 'HALTED',
+        'SCHIP_COMPATIBLE_FLAG', 'CYCLES_PER_FRAME',
+        'CYCLES', 'FRAMES', 'DIRTY', 'SEEDS', 'RNG',
+    )
+
+    def __init__(self, n: int, schip_compatible: bool = False, cycles_per_frame: int = chip8.CYCLES_PER_FRAME, seed: int = None):
+        self.N = n
+        self.ROWS = np.arange(n)
+        self.SCHIP_COMPATIBLE_FLAG = schip_compatible
+        self.CYCLES_PER_FRAME = cycles_per_frame
+        if seed is None:
+            seed = random.getrandbits(32)
+        self.SEEDS = [(seed + k) & 0xffffffff for k in range(n)]
+        self.MEM = np.zeros((n, 4096), U8)
+        self.reset()
+
+    def reset(self):
+        # clears everything but the loaded programs.
+        n = self.N
+        self.V = np.zeros((n, 16), U8)
+        self.I = np.zeros(n, U16)
+        self.STK = np.zeros((n, 16), U16)
+        self.SP = np.zeros(n, U8)
+        self.DELAY = np.zeros(n, U8)
+        self.SOUND = np.zeros(n, U8)
+        self.SCREEN = np.zeros((n, chip8.SCREEN_HEIGHT), U64)
+        self.PC = np.full(n, chip8.ROM_BASE, U16)
+        self.KEY_BUFFER = np.zeros((n, 16), U8)
+        self.WAITKEY = np.zeros(n, bool)
+        self.WAITKEY_TARGET = np.zeros(n, U8)
+        self.HALTED = np.zeros(n, bool)
+        self.CYCLES = np.zeros(n, U64)
+        self.FRAMES = 0
+        self.DIRTY = np.ones(n, bool)
+        self.RNG = np.array([chip8.rng_state(s) for s in self.SEEDS], np.uint32)
+        self.MEM[:, chip8.FONT_BASE:chip8.FONT_BASE+len(chip8.FONT)] = chip8.FONT
+
+    def select(self, which):
+        # None -> every instance; a bool mask or indices otherwise.
+        if which is None:
+            return self.ROWS
+        which = np.asarray(which)
+        return np.flatnonzero(which) if which.dtype == bool else which
+
+    def load(self, data: bytes, which=None) -> int:
+        # loads the same program into the selected instances.
+        data = data[:chip8.ROM_MAX]
+        self.MEM[self.select(which), chip8.ROM_BASE:chip8.ROM_BASE+len(data)] = np.frombuffer(data, U8)
+        return len(data)
+
+    def key_down(self, k: int, which=None):
+        idx = self.select(which)
+        self.KEY_BUFFER[idx, k] = 1
+        idx = idx[self.WAITKEY[idx]]
+        self.V[idx, self.WAITKEY_TARGET[idx]] = k
+        self.WAITKEY[idx] = False
+
+    def key_up(self, k: int, which=None):
+        self.KEY_BUFFER[self.select(which), k] = 0
+
+    def tick(self):
+        # 60Hz timer tick.
+        self.DELAY -= self.DELAY > 0
+        self.SOUND -= self.SOUND > 0
+
+    def step(self) -> int:
+        # runs one instruction on every instance that is neither waiting
+        # for a key nor halted; returns how many did.
+        ROWS = self.ROWS; MEM = self.MEM; PC = self.PC
+        instr = (MEM[ROWS, PC].astype(U16) << 8) | MEM[ROWS, (PC+1)&0xfff]
+        cls = CLASS_TABLE[instr]
+        active = ~(self.WAITKEY | self.HALTED)
+        if not active.all():
+            cls[~active] = IDLE
+        pc = (PC+2)&0xfff
+        counts = np.bincount(cls, minlength=len(HANDLERS))
+        for k in np.flatnonzero(counts):
+            h = HANDLERS[k]
+            if h is None:
+                continue
+            idx = ROWS if counts[k] == self.N else np.flatnonzero(cls == k)
+            pc[idx] = h(self, idx, instr[idx], pc[idx])
+        n = int(self.N - counts[IDLE])
+        if n == self.N:
+            self.PC = pc
+            self.CYCLES += 1
+        else:
+            self.PC = np.where(active, pc, PC)
+            self.CYCLES += active
+        return n
+
+    def run(self, cycles: int) -> int:
+        # returns the number of instructions executed over all instances;
+        # stops early once every instance waits or has halted.
+        total = 0
+        for _ in range(cycles):
+            n = self.step()
+            if not n:
+                break
+            total += n
+        return total
+
+    def run_until_frame(self) -> int:
+        n = self.run(self.CYCLES_PER_FRAME)
+        self.tick()
+        self.FRAMES += 1
+        return n
+
+    def screen(self, k: int) -> bytes:
+        # instance k's framebuffer in Chip8.SCREEN layout.
+        return self.SCREEN[k].astype('>u8').tobytes()
+
+    def machine(self, k: int) -> chip8.Chip8:
+        # a scalar copy of instance k, e.g. to replay a fuzzing find in
+        # an emulator.
+        m = chip8.Chip8(self.SCHIP_COMPATIBLE_FLAG, self.CYCLES_PER_FRAME, seed=self.SEEDS[k])
+        m.MEM[:] = self.MEM[k].tobytes()
+        m.V[:] = self.V[k].tobytes()
+        m.I = int(self.I[k]); m.PC = int(self.PC[k]); m.SP = int(self.SP[k])
+        m.STK = [int(a) for a in self.STK[k]]
+        m.DELAY = int(self.DELAY[k]); m.SOUND = int(self.SOUND[k])
+        m.SCREEN[:] = self.screen(k)
+        m.KEY_BUFFER[:] = self.KEY_BUFFER[k].tobytes()
+        m.WAITKEY = bool(self.WAITKEY[k])
+        m.WAITKEY_TARGET = int(self.WAITKEY_TARGET[k]) if m.WAITKEY else None
+        m.CYCLES = int(self.CYCLES[k]); m.FRAMES = self.FRAMES
+        m.RNG = int(self.RNG[k])
+        return m
+
+
+# handlers: h(b, idx, instr, pc) runs one opcode class on the instances
+# idx, whose opcodes are instr and whose next PC is pc, and returns their
+# new PCs.
+
+def _halt(b, idx, pc):
+    b.HALTED[idx] = True
+    return (pc-2)&0xfff
+
+
+@handler('0NNN')
+def _op_0nnn(b, idx, instr, pc):
+    return _halt(b, idx, pc)
+
+
+@handler('00E0')
+def _op_00e0(b, idx, instr, pc):
+    b.SCREEN[idx] = 0
+    b.DIRTY[idx] = True
+    return pc
+
+
+@handler('00EE')
+def _op_00ee(b, idx, instr, pc):
+    SP = b.SP[idx]
+    ok = SP > 0
+    if not ok.all():
+        pc[~ok] = _halt(b, idx[~ok], pc[~ok])
+        idx = idx[ok]; SP = SP[ok]
+    SP = SP - 1
+    b.SP[idx] = SP
+    pc[ok] = b.STK[idx, SP]
+    return pc
+
+
+@handler('1NNN')
+def _op_1nnn(b, idx, instr, pc):
+    return instr & 0xfff
+
+
+@handler('2NNN')
+def _op_2nnn(b, idx, instr, pc):
+    SP = b.SP[idx]
+    ok = SP < 16
+    res = instr & 0xfff
+    if not ok.all():
+        res[~ok] = _halt(b, idx[~ok], pc[~ok])
+        idx = idx[ok]; SP = SP[ok]; pc = pc[ok]
+    b.STK[idx, SP] = pc
+    b.SP[idx] = SP + 1
+    return res
+
+
+def _skip(pc, cond):
+    return np.where(cond, (pc+2)&0xfff, pc)
+
+
+@handler('3XNN')
+def _op_3xnn(b, idx, instr, pc):
+    return _skip(pc, b.V[idx, (instr>>8)&0xf] == (instr&0xff))
+
+
+@handler('4XNN')
+def _op_4xnn(b, idx, instr, pc):
+    return _skip(pc, b.V[idx, (instr>>8)&0xf] != (instr&0xff))
+
+
+@handler('5XY0')
+def _op_5xy0(b, idx, instr, pc):
+    V = b.V
+    return _skip(pc, V[idx, (instr>>8)&0xf] == V[idx, (instr>>4)&0xf])
+
+
+@handler('9XY0')
+def _op_9xy0(b, idx, instr, pc):
+    V = b.V
+    return _skip(pc, V[idx, (instr>>8)&0xf] != V[idx, (instr>>4)&0xf])
+
+
+@handler('6XNN')
+def _op_6xnn(b, idx, instr, pc):
+    b.V[idx, (instr>>8)&0xf] = instr & 0xff
+    return pc
+
+
+@handler('7XNN')
+def _op_7xnn(b, idx, instr, pc):
+    V = b.V; X = (instr>>8)&0xf
+    V[idx, X] = (V[idx, X] + (instr&0xff)) & 0xff
+    return pc
+
+
+@handler('8XY0', '8XY1', '8XY2', '8XY3')
+def _op_8xy_logic(b, idx, instr, pc):
+    V = b.V; X = (instr>>8)&0xf; Y = (instr>>4)&0xf
+    vy = V[idx, Y]
+    op = instr[0] & 0xf
+    if op == 1: vy = V[idx, X] | vy
+    elif op == 2: vy = V[idx, X] & vy
+    elif op == 3: vy = V[idx, X] ^ vy
+    V[idx, X] = vy
+    return pc
+
+
+@handler('8XY4')
+def _op_8xy4(b, idx, instr, pc):
+    V = b.V; X = (instr>>8)&0xf; Y = (instr>>4)&0xf
+    r = V[idx, X].astype(U16) + V[idx, Y]
+    V[idx, X] = r & 0xff; V[idx, 0xf] = r >> 8
+    return pc
+
+
+@handler('8XY5', '8XY7')
+def _op_8xy_sub(b, idx, instr, pc):
+    V = b.V; X = (instr>>8)&0xf; Y = (instr>>4)&0xf
+    vx = V[idx, X].astype(np.int16); vy = V[idx, Y].astype(np.int16)
+    r = vx - vy if instr[0] & 0xf == 5 else vy - vx
+    V[idx, X] = r & 0xff; V[idx, 0xf] = r >= 0
+    return pc
+
+
+@handler('8XY6')
+def _op_8xy6(b, idx, instr, pc):
+    V = b.V; X = (instr>>8)&0xf
+    s = V[idx, X] if b.SCHIP_COMPATIBLE_FLAG else V[idx, (instr>>4)&0xf]
+    V[idx, X] = s >> 1; V[idx, 0xf] = s & 0x1
+    return pc
+
+
+@handler('8XYE')
+def _op_8xye(b, idx, instr, pc):
+    V = b.V; X = (instr>>8)&0xf
+    s = V[idx, X] if b.SCHIP_COMPATIBLE_FLAG else V[idx, (instr>>4)&0xf]
+    V[idx, X] = s << 1; V[idx, 0xf] = s >> 7
+    return pc
+
+
+@handler('ANNN')
+def _op_annn(b, idx, instr, pc):
+    b.I[idx] = instr & 0xfff
+    return pc
+
+
+@handler('BNNN')
+def _op_bnnn(b, idx, instr, pc):
+    return ((instr&0xfff) + b.V[idx, 0]) & 0xfff
+
+
+@handler('CXNN')
+def _op_cxnn(b, idx, instr, pc):
+    x = b.RNG[idx]
+    x ^= x << 13
+    x ^= x >> 17
+    x ^= x << 5
+    b.RNG[idx] = x
+    b.V[idx, (instr>>8)&0xf] = (x >> 24) & (instr&0xff)
+    return pc
+
+
+@handler('DXYN')
+def _op_dxyn(b, idx, instr, pc):
+    # one pass per sprite row over all drawing instances; instances with a
+    # shorter sprite get an empty row, which changes nothing.
+    V = b.V; MEM = b.MEM; SCREEN = b.SCREEN
+    X = (V[idx, (instr>>8)&0xf] % 0x40).astype(U64)
+    Y = V[idx, (instr>>4)&0xf] % 0x20
+    N = instr & 0xf
+    I = b.I[idx]
+    turned_off = np.zeros(len(idx), bool)
+    for i in range(int(N.max())):
+        s = (MEM[idx, (I+i)&0xfff].astype(U64) << 56) >> X
+        s[N <= i] = 0
+        y = (Y+i) & 0x1f
+        row = SCREEN[idx, y]
+        turned_off |= (row & s) != 0
+        SCREEN[idx, y] = row ^ s
+    V[idx, 0xf] = turned_off
+    b.DIRTY[idx] = True
+    return pc
+
+
+@handler('EX9E', 'EXA1')
+def _op_exkey(b, idx, instr, pc):
+    down = b.KEY_BUFFER[idx, b.V[idx, (instr>>8)&0xf] & 0xf] != 0
+    return _skip(pc, down if instr[0] & 0xff == 0x9e else ~down)
+
+
+@handler('FX07')
+def _op_fx07(b, idx, instr, pc):
+    b.V[idx, (instr>>8)&0xf] = b.DELAY[idx]
+    return pc
+
+
+@handler('FX0A')
+def _op_fx0a(b, idx, instr, pc):
+    b.WAITKEY[idx] = True
+    b.WAITKEY_TARGET[idx] = (instr>>8)&0xf
+    return pc
+
+
+@handler('FX15')
+def _op_fx15(b, idx, instr, pc):
+    b.DELAY[idx] = b.V[idx, (instr>>8)&0xf]
+    return pc
+
+
+@handler('FX18')
+def _op_fx18(b, idx, instr, pc):
+    b.SOUND[idx] = b.V[idx, (instr>>8)&0xf]
+    return pc
+
+
+@handler('FX1E')
+def _op_fx1e(b, idx, instr, pc):
+    b.I[idx] = (b.I[idx] + b.V[idx, (instr>>8)&0xf]) & 0xfff
+    return pc
+
+
+@handler('FX29')
+def _op_fx29(b, idx, instr, pc):
+    b.I[idx] = chip8.FONT_BASE + (b.V[idx, (instr>>8)&0xf] % 0x10).astype(U16) * 5
+    return pc
+
+
+@handler('FX33')
+def _op_fx33(b, idx, instr, pc):
+    x = b.V[idx, (instr>>8)&0xf]; I = b.I[idx]
+    MEM = b.MEM
+    MEM[idx, I] = x // 100
+    MEM[idx, (I+1)&0xfff] = (x % 100) // 10
+    MEM[idx, (I+2)&0xfff] = x % 10
+    return pc
+
+
+@handler('FX55', 'FX65')
+def _op_fx55_65(b, idx, instr, pc):
+    # one pass per register over the instances that store/load it.
+    X = (instr>>8)&0xf; I = b.I[idx]
+    MEM = b.MEM; V = b.V
+    store = instr[0] & 0xff == 0x55
+    for z in range(int(X.max()) + 1):
+        sel = X >= z
+        k = idx[sel]; a = (I[sel]+z)&0xfff
+        if store:
+            MEM[k, a] = V[k, z]
+        else:
+            V[k, z] = MEM[k, a]
+    if not b.SCHIP_COMPATIBLE_FLAG:
+        b.I[idx] = (I + X + 1) & 0xfff
+    return pc
+
+
+CLASS_INDEX = {c: k for k, c in enumerate(CLASSES)}
+# opcode -> index into HANDLERS, built like chip8.OPCODE_TABLE.
+CLASS_TABLE = np.array(
+    [CLASS_INDEX.get(chip8.opcode_class(instr), 1) for instr in range(0x10000)],
+    U8,
+)
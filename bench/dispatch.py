@@ -0,0 +1,97 @@
+# Decode/dispatch benchmark.
+#
+# Compares the precomputed opcode table in chip8.py against the
+# interpreters the emulators used before: main_sdl2's step() (nested if
+# cascade on the first nibble) and main_tkinter's loop (cascade on the
+# opcode as a hex string), both in original.py. Speedups are relative
+# to the faster of the two, main_sdl2's step().
+#
+#     python bench/dispatch.py [--cycles N]
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import chip8
+import original
+
+# ALU/skip/memory mix without DXYN, so only decode and dispatch differ.
+PROGRAM = bytes([
+    0x60, 0x00,  # 200 LD V0,0
+    0x61, 0x01,  # 202 LD V1,1
+    0xa3, 0x00,  # 204 LDI 0x300
+    0x70, 0x01,  # 206 ADD V0,1
+    0x80, 0x14,  # 208 ADDC V0,V1
+    0x82, 0x03,  # 20A XOR V2,V0
+    0x83, 0x26,  # 20C SHR V3,V2
+    0x34, 0x05,  # 20E IF_NEQ V4,5
+    0x74, 0x01,  # 210 ADD V4,1
+    0x95, 0x40,  # 212 IF_EQ V5,V4
+    0x85, 0x40,  # 214 LD V5,V4
+    0xf2, 0x33,  # 216 BCD V2
+    0xf2, 0x65,  # 218 LDR 2
+    0xa3, 0x00,  # 21A LDI 0x300
+    0xf0, 0x29,  # 21C CHAR V0
+    0x12, 0x06,  # 21E JMP 0x206
+])
+
+
+def machine():
+    m = chip8.Chip8()
+    m.load(PROGRAM)
+    return m
+
+
+def bench_original(step, cycles: int) -> float:
+    original.load(PROGRAM)
+    t = time.perf_counter()
+    for _ in range(cycles):
+        step()
+    return cycles / (time.perf_counter() - t)
+
+
+def bench_table_step(cycles: int) -> float:
+    m = machine()
+    step = m.step
+    t = time.perf_counter()
+    for _ in range(cycles):
+        step()
+    return cycles / (time.perf_counter() - t)
+
+
+def bench_table_run(cycles: int) -> float:
+    m = machine()
+    t = time.perf_counter()
+    m.run(cycles)
+    return cycles / (time.perf_counter() - t)
+
+
+def bench_translated_run(cycles: int) -> float:
+    m = machine()
+    m.TRANSLATE = True
+    t = time.perf_counter()
+    m.run(cycles)
+    return cycles / (time.perf_counter() - t)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='CHIP-8 decode/dispatch benchmark.')
+    parser.add_argument('--cycles',
+        type=int,
+        default=1000000,
+    )
+    cmd = parser.parse_args(sys.argv[1:])
+    sdl2_ips = bench_original(original.step, cmd.cycles)
+    tk_ips = bench_original(original.tk_step, cmd.cycles)
+    base = sdl2_ips
+    print(f'{"original sdl2":16} {sdl2_ips:12,.0f} ips  x{sdl2_ips/base:.2f}')
+    print(f'{"original tkinter":16} {tk_ips:12,.0f} ips  x{tk_ips/base:.2f}')
+    for name, f in (
+        ('table step()', bench_table_step),
+        ('table run()', bench_table_run),
+        ('translated run()', bench_translated_run),
+    ):
+        ips = f(cmd.cycles)
+        print(f'{name:16} {ips:12,.0f} ips  x{ips/base:.2f}')
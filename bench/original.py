@@ -0,0 +1,355 @@
+# The interpreters the two emulators shipped before the headless core,
+# kept as the baseline for dispatch.py.
+#
+# step() is main_sdl2.step() and tk_step() the body of main_tkinter.exec()'s
+# loop, copied from the original sources. Only what cannot run headless
+# was taken out: SDL/Tk drawing calls and root.update() are dropped, and
+# tkinter's timer-thread queue round-trips for FX07/FX15/FX18 read and
+# write DELAY/SOUND directly, as the comments next to them already said.
+# Decoding, operand extraction and the (buggy) flag semantics are
+# unchanged, and the state lives in module globals as it did then.
+
+import math
+import random
+
+V = [0 for _ in range(16)]
+MEM = [0 for _ in range(4096)]
+I = 0
+STK = [0 for _ in range(16)]
+SP = 0
+DELAY = 0
+SOUND = 0
+SCREEN = [0 for _ in range(64 * 32)]
+PC = 0x200
+KEY_BUFFER = {}
+WAITKEY = False
+WAITKEY_TARGET = None
+
+SCHIP_COMPATIBLE_FLAG = False
+
+FONT_BASE = 0x0
+
+
+def load(program: bytes):
+    # not part of the originals: resets the globals for a benchmark run.
+    global I, SP, DELAY, SOUND, PC, WAITKEY, WAITKEY_TARGET
+    V[:] = [0] * 16
+    MEM[:] = [0] * 4096
+    STK[:] = [0] * 16
+    SCREEN[:] = [0] * (64 * 32)
+    I = SP = DELAY = SOUND = 0
+    PC = 0x200
+    WAITKEY = False
+    WAITKEY_TARGET = None
+    for i, x in enumerate(program):
+        MEM[0x200+i] = x
+
+
+def step():
+    global I, SP, DELAY, SOUND, PC, WAITKEY, WAITKEY_TARGET, RUNNING
+    if WAITKEY:
+        return
+    # instr are 2-bytes long, big endian.
+    instr_1 = MEM[PC]; instr_2 = MEM[PC+1]
+    instr = (instr_1<<8)|instr_2
+
+    first_digit = (instr_1&0xf0)>>4
+    
+    if first_digit == 0:
+        if instr == 0x00e0:
+            for i in range(64 * 32): SCREEN[i] = False
+            PC += 2
+        elif instr == 0x00ee:
+            SP -= 1
+            if SP < 0: raise Error('stack underflow')
+            PC = STK[SP]
+        else:
+            print(f'Unsupported instruction {instr:04X}')
+            raise Exception()
+            PC += 2
+    elif first_digit == 1:
+        NNN = instr&0x0fff
+        PC = NNN
+    elif first_digit == 2:
+        NNN = instr&0x0fff
+        STK[SP] = PC+2
+        SP += 1
+        PC = NNN
+    elif first_digit == 3:
+        X = (instr&0x0f00)>>8; NN = instr&0x00ff
+        if V[X] == NN: PC += 2
+        PC += 2
+    elif first_digit == 4:
+        X = (instr&0x0f00)>>8; NN = instr&0x00ff
+        if V[X] != NN: PC += 2
+        PC += 2
+    elif first_digit == 5:
+        X = (instr&0x0f00)>>8; Y = (instr&0x00f0)>>4
+        if V[X] == V[Y]: PC += 2
+        PC += 2
+    elif first_digit == 6:
+        X = (instr&0x0f00)>>8; NN = instr&0x00ff
+        V[X] = NN; V[X] %= 256
+        PC += 2
+    elif first_digit == 7:
+        X = (instr&0x0f00)>>8; NN = instr&0x00ff
+        V[X] += NN; V[X] %= 256
+        PC += 2
+    elif first_digit == 8:
+        X = (instr&0x0f00)>>8; Y = (instr&0x00f0)>>4
+        S3 = (instr&0x000f)
+        if S3 == 0:
+            V[X] = V[Y]
+        elif S3 == 1:
+            V[X] |= V[Y]
+        elif S3 == 2:
+            V[X] &= V[Y]
+        elif S3 == 3:
+            V[X] ^= V[Y]
+        elif S3 == 4:
+            V[X] += V[Y]
+            if V[X] >= 256: V[0xf] = 1
+            V[X] %= 256
+        elif S3 == 5:
+            V[X] -= V[Y]
+            if V[X] >= 0: V[0xf] = 1
+            V[X] %= 256
+        elif S3 == 6:
+            V[0xf] = (V[X] if SCHIP_COMPATIBLE_FLAG else V[Y]) & 0x1
+            V[X] = (V[X] if SCHIP_COMPATIBLE_FLAG else V[Y]) >> 1
+        elif S3 == 7:
+            V[X] = V[Y] - V[X]
+            if V[X] >= 0: V[0xf] = 1
+            V[X] %= 256
+        elif S3 == 0xe:
+            V[0xf] = ((V[X] if SCHIP_COMPATIBLE_FLAG else V[Y]) & 0x80) >> 7
+            V[X] = (V[X] if SCHIP_COMPATIBLE_FLAG else V[Y]) << 1
+            V[X] %= 256
+        PC += 2
+    elif first_digit == 9:
+        X = (instr&0x0f00)>>8; Y = (instr&0x00f0)>>4
+        if V[X] != V[Y]: PC += 2
+        PC += 2
+    elif first_digit == 0x0a:
+        NNN = instr&0x0fff
+        I = NNN
+        PC += 2
+    elif first_digit == 0x0b:
+        NNN = instr&0x0fff
+        PC = NNN + V[0]
+    elif first_digit == 0x0c:
+        X = (instr&0x0f00)>>8; NN = instr&0x00ff
+        V[X] = math.floor(random.random()*256) & NN
+        PC += 2
+    elif first_digit == 0x0d:
+        X = (instr&0x0f00)>>8; Y = (instr&0x00f0)>>4; N = instr&0x000f
+        draw_sprite(V[X], V[Y], N)
+        PC += 2
+    elif first_digit == 0x0e:
+        X = (instr&0x0f00)>>8; NN = instr&0x00ff
+        if NN == 0x9e:
+            if V[X] in KEY_BUFFER and KEY_BUFFER[V[X]]: PC += 2
+            PC += 2
+        elif NN == 0xa1:
+            if V[X] not in KEY_BUFFER or not KEY_BUFFER[V[X]]: PC += 2
+            PC += 2
+        else:
+            print(f'Unsupported instr {instr:04X}')
+            PC += 2
+    elif first_digit == 0x0f:
+        X = (instr&0x0f00)>>8; NN = instr&0x00ff
+        if NN == 0x07:
+            V[X] = DELAY
+        elif NN == 0x0a:
+            WAITKEY = True
+            WAITKEY_TARGET = X
+        elif NN == 0x15:
+            DELAY = V[X]
+        elif NN == 0x18:
+            SOUND = V[X]
+        elif NN == 0x1e:
+            I += V[X]
+        elif NN == 0x29:
+            I = FONT_BASE + (V[X]%0x10) * 5
+        elif NN == 0x33:
+            store_bcd(X)
+        elif NN == 0x55:
+            for z in range(X+1):
+                MEM[I+z] = V[z]
+            if not SCHIP_COMPATIBLE_FLAG:
+                I = I + X + 1; I %= 4096
+        elif NN == 0x65:
+            for z in range(X+1):
+                V[z] = MEM[I+z]
+            if not SCHIP_COMPATIBLE_FLAG:
+                I = I + X + 1; I %= 4096
+        PC += 2
+
+
+def draw_sprite(X: int, Y: int, N: int):
+    X %= 0x40; Y %= 0x20
+    turned_off = False
+    for i in range(N):
+        b = f'{MEM[I+i]:08b}'
+        for x in range(X, min(0x40, X+8)):
+            y = Y+i; y %= 0x20
+            j = x-X
+            prev = SCREEN[y*64+x]
+            SCREEN[y*64+x] ^= int(b[j])
+            current = SCREEN[y*64+x]
+            if prev == 1 and current == 0: turned_off = True
+    V[0xf] = int(turned_off)
+
+def store_bcd(X: int):
+    x = V[X]
+    a = x // 100; b = (x % 100) // 10; c = x % 10
+    MEM[I] = a; MEM[I+1] = b; MEM[I+2] = c
+
+
+def _N(s: str) -> int:
+    r = 0
+    for i in s:
+        r *= 16
+        if '0' <= i <= '9': r += ord(i) - ord('0')
+        elif 'a' <= i <= 'f': r += ord(i) - ord('a') + 10
+        elif 'A' <= i <= 'F': r += ord(i) - ord('A') + 10
+    return r
+
+
+def tk_step():
+    global I, SP, DELAY, SOUND, PC, WAITKEY, WAITKEY_TARGET
+    if WAITKEY:
+        return
+    # instr are 2-bytes long, big endian.
+    instr_1 = MEM[PC]; instr_2 = MEM[PC+1]
+    s = f'{instr_1:02X}{instr_2:02X}'
+
+    if s[0] == '0':
+        if s == '00E0':
+            for i in range(64 * 32):
+                SCREEN[i] = False
+            PC += 2
+        elif s == '00EE':
+            SP -= 1
+            if SP < 0: raise Error('stack underflow')
+            PC = STK[SP]
+        else:
+            print(f'Unsupported instruction {s}')
+            raise Exception()
+            PC += 2
+    elif s[0] == '1':
+        NNN = _N(s[1:])
+        PC = NNN
+    elif s[0] == '2':
+        NNN = _N(s[1:])
+        STK[SP] = PC+2
+        SP += 1
+        PC = NNN
+    elif s[0] == '3':
+        X = _N(s[1]); NN = _N(s[2:])
+        if V[X] == NN: PC += 2
+        PC += 2
+    elif s[0] == '4':
+        X = _N(s[1]); NN = _N(s[2:])
+        if V[X] != NN: PC += 2
+        PC += 2
+    elif s[0] == '5':
+        X = _N(s[1]); Y = _N(s[2])
+        if V[X] == V[Y]: PC += 2
+        PC += 2
+    elif s[0] == '6':
+        X = _N(s[1]); NN = _N(s[2:])
+        V[X] = NN; V[X] %= 256
+        PC += 2
+    elif s[0] == '7':
+        X = _N(s[1]); NN = _N(s[2:])
+        V[X] += NN; V[X] %= 256
+        PC += 2
+    elif s[0] == '8':
+        X = _N(s[1]); Y = _N(s[2])
+        if s[3] == '0':
+            V[X] = V[Y]
+        elif s[3] == '1':
+            V[X] |= V[Y]
+        elif s[3] == '2':
+            V[X] &= V[Y]
+        elif s[3] == '3':
+            V[X] ^= V[Y]
+        elif s[3] == '4':
+            V[X] += V[Y]
+            if V[X] >= 256: V[0xf] = 1
+            V[X] %= 256
+        elif s[3] == '5':
+            V[X] -= V[Y]
+            if V[X] >= 0: V[0xf] = 1
+            V[X] %= 256
+        elif s[3] == '6':
+            V[0xf] = (V[X] if SCHIP_COMPATIBLE_FLAG else V[Y]) & 0x1
+            V[X] = (V[X] if SCHIP_COMPATIBLE_FLAG else V[Y]) >> 1
+        elif s[3] == '7':
+            V[X] = V[Y] - V[X]
+            if V[X] >= 0: V[0xf] = 1
+            V[X] %= 256
+        elif s[3] == 'E':
+            V[0xf] = ((V[X] if SCHIP_COMPATIBLE_FLAG else V[Y]) & 0x80) >> 7
+            V[X] = (V[X] if SCHIP_COMPATIBLE_FLAG else V[Y]) << 1
+            V[X] %= 256
+        PC += 2
+    elif s[0] == '9':
+        X = _N(s[1]); Y = _N(s[2])
+        if V[X] != V[Y]: PC += 2
+        PC += 2
+    elif s[0] == 'A':
+        NNN = _N(s[1:])
+        I = NNN
+        PC += 2
+    elif s[0] == 'B':
+        NNN = _N(s[1:])
+        PC = NNN + V[0]
+    elif s[0] == 'C':
+        X = _N(s[1]); NN = _N(s[2:])
+        V[X] = math.floor(random.random()*256) & NN
+        PC += 2
+    elif s[0] == 'D':
+        X = _N(s[1]); Y = _N(s[2]); N = _N(s[3])
+        draw_sprite(V[X], V[Y], N)
+        PC += 2
+    elif s[0] == 'E':
+        X = _N(s[1])
+        if s[2:] == '9E':
+            if V[X] in KEY_BUFFER and KEY_BUFFER[V[X]]: PC += 2
+            PC += 2
+        elif s[2:] == 'A1':
+            if V[X] not in KEY_BUFFER or not KEY_BUFFER[V[X]]: PC += 2
+            PC += 2
+        else:
+            print(f'Unsupported instr {s}')
+            PC += 2
+    elif s[0] == 'F':
+        X = _N(s[1])
+        if s[2:] == '07':
+            V[X] = DELAY
+        elif s[2:] == '0A':
+            WAITKEY = True
+            WAITKEY_TARGET = X
+        elif s[2:] == '15':
+            DELAY = V[X]
+        elif s[2:] == '18':
+            SOUND = V[X]
+        elif s[2:] == '1E':
+            I += V[X]
+        elif s[2:] == '29':
+            I = FONT_BASE + (V[X]%0x10) * 5
+        elif s[2:] == '33':
+            store_bcd(X)
+        elif s[2:] == '55':
+            for z in range(X+1):
+                MEM[I+z] = V[z]
+            if not SCHIP_COMPATIBLE_FLAG:
+                I = I + X + 1; I %= 4096
+        elif s[2:] == '65':
+            for z in range(X+1):
+                V[z] = MEM[I+z]
+            if not SCHIP_COMPATIBLE_FLAG:
+                I = I + X + 1; I %= 4096
+        PC += 2
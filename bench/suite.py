@@ -0,0 +1,328 @@
+# Micro- and macro-benchmark suite.
+#
+# Micro benchmarks time one operation of the core, the assembler or the
+# disassembler in isolation; macro benchmarks run small synthetic ROMs
+# headless for a fixed number of instructions. Every benchmark reports the
+# best of --repeat runs as operations per second.
+#
+#     python bench/suite.py run [-o results.json] [-k FILTER] [--repeat N]
+#     python bench/suite.py compare BASE.json NEW.json [--threshold 0.05]
+#
+# compare prints the change of every benchmark present in both files and
+# exits with status 1 when any of them got slower by more than the
+# threshold.
+
+import os
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import chip8
+import asm
+import disasm
+import dispatch
+try:
+    import batch
+except ImportError:
+    # numpy missing; the batch benchmarks are skipped.
+    batch = None
+
+# synthetic ROMs for the macro benchmarks.
+# sprite-blit loop: 15-row sprites walking diagonally across the screen.
+SPRITE_PROGRAM = bytes([
+    0xa0, 0x00,  # 200 LDI 0x000
+    0x60, 0x00,  # 202 LD V0,0
+    0x61, 0x00,  # 204 LD V1,0
+    0xd0, 0x1f,  # 206 DRAW V0,V1,15
+    0x70, 0x03,  # 208 ADD V0,3
+    0x71, 0x01,  # 20A ADD V1,1
+    0x12, 0x06,  # 20C JMP 0x206
+])
+# delay-poll loop: the usual "wait until the delay timer runs out".
+DELAY_PROGRAM = bytes([
+    0x60, 0x02,  # 200 LD V0,2
+    0xf0, 0x15,  # 202 SET_DELAY V0
+    0xf1, 0x07,  # 204 GET_DELAY V1
+    0x31, 0x00,  # 206 IF_NEQ V1,0
+    0x12, 0x04,  # 208 JMP 0x204
+    0x12, 0x00,  # 20A JMP 0x200
+])
+# instructions per frame for the macro benchmarks; high enough that the
+# per-frame overhead stays small but the delay timer still runs out.
+MACRO_CYCLES_PER_FRAME = 1000
+
+BENCHMARKS = {}
+
+
+def benchmark(name: str, n: int):
+    # registers f as a benchmark doing n operations per call. f gets the
+    # operation count and returns a callable that does the timed work.
+    def wrap(f):
+        BENCHMARKS[name] = (f, n)
+        return f
+    return wrap
+
+
+def generate_source(lines: int, seed: int = 0) -> str:
+    # a syntactically valid assembler source of roughly the given number
+    # of lines: labels, comments, data and a mix of every operand shape.
+    rnd = random.Random(seed)
+    res = ['@200']
+    label = 0
+    while len(res) < lines:
+        k = rnd.randrange(12)
+        x = rnd.randrange(10); y = rnd.randrange(10)
+        if k == 0:
+            res.append(f'#L{label}')
+            label += 1
+        elif k == 1:
+            res.append(f'; comment {len(res)}')
+        elif k == 2:
+            res.append(f'$0x{rnd.randrange(256):02x}, 0b{rnd.randrange(256):08b}')
+        elif k == 3 and label:
+            res.append(f'    {rnd.choice(("JMP", "CALL", "LDI"))} #L{rnd.randrange(label)}')
+        elif k == 4:
+            res.append(f'    LD V{x}, {rnd.randrange(256)}')
+        elif k == 5:
+            res.append(f'    LD V{x}, V{y}')
+        elif k == 6:
+            res.append(f'    ADD V{x}, 0x{rnd.randrange(256):02x}')
+        elif k == 7:
+            res.append(f'    {rnd.choice(("OR", "AND", "XOR", "ADDC", "SUBC", "SHR", "SUB2", "SHL"))} V{x}, V{y}')
+        elif k == 8:
+            res.append(f'    IF_{rnd.choice(("EQ", "NEQ"))} V{x}, V{y}')
+        elif k == 9:
+            res.append(f'    DRAW V{x}, V{y}, {rnd.randrange(16)}')
+        elif k == 10:
+            res.append(f'    {rnd.choice(("BCD", "CHAR", "GET_DELAY", "SET_DELAY", "SET_SOUND"))} V{x}')
+        else:
+            res.append(f'    {rnd.choice(("STR", "LDR"))} {x}')
+    return '\n'.join(res) + '\n'
+
+
+def random_rom(size: int = chip8.ROM_MAX, seed: int = 0) -> bytes:
+    rnd = random.Random(seed)
+    return bytes(rnd.randrange(256) for _ in range(size))
+
+
+def machine(program: bytes = b'', **kwargs) -> chip8.Chip8:
+    m = chip8.Chip8(seed=0, **kwargs)
+    m.load(program)
+    return m
+
+
+@benchmark('dispatch.run', 200000)
+def bench_dispatch(n: int):
+    m = machine(dispatch.PROGRAM)
+    return lambda: m.run(n)
+
+
+@benchmark('dispatch.run_translated', 200000)
+def bench_dispatch_translated(n: int):
+    m = machine(dispatch.PROGRAM, translate=True)
+    return lambda: m.run(n)
+
+
+@benchmark('draw_sprite.1', 50000)
+def bench_draw_sprite_1(n: int):
+    m = machine()
+    draw = m.draw_sprite
+    def f():
+        for i in range(n):
+            draw(i & 0x3f, i & 0x1f, 1)
+    return f
+
+
+@benchmark('draw_sprite.15', 50000)
+def bench_draw_sprite_15(n: int):
+    m = machine()
+    draw = m.draw_sprite
+    def f():
+        for i in range(n):
+            draw(i & 0x3f, i & 0x1f, 15)
+    return f
+
+
+@benchmark('op.00E0', 100000)
+def bench_clear(n: int):
+    m = machine()
+    op = chip8.OPCODE_TABLE[0x00e0]
+    def f():
+        for _ in range(n):
+            op(m, 0x202)
+    return f
+
+
+@benchmark('op.FF55', 100000)
+def bench_store(n: int):
+    m = machine(schip_compatible=True)
+    m.I = 0x300
+    op = chip8.OPCODE_TABLE[0xff55]
+    def f():
+        for _ in range(n):
+            op(m, 0x202)
+    return f
+
+
+@benchmark('op.FF65', 100000)
+def bench_load(n: int):
+    m = machine(schip_compatible=True)
+    m.I = 0x300
+    op = chip8.OPCODE_TABLE[0xff65]
+    def f():
+        for _ in range(n):
+            op(m, 0x202)
+    return f
+
+
+@benchmark('store_bcd', 100000)
+def bench_store_bcd(n: int):
+    m = machine()
+    m.I = 0x300
+    m.V[0] = 0xfe
+    bcd = m.store_bcd
+    def f():
+        for _ in range(n):
+            bcd(0)
+    return f
+
+
+@benchmark('asm.compile_source', 100000)
+def bench_compile(n: int):
+    source = generate_source(n)
+    def f():
+        asm.TOKEN_CACHE.clear()
+        asm.compile_source(source)
+    return f
+
+
+@benchmark('asm.compile_source.cached', 100000)
+def bench_compile_cached(n: int):
+    # every line already tokenized by an earlier build.
+    source = generate_source(n)
+    asm.compile_source(source)
+    return lambda: asm.compile_source(source)
+
+
+@benchmark('disasm.rom', chip8.ROM_MAX)
+def bench_disasm(n: int):
+    rom = random_rom(n)
+    return lambda: disasm.disasm_rom(rom)
+
+
+if batch:
+    @benchmark('batch.run.4096', 4096 * 200)
+    def bench_batch(n: int):
+        # 4096 instances in lockstep; n counts instructions over all of them.
+        b = batch.BatchChip8(4096, seed=0)
+        b.load(dispatch.PROGRAM)
+        return lambda: b.run(n // 4096)
+
+
+def _macro(program: bytes, n: int, translate: bool):
+    def f():
+        m = machine(program, translate=translate, cycles_per_frame=MACRO_CYCLES_PER_FRAME)
+        while m.CYCLES < n:
+            m.run_until_frame()
+    return f
+
+
+for _name, _program in (
+    ('alu', dispatch.PROGRAM),
+    ('sprite', SPRITE_PROGRAM),
+    ('delay', DELAY_PROGRAM),
+):
+    for _translate in (False, True):
+        benchmark(f"macro.{_name}{'.translated' if _translate else ''}", 300000)(
+            lambda n, p=_program, t=_translate: _macro(p, n, t)
+        )
+
+
+def run(names: list, repeat: int) -> dict:
+    results = {}
+    for name in names:
+        setup, n = BENCHMARKS[name]
+        f = setup(n)
+        best = None
+        for _ in range(repeat):
+            t = time.perf_counter()
+            f()
+            dt = time.perf_counter() - t
+            best = dt if best is None else min(best, dt)
+        results[name] = {'n': n, 'seconds': best, 'ops_per_sec': n / best if best else 0.0}
+        print(f'{name:28} {best:9.4f}s {n / best if best else 0.0:14,.0f} ops/s')
+    return results
+
+
+def compare(base: dict, new: dict, threshold: float) -> int:
+    regressed = 0
+    for name, r in new['results'].items():
+        b = base['results'].get(name)
+        if b is None or not b['ops_per_sec']:
+            print(f'{name:28} {"":>14} {r["ops_per_sec"]:14,.0f}  (new)')
+            continue
+        change = r['ops_per_sec'] / b['ops_per_sec'] - 1
+        flag = ''
+        if change < -threshold:
+            flag = '  REGRESSION'
+            regressed += 1
+        elif change > threshold:
+            flag = '  improved'
+        print(f'{name:28} {b["ops_per_sec"]:14,.0f} {r["ops_per_sec"]:14,.0f} {change*100:+7.1f}%{flag}')
+    print(f'{regressed} regression(s) beyond {threshold*100:.0f}%')
+    return 1 if regressed else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='CHIP-8 benchmark suite.')
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('run', help='Run the benchmarks.')
+    p.add_argument('-o', '--output',
+        type=str,
+        default=None,
+        help='Write the results as JSON here.',
+    )
+    p.add_argument('-k', '--filter',
+        type=str,
+        default='',
+        help='Only run benchmarks whose name contains this.',
+    )
+    p.add_argument('--repeat',
+        type=int,
+        default=3,
+        help='Runs per benchmark; the fastest one counts.',
+    )
+    p = sub.add_parser('compare', help='Compare two result files.')
+    p.add_argument('base',
+        type=str,
+    )
+    p.add_argument('new',
+        type=str,
+    )
+    p.add_argument('--threshold',
+        type=float,
+        default=0.05,
+        help='Relative slowdown reported as a regression (default: 0.05).',
+    )
+    cmd = parser.parse_args(sys.argv[1:])
+    if cmd.command == 'run':
+        names = [k for k in BENCHMARKS if cmd.filter in k]
+        results = run(names, cmd.repeat)
+        if cmd.output:
+            with open(cmd.output, 'w') as f:
+                json.dump({
+                    'python': platform.python_version(),
+                    'machine': platform.machine(),
+                    'time': time.time(),
+                    'results': results,
+                }, f, indent=2)
+    else:
+        with open(cmd.base, 'r') as f:
+            base = json.load(f)
+        with open(cmd.new, 'r') as f:
+            new = json.load(f)
+        sys.exit(compare(base, new, cmd.threshold))
@@ -0,0 +1,815 @@
+# CHIP-8 interpreter core.
+#
+# No GUI code lives here. Frontends feed key events with key_down/key_up,
+# drive the machine with run()/run_until_frame(), and read SCREEN back
+# whenever DIRTY is set.
+#
+# SCREEN is a 256-byte bitplane: 32 rows of 8 bytes, most significant bit
+# of each row is x=0. framebuffer() hands it out without copying.
+#
+# Two execution modes: the plain interpreter (one table lookup per
+# instruction) and translated mode, which compiles straight-line runs of
+# instructions into Python functions cached by their start address.
+
+import random
+import struct
+import time
+
+FRAME_RATE = 60
+# instructions executed per 60Hz frame by run_until_frame().
+CYCLES_PER_FRAME = 10
+# longest straight-line run compiled into one block in translated mode.
+MAX_BLOCK_LEN = 64
+
+FONT_BASE = 0x0
+FONT = [
+    0xf0, 0x90, 0x90, 0x90, 0xf0,
+    0x20, 0x60, 0x20, 0x20, 0x70,
+    0xf0, 0x10, 0xf0, 0x80, 0xf0,
+    0xf0, 0x10, 0xf0, 0x10, 0xf0,
+    0x90, 0x90, 0xf0, 0x10, 0x10,
+    0xf0, 0x80, 0xf0, 0x10, 0xf0,
+    0xf0, 0x80, 0xf0, 0x90, 0xf0,
+    0xf0, 0x10, 0x20, 0x40, 0x40,
+    0xf0, 0x90, 0xf0, 0x90, 0xf0,
+    0xf0, 0x90, 0xf0, 0x10, 0xf0,
+    0xf0, 0x90, 0xf0, 0x90, 0x90,
+    0xe0, 0x90, 0xe0, 0x90, 0xe0,
+    0xf0, 0x80, 0x80, 0x80, 0xf0,
+    0xe0, 0x90, 0x90, 0x90, 0xe0,
+    0xf0, 0x80, 0xf0, 0x80, 0xf0,
+    0xf0, 0x80, 0xf0, 0x80, 0x80,
+]
+
+ROM_BASE = 0x200
+ROM_MAX = 4096 - ROM_BASE
+
+SCREEN_WIDTH = 64
+SCREEN_HEIGHT = 32
+ROW_BYTES = SCREEN_WIDTH // 8
+
+# save state layout: this header, then V, KEY_BUFFER, SCREEN and MEM as
+# raw bytes. bump STATE_VERSION whenever the layout changes.
+STATE_MAGIC = b'C8ST'
+STATE_VERSION = 3
+# magic, version, flags, WAITKEY_TARGET, PC, I, SP, DELAY, SOUND,
+# CYCLES_PER_FRAME, CYCLES, FRAMES, RNG, STK
+STATE_HEADER = struct.Struct('>4sBBBHHBBBIQQI16H')
+STATE_SIZE = STATE_HEADER.size + 16 + 16 + ROW_BYTES * SCREEN_HEIGHT + 4096
+STATE_WAITKEY = 0x1
+STATE_SCHIP = 0x2
+
+
+class Chip8:
+    __slots__ = (
+        'V', 'MEM', 'I', 'STK', 'SP', 'DELAY', 'SOUND', 'SCREEN', 'PC',
+        'KEY_BUFFER', 'WAITKEY', 'WAITKEY_TARGET',
+        'SCHIP_COMPATIBLE_FLAG', 'CYCLES_PER_FRAME',
+        'CYCLES', 'FRAMES', 'DIRTY',
+        'TRANSLATE', 'BLOCKS', 'CODE',
+        'BLOCK_HITS', 'BLOCK_MISSES', 'BLOCK_INVALIDATIONS',
+        'SEED', 'RNG', 'PROFILE', 'OPS',
+    )
+
+    def __init__(self, schip_compatible: bool = False, cycles_per_frame: int = CYCLES_PER_FRAME, translate: bool = False, seed: int = None):
+        self.SCHIP_COMPATIBLE_FLAG = schip_compatible
+        self.CYCLES_PER_FRAME = cycles_per_frame
+        self.TRANSLATE = translate
+        # CXNN draws from a xorshift32 state seeded here, so a run is
+        # reproducible from its seed and inputs.
+        self.SEED = random.getrandbits(32) if seed is None else seed
+        # a profiler.Profile, or None. run() picks its code path once per
+        # call, so the plain path pays nothing for profiling support.
+        self.PROFILE = None
+        # the dispatch table. normally the shared OPCODE_TABLE; a debugger
+        # swaps in a copy with instrumented handlers for the opcodes it
+        # watches, so everything else keeps running at full speed.
+        self.OPS = OPCODE_TABLE
+        self.MEM = bytearray(4096)
+        self.flush_blocks()
+        self.reset()
+
+    def reset(self):
+        # clears everything but the loaded program.
+        self.V = bytearray(16)
+        self.I = 0
+        self.STK = [0 for _ in range(16)]
+        self.SP = 0
+        self.DELAY = 0
+        self.SOUND = 0
+        self.SCREEN = bytearray(ROW_BYTES * SCREEN_HEIGHT)
+        self.PC = ROM_BASE
+        self.KEY_BUFFER = bytearray(16)
+        self.WAITKEY = False
+        self.WAITKEY_TARGET = None
+        self.CYCLES = 0
+        self.FRAMES = 0
+        self.DIRTY = True
+        self.RNG = rng_state(self.SEED)
+        self.MEM[FONT_BASE:FONT_BASE+len(FONT)] = bytes(FONT)
+
+    def reseed(self, seed: int):
+        self.SEED = seed
+        self.RNG = rng_state(seed)
+
+    def load(self, data: bytes) -> int:
+        # returns the number of bytes actually loaded.
+        data = data[:ROM_MAX]
+        self.MEM[ROM_BASE:ROM_BASE+len(data)] = data
+        self.flush_blocks()
+        return len(data)
+
+    def reload(self, data: bytes, keep_registers: bool = False) -> int:
+        # swaps in a new program without recreating the machine. by
+        # default the ROM area is cleared and the machine restarts from
+        # ROM_BASE; with keep_registers only the new bytes are written and
+        # execution carries on from the current PC with the current
+        # registers, stack, timers and screen.
+        if not keep_registers:
+            self.MEM[ROM_BASE:] = bytes(ROM_MAX)
+            self.reset()
+        return self.load(data)
+
+    def key_down(self, k: int):
+        self.KEY_BUFFER[k] = 1
+        if self.WAITKEY:
+            self.V[self.WAITKEY_TARGET] = k
+            self.WAITKEY = False
+
+    def key_up(self, k: int):
+        self.KEY_BUFFER[k] = 0
+
+    def tick(self):
+        # 60Hz timer tick.
+        if self.DELAY > 0: self.DELAY -= 1
+        if self.SOUND > 0: self.SOUND -= 1
+
+    def run(self, cycles: int) -> int:
+        # returns the number of instructions executed; stops early when
+        # the machine blocks on FX0A.
+        if self.PROFILE is not None:
+            return self.run_profiled(cycles)
+        if self.TRANSLATE:
+            return self.run_translated(cycles)
+        MEM = self.MEM; OPS = self.OPS
+        PC = self.PC
+        n = 0
+        try:
+            while n < cycles and not self.WAITKEY:
+                PC = OPS[(MEM[PC]<<8)|MEM[PC+1]](self, (PC+2)&0xfff)
+                n += 1
+        except Break as e:
+            self.PC = e.pc
+            self.CYCLES += n + e.executed
+            raise
+        self.PC = PC
+        self.CYCLES += n
+        return n
+
+    def run_translated(self, cycles: int) -> int:
+        # a block only runs when it fits in the remaining budget, so the
+        # instruction count per call matches the interpreter exactly. when
+        # the block at PC is longer than what is left, a prefix of it
+        # compiled for exactly the remaining count runs instead; prefixes
+        # are cached under PC | length << 12.
+        MEM = self.MEM; OPS = self.OPS; BLOCKS = self.BLOCKS
+        PC = self.PC
+        n = 0
+        hits = 0
+        try:
+            while n < cycles and not self.WAITKEY:
+                left = cycles - n
+                b = BLOCKS.get(PC)
+                if b is None or b[1] > left:
+                    # the full block never exceeds MAX_BLOCK_LEN, so
+                    # prefixes are only needed below it.
+                    b = BLOCKS.get(PC | left << 12) if left < MAX_BLOCK_LEN else None
+                    if b is None:
+                        b = _translate(self, PC, left)
+                        self.BLOCK_MISSES += 1
+                    else:
+                        hits += 1
+                else:
+                    hits += 1
+                # untranslatable blocks are left to the interpreter to
+                # report; instrumented opcodes always end up here too.
+                if b is None:
+                    PC = OPS[(MEM[PC]<<8)|MEM[PC+1]](self, (PC+2)&0xfff)
+                    n += 1
+                else:
+                    PC = b[0](self)
+                    n += b[1]
+        except Break as e:
+            self.BLOCK_HITS += hits
+            self.PC = e.pc
+            self.CYCLES += n + e.executed
+            raise
+        self.BLOCK_HITS += hits
+        self.PC = PC
+        self.CYCLES += n
+        return n
+
+    def run_profiled(self, cycles: int) -> int:
+        # the interpreter loop plus per-opcode and per-PC counts and the
+        # time spent in DXYN. always interprets, even in translated mode.
+        p = self.PROFILE
+        ops = p.ops; pcs = p.pcs
+        MEM = self.MEM; OPS = self.OPS
+        perf_counter = time.perf_counter
+        PC = self.PC
+        n = 0
+        draw = 0.0
+        t = perf_counter()
+        try:
+            while n < cycles and not self.WAITKEY:
+                instr = (MEM[PC]<<8)|MEM[PC+1]
+                ops[instr] += 1
+                pcs[PC] += 1
+                if instr >> 12 == 0xd:
+                    d = perf_counter()
+                    PC = OPS[instr](self, (PC+2)&0xfff)
+                    draw += perf_counter() - d
+                else:
+                    PC = OPS[instr](self, (PC+2)&0xfff)
+                n += 1
+        except Break as e:
+            p.add_time('run', perf_counter() - t)
+            p.add_time('draw_sprite', draw)
+            self.PC = e.pc
+            self.CYCLES += n + e.executed
+            raise
+        p.add_time('run', perf_counter() - t)
+        p.add_time('draw_sprite', draw)
+        self.PC = PC
+        self.CYCLES += n
+        return n
+
+    def flush_blocks(self):
+        self.BLOCKS = {}
+        self.CODE = [0] * 4096
+        self.BLOCK_HITS = 0
+        self.BLOCK_MISSES = 0
+        self.BLOCK_INVALIDATIONS = 0
+
+    def invalidate(self, addr: int, length: int):
+        # drops every cached block that overlaps [addr, addr+length). a
+        # range that runs past 0xFFF wraps to 0x000, as FX55/FX33 writes do.
+        addr &= 0xfff
+        if addr + length > 4096:
+            self.invalidate(0, min(addr + length - 4096, 4096))
+            length = 4096 - addr
+        CODE = self.CODE
+        end = addr + length
+        if not any(CODE[addr:end]):
+            return
+        for key, b in list(self.BLOCKS.items()):
+            start = key & 0xfff
+            b_end = start + b[1] * 2
+            if start < end and addr < b_end:
+                del self.BLOCKS[key]
+                for a in range(start, b_end):
+                    CODE[a] -= 1
+                self.BLOCK_INVALIDATIONS += 1
+
+    def block_stats(self) -> dict:
+        lookups = self.BLOCK_HITS + self.BLOCK_MISSES
+        return {
+            'blocks': len(self.BLOCKS),
+            'hits': self.BLOCK_HITS,
+            'misses': self.BLOCK_MISSES,
+            'hit_rate': self.BLOCK_HITS / lookups if lookups else 0.0,
+            'invalidations': self.BLOCK_INVALIDATIONS,
+        }
+
+    def run_until_frame(self) -> int:
+        n = self.run(self.CYCLES_PER_FRAME)
+        self.tick()
+        self.FRAMES += 1
+        return n
+
+    def step(self):
+        if self.WAITKEY:
+            return
+        MEM = self.MEM; PC = self.PC
+        try:
+            self.PC = self.OPS[(MEM[PC]<<8)|MEM[PC+1]](self, (PC+2)&0xfff)
+        except Break as e:
+            self.PC = e.pc
+            self.CYCLES += e.executed
+            raise
+        self.CYCLES += 1
+
+    def snapshot(self) -> bytes:
+        flags = (STATE_WAITKEY if self.WAITKEY else 0) | (STATE_SCHIP if self.SCHIP_COMPATIBLE_FLAG else 0)
+        return b''.join((
+            STATE_HEADER.pack(
+                STATE_MAGIC, STATE_VERSION, flags,
+                0xff if self.WAITKEY_TARGET is None else self.WAITKEY_TARGET,
+                self.PC, self.I, self.SP, self.DELAY, self.SOUND,
+                self.CYCLES_PER_FRAME, self.CYCLES, self.FRAMES, self.RNG,
+                *self.STK,
+            ),
+            self.V, self.KEY_BUFFER, self.SCREEN, self.MEM,
+        ))
+
+    def restore(self, state: bytes):
+        if len(state) != STATE_SIZE:
+            raise Exception(f'Bad save state: {len(state)} bytes, expected {STATE_SIZE}')
+        h = STATE_HEADER.unpack_from(state)
+        if h[0] != STATE_MAGIC:
+            raise Exception('Bad save state: wrong magic')
+        if h[1] != STATE_VERSION:
+            raise Exception(f'Unsupported save state version {h[1]}')
+        (_, _, flags, target, self.PC, self.I, self.SP, self.DELAY, self.SOUND,
+            self.CYCLES_PER_FRAME, self.CYCLES, self.FRAMES, self.RNG) = h[:13]
+        self.STK = list(h[13:])
+        self.WAITKEY = bool(flags & STATE_WAITKEY)
+        self.SCHIP_COMPATIBLE_FLAG = bool(flags & STATE_SCHIP)
+        self.WAITKEY_TARGET = None if target == 0xff else target
+        o = STATE_HEADER.size
+        self.V[:] = state[o:o+16]; o += 16
+        self.KEY_BUFFER[:] = state[o:o+16]; o += 16
+        self.SCREEN[:] = state[o:o+len(self.SCREEN)]; o += len(self.SCREEN)
+        self.MEM[:] = state[o:o+4096]
+        if self.BLOCKS: self.flush_blocks()
+        self.DIRTY = True
+
+    def framebuffer(self) -> memoryview:
+        return memoryview(self.SCREEN)
+
+    def row(self, y: int) -> int:
+        o = y * ROW_BYTES
+        return int.from_bytes(self.SCREEN[o:o+ROW_BYTES], 'big')
+
+    def draw_sprite(self, X: int, Y: int, N: int):
+        # one shift, AND and XOR per sprite row. bits shifted past x=63
+        # fall off, so sprites clip at the right edge; rows wrap vertically.
+        MEM = self.MEM; SCREEN = self.SCREEN; I = self.I
+        X %= 0x40; Y %= 0x20
+        turned_off = 0
+        for i in range(N):
+            s = (MEM[(I+i)&0xfff] << 56) >> X
+            if not s: continue
+            o = ((Y+i) & 0x1f) * ROW_BYTES
+            row = int.from_bytes(SCREEN[o:o+ROW_BYTES], 'big')
+            if row & s: turned_off = 1
+            SCREEN[o:o+ROW_BYTES] = (row ^ s).to_bytes(ROW_BYTES, 'big')
+        self.V[0xf] = turned_off
+        self.DIRTY = True
+
+    def store_bcd(self, X: int):
+        x = self.V[X]; I = self.I
+        MEM = self.MEM
+        MEM[I] = x // 100
+        MEM[(I+1)&0xfff] = (x % 100) // 10
+        MEM[(I+2)&0xfff] = x % 10
+        if self.BLOCKS: self.invalidate(I, 3)
+
+
+class Break(Exception):
+    # raised by instrumented handlers (see debugger.py) to stop run() and
+    # step(). pc is where execution resumes; executed is 1 when the
+    # instruction that triggered it has already run (watchpoints), 0 when
+    # it has not (breakpoints). run() stores both before re-raising.
+    def __init__(self, reason: str, pc: int, executed: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.pc = pc
+        self.executed = executed
+
+
+def opcode_class(instr: int) -> str:
+    # the opcode pattern an instruction belongs to, e.g. 0x8124 -> '8XY4'.
+    first_digit = instr >> 12
+    NN = instr & 0xff
+    if first_digit == 0:
+        return '00E0' if instr == 0x00e0 else '00EE' if instr == 0x00ee else '0NNN'
+    elif first_digit in (1, 2, 0xa, 0xb): return f'{first_digit:X}NNN'
+    elif first_digit in (3, 4, 6, 7, 0xc): return f'{first_digit:X}XNN'
+    elif first_digit in (5, 9): return f'{first_digit:X}XY0'
+    elif first_digit == 8: return f'8XY{instr & 0xf:X}'
+    elif first_digit == 0xd: return 'DXYN'
+    return f'{first_digit:X}X{NN:02X}'
+
+
+def cycles_per_frame(ips: int) -> int:
+    # instructions per second -> per 60Hz frame. a frame runs a whole
+    # number of instructions, and input logs and save states record it, so
+    # a rate that does not divide evenly is refused rather than rounded.
+    if ips < FRAME_RATE or ips % FRAME_RATE:
+        raise Exception(f'{ips} instructions per second is not a multiple of {FRAME_RATE}')
+    return ips // FRAME_RATE
+
+
+def rng_state(seed: int) -> int:
+    # spreads small seeds over the state and avoids the all-zero state
+    # xorshift never leaves.
+    return ((seed * 0x9e3779b1 + 0x7f4a7c15) & 0xffffffff) or 1
+
+
+class ClockTimer:
+    # a 60Hz down-counter read from the monotonic clock on demand: the
+    # value at time t is the value last set minus the ticks elapsed since.
+    # scale speeds the countdown up or slows it down.
+    __slots__ = ('start', 'value', 'scale')
+
+    def __init__(self, scale: float = 1.0):
+        self.scale = scale
+        self.set(0)
+
+    def get(self) -> int:
+        if not self.value: return 0
+        r = self.value - int((time.monotonic() - self.start) * FRAME_RATE * self.scale)
+        if r <= 0:
+            self.value = 0
+            return 0
+        return r
+
+    def set(self, v: int):
+        self.start = time.monotonic()
+        self.value = v
+
+    def set_scale(self, scale: float):
+        # rebase first so the ticks already elapsed keep their old rate.
+        self.set(self.get())
+        self.scale = scale
+
+
+class ClockedChip8(Chip8):
+    # DELAY and SOUND follow wall-clock time instead of being ticked by
+    # run_until_frame(), for frontends that do not run in fixed frames.
+    __slots__ = ('DELAY_TIMER', 'SOUND_TIMER')
+
+    def __init__(self, *args, **kwargs):
+        self.DELAY_TIMER = ClockTimer()
+        self.SOUND_TIMER = ClockTimer()
+        super().__init__(*args, **kwargs)
+
+    @property
+    def DELAY(self) -> int:
+        return self.DELAY_TIMER.get()
+
+    @DELAY.setter
+    def DELAY(self, v: int):
+        self.DELAY_TIMER.set(v)
+
+    @property
+    def SOUND(self) -> int:
+        return self.SOUND_TIMER.get()
+
+    @SOUND.setter
+    def SOUND(self, v: int):
+        self.SOUND_TIMER.set(v)
+
+    def tick(self):
+        pass
+
+    def set_clock_scale(self, scale: float):
+        self.DELAY_TIMER.set_scale(scale)
+        self.SOUND_TIMER.set_scale(scale)
+
+
+class FrameClock:
+    # fixed-timestep pacing for frontends. deadlines are absolute, so
+    # sleep error does not accumulate; falling more than MAX_LAG frames
+    # behind resyncs instead of bursting through catch-up frames.
+    __slots__ = ('interval', 'deadline', 'turbo')
+    MAX_LAG = 5
+    # the last stretch before a deadline is spun rather than slept, since
+    # time.sleep() routinely oversleeps by a millisecond or more.
+    SPIN = 0.002
+
+    def __init__(self, rate: int = FRAME_RATE, turbo: bool = False):
+        self.interval = 1 / rate
+        self.turbo = turbo
+        self.deadline = time.perf_counter()
+
+    def wait(self):
+        self.deadline += self.interval
+        now = time.perf_counter()
+        if self.turbo:
+            self.deadline = now
+            return
+        remaining = self.deadline - now
+        if remaining < -self.interval * self.MAX_LAG:
+            self.deadline = now
+            return
+        if remaining > self.SPIN:
+            time.sleep(remaining - self.SPIN)
+        while time.perf_counter() < self.deadline:
+            pass
+
+
+# opcode handlers. every handler takes the machine and the address of the
+# next instruction and returns the new PC; operands are bound when the
+# table is built so executing an instruction is a single indexed call.
+
+BLANK_SCREEN = bytes(ROW_BYTES * SCREEN_HEIGHT)
+
+def _op_00e0(m, pc):
+    m.SCREEN[:] = BLANK_SCREEN
+    m.DIRTY = True
+    return pc
+
+def _op_00ee(m, pc):
+    m.SP -= 1
+    if m.SP < 0: raise Exception('stack underflow')
+    return m.STK[m.SP]
+
+def _op_nop(m, pc):
+    return pc
+
+def _decode(instr: int):
+    X = (instr>>8)&0xf; Y = (instr>>4)&0xf
+    N = instr&0xf; NN = instr&0xff; NNN = instr&0xfff
+    first_digit = instr>>12
+
+    if first_digit == 0:
+        if instr == 0x00e0: return _op_00e0
+        elif instr == 0x00ee: return _op_00ee
+        def h(m, pc):
+            raise Exception(f'Unsupported instruction {instr:04X}')
+    elif first_digit == 1:
+        def h(m, pc): return NNN
+    elif first_digit == 2:
+        def h(m, pc):
+            if m.SP >= 16: raise Exception('stack overflow')
+            m.STK[m.SP] = pc
+            m.SP += 1
+            return NNN
+    elif first_digit == 3:
+        def h(m, pc): return (pc+2)&0xfff if m.V[X] == NN else pc
+    elif first_digit == 4:
+        def h(m, pc): return (pc+2)&0xfff if m.V[X] != NN else pc
+    elif first_digit == 5:
+        def h(m, pc):
+            V = m.V
+            return (pc+2)&0xfff if V[X] == V[Y] else pc
+    elif first_digit == 6:
+        def h(m, pc):
+            m.V[X] = NN
+            return pc
+    elif first_digit == 7:
+        def h(m, pc):
+            V = m.V
+            V[X] = (V[X] + NN) & 0xff
+            return pc
+    elif first_digit == 8:
+        if N == 0:
+            def h(m, pc):
+                V = m.V
+                V[X] = V[Y]
+                return pc
+        elif N == 1:
+            def h(m, pc):
+                V = m.V
+                V[X] |= V[Y]
+                return pc
+        elif N == 2:
+            def h(m, pc):
+                V = m.V
+                V[X] &= V[Y]
+                return pc
+        elif N == 3:
+            def h(m, pc):
+                V = m.V
+                V[X] ^= V[Y]
+                return pc
+        elif N == 4:
+            def h(m, pc):
+                V = m.V
+                r = V[X] + V[Y]
+                V[X] = r & 0xff; V[0xf] = r >> 8
+                return pc
+        elif N == 5:
+            def h(m, pc):
+                V = m.V
+                r = V[X] - V[Y]
+                V[X] = r & 0xff; V[0xf] = int(r >= 0)
+                return pc
+        elif N == 6:
+            def h(m, pc):
+                V = m.V
+                s = V[X] if m.SCHIP_COMPATIBLE_FLAG else V[Y]
+                V[X] = s >> 1; V[0xf] = s & 0x1
+                return pc
+        elif N == 7:
+            def h(m, pc):
+                V = m.V
+                r = V[Y] - V[X]
+                V[X] = r & 0xff; V[0xf] = int(r >= 0)
+                return pc
+        elif N == 0xe:
+            def h(m, pc):
+                V = m.V
+                s = V[X] if m.SCHIP_COMPATIBLE_FLAG else V[Y]
+                V[X] = (s << 1) & 0xff; V[0xf] = s >> 7
+                return pc
+        else:
+            return _op_nop
+    elif first_digit == 9:
+        def h(m, pc):
+            V = m.V
+            return (pc+2)&0xfff if V[X] != V[Y] else pc
+    elif first_digit == 0x0a:
+        def h(m, pc):
+            m.I = NNN
+            return pc
+    elif first_digit == 0x0b:
+        def h(m, pc): return (NNN + m.V[0])&0xfff
+    elif first_digit == 0x0c:
+        def h(m, pc):
+            x = m.RNG
+            x ^= (x << 13) & 0xffffffff
+            x ^= x >> 17
+            x ^= (x << 5) & 0xffffffff
+            m.RNG = x
+            m.V[X] = (x >> 24) & NN
+            return pc
+    elif first_digit == 0x0d:
+        def h(m, pc):
+            V = m.V
+            m.draw_sprite(V[X], V[Y], N)
+            return pc
+    elif first_digit == 0x0e:
+        if NN == 0x9e:
+            def h(m, pc): return (pc+2)&0xfff if m.KEY_BUFFER[m.V[X]&0xf] else pc
+        elif NN == 0xa1:
+            def h(m, pc): return pc if m.KEY_BUFFER[m.V[X]&0xf] else (pc+2)&0xfff
+        else:
+            return _op_nop
+    else:
+        if NN == 0x07:
+            def h(m, pc):
+                m.V[X] = m.DELAY
+                return pc
+        elif NN == 0x0a:
+            def h(m, pc):
+                m.WAITKEY = True
+                m.WAITKEY_TARGET = X
+                return pc
+        elif NN == 0x15:
+            def h(m, pc):
+                m.DELAY = m.V[X]
+                return pc
+        elif NN == 0x18:
+            def h(m, pc):
+                m.SOUND = m.V[X]
+                return pc
+        elif NN == 0x1e:
+            def h(m, pc):
+                m.I = (m.I + m.V[X]) & 0xfff
+                return pc
+        elif NN == 0x29:
+            def h(m, pc):
+                m.I = FONT_BASE + (m.V[X]%0x10) * 5
+                return pc
+        elif NN == 0x33:
+            def h(m, pc):
+                m.store_bcd(X)
+                return pc
+        elif NN == 0x55:
+            def h(m, pc):
+                I = m.I
+                if I+X < 4096:
+                    m.MEM[I:I+X+1] = m.V[:X+1]
+                else:
+                    for z in range(X+1):
+                        m.MEM[(I+z)&0xfff] = m.V[z]
+                if m.BLOCKS: m.invalidate(I, X+1)
+                if not m.SCHIP_COMPATIBLE_FLAG:
+                    m.I = (I + X + 1) & 0xfff
+                return pc
+        elif NN == 0x65:
+            def h(m, pc):
+                I = m.I
+                if I+X < 4096:
+                    m.V[:X+1] = m.MEM[I:I+X+1]
+                else:
+                    for z in range(X+1):
+                        m.V[z] = m.MEM[(I+z)&0xfff]
+                if not m.SCHIP_COMPATIBLE_FLAG:
+                    m.I = (I + X + 1) & 0xfff
+                return pc
+        else:
+            return _op_nop
+    return h
+
+OPCODE_TABLE = [_decode(instr) for instr in range(0x10000)]
+
+def load_rom(m: Chip8, p: str):
+    with open(p, 'rb') as f:
+        data = f.read()
+    data_len = len(data)
+    if ROM_BASE+data_len > 0xfff:
+        print(f'WARNING: data is {data_len} bytes, more than allowed {ROM_MAX} bytes.')
+    end_mem = min(4096, ROM_BASE+data_len)
+    print(f'Loading from 0x200 to 0x{end_mem:03X}')
+    m.load(data)
+
+
+# translated mode. a block is a straight-line run of instructions ending
+# at the first jump, call, return, skip, DXYN, or anything that writes
+# memory or waits for a key; it compiles to one Python function that
+# executes the whole run and returns the next PC. simple instructions are
+# inlined, the rest call their handler from OPCODE_TABLE.
+
+def _emit(instr: int, pc: int):
+    # returns (source lines, ends_block), or None when the instruction
+    # cannot be translated at all.
+    X = (instr>>8)&0xf; Y = (instr>>4)&0xf
+    N = instr&0xf; NN = instr&0xff; NNN = instr&0xfff
+    first_digit = instr>>12
+    nxt = (pc+2)&0xfff; skip = (pc+4)&0xfff
+    call = [f'return h_{instr:04X}(m, {nxt})'], True
+
+    if first_digit == 0:
+        if instr == 0x00e0: return [f'h_{instr:04X}(m, 0)'], False
+        elif instr == 0x00ee: return call
+        return None
+    elif first_digit == 1: return [f'return {NNN}'], True
+    elif first_digit in (2, 0x0b, 0x0e): return call
+    elif first_digit == 3: return [f'return {skip} if V[{X}] == {NN} else {nxt}'], True
+    elif first_digit == 4: return [f'return {skip} if V[{X}] != {NN} else {nxt}'], True
+    elif first_digit == 5: return [f'return {skip} if V[{X}] == V[{Y}] else {nxt}'], True
+    elif first_digit == 9: return [f'return {skip} if V[{X}] != V[{Y}] else {nxt}'], True
+    elif first_digit == 6: return [f'V[{X}] = {NN}'], False
+    elif first_digit == 7: return [f'V[{X}] = (V[{X}] + {NN}) & 0xff'], False
+    elif first_digit == 8:
+        if N == 0: return [f'V[{X}] = V[{Y}]'], False
+        elif N == 1: return [f'V[{X}] |= V[{Y}]'], False
+        elif N == 2: return [f'V[{X}] &= V[{Y}]'], False
+        elif N == 3: return [f'V[{X}] ^= V[{Y}]'], False
+        elif N == 4: return [f'r = V[{X}] + V[{Y}]', f'V[{X}] = r & 0xff; V[15] = r >> 8'], False
+        elif N == 5: return [f'r = V[{X}] - V[{Y}]', f'V[{X}] = r & 0xff; V[15] = int(r >= 0)'], False
+        elif N == 7: return [f'r = V[{Y}] - V[{X}]', f'V[{X}] = r & 0xff; V[15] = int(r >= 0)'], False
+        elif N == 6: return [f'r = V[{X}] if m.SCHIP_COMPATIBLE_FLAG else V[{Y}]', f'V[{X}] = r >> 1; V[15] = r & 0x1'], False
+        elif N == 0xe: return [f'r = V[{X}] if m.SCHIP_COMPATIBLE_FLAG else V[{Y}]', f'V[{X}] = (r << 1) & 0xff; V[15] = r >> 7'], False
+        return [], False
+    elif first_digit == 0x0a: return [f'm.I = {NNN}'], False
+    elif first_digit == 0x0c: return [f'h_{instr:04X}(m, 0)'], False
+    elif first_digit == 0x0d: return [f'm.draw_sprite(V[{X}], V[{Y}], {N})', f'return {nxt}'], True
+    else:
+        if NN == 0x07: return [f'V[{X}] = m.DELAY'], False
+        elif NN == 0x15: return [f'm.DELAY = V[{X}]'], False
+        elif NN == 0x18: return [f'm.SOUND = V[{X}]'], False
+        elif NN == 0x1e: return [f'm.I = (m.I + V[{X}]) & 0xfff'], False
+        elif NN == 0x29: return [f'm.I = {FONT_BASE} + (V[{X}] % 0x10) * 5'], False
+        elif NN == 0x65: return [f'h_{instr:04X}(m, 0)'], False
+        elif NN in (0x0a, 0x33, 0x55): return call
+        return [], False
+
+def _translate(m: Chip8, pc: int, limit: int = MAX_BLOCK_LEN):
+    # compiles and caches the block starting at pc, at most limit
+    # instructions long; returns None when the very first instruction
+    # cannot be translated. a block cut short by limit is a prefix and is
+    # cached under pc | limit << 12 so the full block can still be
+    # compiled later.
+    MEM = m.MEM
+    start = pc
+    body = []
+    ns = {}
+    length = 0
+    ended = False
+    OPS = m.OPS
+    limit = min(limit, MAX_BLOCK_LEN)
+    while length < limit and pc < 0xffe:
+        instr = (MEM[pc]<<8)|MEM[pc+1]
+        # instrumented handlers must see every execution.
+        if OPS[instr] is not OPCODE_TABLE[instr]: break
+        r = _emit(instr, pc)
+        if r is None: break
+        lines, ended = r
+        if f'h_{instr:04X}' in ''.join(lines):
+            ns[f'h_{instr:04X}'] = OPCODE_TABLE[instr]
+        body.extend(lines)
+        length += 1
+        pc += 2
+        if ended: break
+    if length == 0:
+        return None
+    if not ended:
+        body.append(f'return {pc}')
+    src = f'def block_{start:03X}(m):\n    V = m.V\n' + ''.join(f'    {l}\n' for l in body)
+    exec(compile(src, f'<block 0x{start:03X}>', 'exec'), ns)
+    b = (ns[f'block_{start:03X}'], length)
+    prefix = length == limit < MAX_BLOCK_LEN and not ended and pc < 0xffe
+    m.BLOCKS[start | limit << 12 if prefix else start] = b
+    CODE = m.CODE
+    for a in range(start, start + length * 2):
+        CODE[a] += 1
+    return b
+
+def save_state(m: Chip8, p: str):
+    with open(p, 'wb') as f:
+        f.write(m.snapshot())
+    print(f'State saved to {p}')
+
+def load_state(m: Chip8, p: str):
+    try:
+        with open(p, 'rb') as f:
+            m.restore(f.read())
+    except Exception as e:
+        print(f'Cannot load state from {p}: {e}')
+        return
+    print(f'State loaded from {p}')
@@ -0,0 +1,161 @@
+# Breakpoints and watchpoints that cost nothing until they trigger.
+#
+# Nothing is checked per instruction. Instead the debugger gives the
+# machine its own copy of the dispatch table (Chip8.OPS) in which only the
+# handlers that can trigger are wrapped:
+#     - for a breakpoint, the opcode currently stored at its address;
+#       the wrapper compares the PC against the breakpoint set;
+#     - for watchpoints, every FX55 and FX33; the wrapper checks the bytes
+#       they wrote against the watched addresses.
+# A wrapper that triggers raises chip8.Break, which run()/step() let
+# through after saving PC and CYCLES. Every other opcode keeps the stock
+# handler, and in translated mode keeps being compiled into blocks, so a
+# session with a few breakpoints runs at practically full speed.
+#
+# The opcode at a breakpoint is looked up when the table is rebuilt, i.e.
+# whenever breakpoints change and on every resume(); code rewritten while
+# running is only seen at the next rebuild.
+#
+# Conditions are Python expressions over V0..VF, I, PC, SP, DELAY and
+# SOUND, e.g. 'V3 == 5 and I > 0x300'.
+
+import chip8
+import disasm
+
+CONDITION_NAMES = frozenset(
+    [f'V{i:X}' for i in range(16)] + ['I', 'PC', 'SP', 'DELAY', 'SOUND']
+)
+
+
+def compile_condition(expr: str):
+    code = compile(expr, '<condition>', 'eval')
+    bad = set(code.co_names) - CONDITION_NAMES
+    if bad:
+        raise Exception(f'Unknown name(s) in condition: {", ".join(sorted(bad))}')
+    return code
+
+
+def machine_names(m: chip8.Chip8) -> dict:
+    res = {f'V{i:X}': v for i, v in enumerate(m.V)}
+    res.update(I=m.I, PC=m.PC, SP=m.SP, DELAY=m.DELAY, SOUND=m.SOUND)
+    return res
+
+
+def dump(m: chip8.Chip8) -> str:
+    # the register dump the tkinter debug prompt has always shown.
+    MEM = m.MEM; V = m.V; PC = m.PC
+    table = disasm.decode_table()
+    instr = (MEM[PC]<<8)|MEM[(PC+1)&0xfff]
+    text = table[instr] or '<UNSPECIFIED>'
+    if instr >> 12 in disasm.SKIP_OPS and PC < 4094:
+        text += f': {table[(MEM[PC+2]<<8)|MEM[PC+3]] or "<UNSPECIFIED>"}'
+    return '\n'.join([
+        f'PC=0x{PC:04X} [{instr:04X}] {text}',
+        f'I={m.I:04X} DELAY={m.DELAY:04X} SOUND={m.SOUND:04X}',
+        ' '.join([f'V{i:01X}=0x{V[i]:02X}({V[i]})' for i in range(0, 8)]),
+        ' '.join([f'V{i:01X}=0x{V[i]:02X}({V[i]})' for i in range(8, 16)]),
+        f'SP: {m.SP} STK: {m.STK}',
+    ])
+
+
+class Debugger:
+    __slots__ = ('m', 'breakpoints', 'watch', 'watched', 'skip', 'hits')
+
+    def __init__(self, m: chip8.Chip8):
+        self.m = m
+        # address -> (condition source or None, compiled condition or None)
+        self.breakpoints = {}
+        # watched addresses, and the same as a 4096-byte mask.
+        self.watch = set()
+        self.watched = bytearray(4096)
+        # a breakpoint address to step over once, set by resume().
+        self.skip = None
+        self.hits = 0
+
+    def set_breakpoint(self, addr: int, condition: str = None):
+        addr &= 0xfff
+        self.breakpoints[addr] = (condition, compile_condition(condition) if condition else None)
+        self.rebuild()
+
+    def clear_breakpoint(self, addr: int):
+        self.breakpoints.pop(addr & 0xfff, None)
+        self.rebuild()
+
+    def set_watchpoint(self, addr: int, length: int = 1):
+        for a in range(addr, addr + length):
+            self.watch.add(a & 0xfff)
+            self.watched[a & 0xfff] = 1
+        self.rebuild()
+
+    def clear_watchpoint(self, addr: int, length: int = 1):
+        for a in range(addr, addr + length):
+            self.watch.discard(a & 0xfff)
+            self.watched[a & 0xfff] = 0
+        self.rebuild()
+
+    def resume(self):
+        # call before running again after a Break: steps over the
+        # breakpoint the machine is sitting on instead of hitting it again.
+        self.skip = self.m.PC if self.m.PC in self.breakpoints else None
+        self.rebuild()
+
+    def detach(self):
+        self.breakpoints.clear()
+        self.watch.clear()
+        self.watched = bytearray(4096)
+        self.rebuild()
+
+    def rebuild(self):
+        m = self.m
+        stock = chip8.OPCODE_TABLE
+        if not self.breakpoints and not self.watch:
+            ops = stock
+        else:
+            ops = list(stock)
+            if self.watch:
+                for X in range(16):
+                    ops[0xf055 | (X << 8)] = self._watch_handler(stock[0xf055 | (X << 8)], X + 1)
+                    ops[0xf033 | (X << 8)] = self._watch_handler(stock[0xf033 | (X << 8)], 3)
+            for instr in {(m.MEM[a]<<8)|m.MEM[(a+1)&0xfff] for a in self.breakpoints}:
+                ops[instr] = self._break_handler(ops[instr])
+        if ops is not m.OPS:
+            m.OPS = ops
+            # blocks compiled earlier may contain opcodes that are now
+            # instrumented.
+            if m.BLOCKS:
+                m.flush_blocks()
+
+    def _break_handler(self, h):
+        breakpoints = self.breakpoints
+        def b(m, pc):
+            a = (pc-2)&0xfff
+            if a in breakpoints:
+                if a == self.skip:
+                    self.skip = None
+                else:
+                    cond = breakpoints[a][1]
+                    if cond is None or eval(cond, {'__builtins__': {}}, machine_names(m)):
+                        self.hits += 1
+                        raise chip8.Break(f'breakpoint at 0x{a:03X}', a, 0)
+            return h(m, pc)
+        return b
+
+    def _watch_handler(self, h, length: int):
+        watched = self.watched
+        def w(m, pc):
+            I = m.I
+            pc = h(m, pc)
+            if any(watched[I:I+length]) or (I + length > 4096 and any(watched[:(I+length)&0xfff])):
+                hit = [a & 0xfff for a in range(I, I + length) if watched[a & 0xfff]]
+                self.hits += 1
+                raise chip8.Break(f'write to {", ".join(f"0x{a:03X}" for a in hit)} at 0x{(pc-2)&0xfff:03X}', pc, 1)
+            return pc
+        return w
+
+    def describe(self) -> str:
+        res = []
+        for a, (cond, _) in sorted(self.breakpoints.items()):
+            res.append(f'break 0x{a:03X}' + (f' if {cond}' if cond else ''))
+        for a in sorted(self.watch):
+            res.append(f'watch 0x{a:03X}')
+        return '\n'.join(res) if res else 'no breakpoints'
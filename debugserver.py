@@ -0,0 +1,291 @@
+# Remote debug server: lets tools drive a running emulator over a local
+# socket instead of the stdin prompt.
+#
+# The server listens on a local TCP port (or a Unix socket path) and reads
+# commands in a background thread, one thread per client. Commands are only
+# queued there; the emulator's main loop calls poll() between frames, which
+# runs them against the machine and answers, so the core is never touched
+# from another thread. While the machine runs, breakpoints and watchpoints
+# cost nothing (debugger.py).
+#
+# The protocol is line based. Numbers are hex without prefix, byte strings
+# are hex. Every command gets exactly one reply line, 'OK [payload]' or
+# 'ERR message'; lines starting with '*' are events that can arrive at any
+# time, currently only '* stopped PC reason' when the machine pauses on its
+# own.
+#
+#     regs                          OK PC=200 I=000 SP=0 DELAY=00 SOUND=00 V=<16 bytes> STK=<16 words> CYCLES=.. FRAMES=..
+#     setregs NAME=VALUE ...        NAME is V0..VF, V (all 16 at once), I, PC, SP, DELAY or SOUND
+#     read ADDR LEN                 OK <bytes>
+#     write ADDR BYTES              OK LEN
+#     screen                        OK <256 bytes, see Chip8.SCREEN>
+#     break ADDR [COND]             COND as in debugger.compile_condition
+#     clear ADDR
+#     watch ADDR [LEN] / unwatch ADDR [LEN]
+#     list                          OK break 0x200; watch 0x300; ...
+#     step [N]                      OK PC REASON, after up to N instructions
+#     continue                      OK; later '* stopped PC REASON'
+#     pause                         OK PC
+#     key K 0|1                     press or release key K
+#     status                        OK paused|running PC CYCLES FRAMES
+#
+# The machine starts paused so a tool can set breakpoints before anything
+# runs.
+
+import os
+import queue
+import socket
+import threading
+import chip8
+import debugger
+
+DEBUG_HOST = '127.0.0.1'
+DEBUG_PORT = 0xc8c9
+REGISTER_NAMES = frozenset(
+    [f'V{i:X}' for i in range(16)] + ['I', 'PC', 'SP', 'DELAY', 'SOUND']
+)
+
+
+def parse_address(s: str):
+    # a port number, or anything else as a Unix socket path.
+    try:
+        return int(s, 0)
+    except ValueError:
+        return s
+
+
+class Client:
+    __slots__ = ('conn', 'lock')
+
+    def __init__(self, conn: socket.socket):
+        self.conn = conn
+        self.lock = threading.Lock()
+
+    def send(self, line: str):
+        with self.lock:
+            try:
+                self.conn.sendall(line.encode('utf-8') + b'\n')
+            except OSError:
+                pass
+
+
+class DebugServer:
+    __slots__ = ('m', 'debugger', 'sock', 'path', 'pending', 'clients', 'paused', 'thread')
+
+    def __init__(self, m: chip8.Chip8, address=DEBUG_PORT, host: str = DEBUG_HOST):
+        self.m = m
+        self.debugger = debugger.Debugger(m)
+        if isinstance(address, str):
+            if os.path.exists(address):
+                os.unlink(address)
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.bind(address)
+            self.sock.listen()
+            self.path = address
+        else:
+            self.sock = socket.create_server((host, address))
+            self.path = None
+        self.pending = queue.Queue()
+        self.clients = []
+        self.paused = True
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+
+    def serve(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            client = Client(conn)
+            self.clients.append(client)
+            threading.Thread(target=self.read, args=(client,), daemon=True).start()
+
+    def read(self, client: Client):
+        with client.conn, client.conn.makefile('r', encoding='utf-8', errors='replace') as f:
+            try:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        self.pending.put((client, line))
+            except OSError:
+                pass
+        self.clients.remove(client)
+
+    def poll(self):
+        # answers every command queued since the last call. call between
+        # frames.
+        while True:
+            try:
+                client, line = self.pending.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                client.send('OK' + self.execute(line))
+            except Exception as e:
+                client.send(f'ERR {e}')
+
+    def stop(self, reason: str):
+        # the machine paused by itself, e.g. on chip8.Break.
+        self.paused = True
+        self.broadcast(f'* stopped {self.m.PC:03X} {reason}')
+
+    def broadcast(self, line: str):
+        for client in list(self.clients):
+            client.send(line)
+
+    def execute(self, line: str) -> str:
+        # returns the payload of the OK reply, with its leading space.
+        m = self.m
+        words = line.split(None, 3)
+        c = words[0].lower()
+        args = words[1:]
+        if c == 'regs':
+            return (
+                f' PC={m.PC:03X} I={m.I:03X} SP={m.SP:X} DELAY={m.DELAY:02X} SOUND={m.SOUND:02X}'
+                f' V={bytes(m.V).hex()} STK={"".join(f"{a:04x}" for a in m.STK)}'
+                f' CYCLES={m.CYCLES:X} FRAMES={m.FRAMES:X}'
+            )
+        elif c == 'setregs':
+            for a in line.split()[1:]:
+                name, _, value = a.partition('=')
+                name = name.upper()
+                if name == 'V':
+                    v = bytes.fromhex(value)
+                    if len(v) != 16:
+                        raise Exception('V needs 16 bytes')
+                    m.V[:] = v
+                elif name in REGISTER_NAMES:
+                    self.set_register(name, int(value, 16))
+                else:
+                    raise Exception(f'Unknown register {name}')
+            return ''
+        elif c == 'read':
+            addr, n = self.check_range(int(args[0], 16), int(args[1], 16))
+            return ' ' + bytes(m.MEM[addr:addr+n]).hex()
+        elif c == 'write':
+            data = bytes.fromhex(args[1])
+            addr, n = self.check_range(int(args[0], 16), len(data))
+            m.MEM[addr:addr+n] = data
+            m.invalidate(addr, n)
+            # a breakpoint may now sit on a different opcode.
+            if self.debugger.breakpoints:
+                self.debugger.rebuild()
+            return f' {n:X}'
+        elif c == 'screen':
+            return ' ' + bytes(m.SCREEN).hex()
+        elif c == 'break':
+            self.debugger.set_breakpoint(int(args[0], 16), line.split(None, 2)[2] if len(args) > 1 else None)
+            return ''
+        elif c == 'clear':
+            self.debugger.clear_breakpoint(int(args[0], 16))
+            return ''
+        elif c in ('watch', 'unwatch'):
+            addr, n = self.check_range(int(args[0], 16), int(args[1], 16) if len(args) > 1 else 1)
+            if c == 'watch':
+                self.debugger.set_watchpoint(addr, n)
+            else:
+                self.debugger.clear_watchpoint(addr, n)
+            return ''
+        elif c == 'list':
+            return ' ' + self.debugger.describe().replace('\n', '; ')
+        elif c == 'step':
+            n = int(args[0], 16) if args else 1
+            self.paused = True
+            self.debugger.resume()
+            reason = 'step'
+            try:
+                m.run(n)
+            except chip8.Break as e:
+                reason = e.reason
+            return f' {m.PC:03X} {reason}'
+        elif c == 'continue':
+            self.debugger.resume()
+            self.paused = False
+            return ''
+        elif c == 'pause':
+            self.paused = True
+            return f' {m.PC:03X}'
+        elif c == 'key':
+            k = int(args[0], 16) & 0xf
+            if int(args[1], 16):
+                m.key_down(k)
+            else:
+                m.key_up(k)
+            return ''
+        elif c == 'status':
+            return f' {"paused" if self.paused else "running"} {m.PC:03X} {m.CYCLES:X} {m.FRAMES:X}'
+        raise Exception(f'Unknown command {c}')
+
+    def set_register(self, name: str, v: int):
+        m = self.m
+        if name[0] == 'V':
+            m.V[int(name[1], 16)] = v & 0xff
+        elif name == 'I':
+            m.I = v & 0xfff
+        elif name == 'PC':
+            m.PC = v & 0xfff
+        elif name == 'SP':
+            m.SP = v & 0xf
+        elif name == 'DELAY':
+            m.DELAY = v & 0xff
+        elif name == 'SOUND':
+            m.SOUND = v & 0xff
+
+    @staticmethod
+    def check_range(addr: int, n: int):
+        if addr < 0 or n < 0 or addr + n > 4096:
+            raise Exception(f'Range {addr:03X}+{n:X} outside memory')
+        return addr, n
+
+    def close(self):
+        self.sock.close()
+        if self.path:
+            os.unlink(self.path)
+
+
+class DebugClient:
+    # a minimal client for scripts and test tooling. call() returns the
+    # payload of the OK reply and raises on ERR; events that arrive in
+    # between are kept in events.
+    __slots__ = ('sock', 'f', 'events')
+
+    def __init__(self, address=DEBUG_PORT, host: str = DEBUG_HOST, timeout: float = 5.0):
+        if isinstance(address, str):
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.settimeout(timeout)
+            self.sock.connect(address)
+        else:
+            self.sock = socket.create_connection((host, address), timeout=timeout)
+        self.f = self.sock.makefile('r', encoding='utf-8')
+        self.events = []
+
+    def call(self, line: str) -> str:
+        self.sock.sendall(line.encode('utf-8') + b'\n')
+        while True:
+            reply = self.next_line()
+            if reply.startswith('*'):
+                self.events.append(reply[1:].strip())
+            elif reply.startswith('OK'):
+                return reply[3:]
+            else:
+                raise Exception(reply[4:])
+
+    def wait_event(self) -> str:
+        # blocks until the next event, e.g. after 'continue'.
+        if self.events:
+            return self.events.pop(0)
+        reply = self.next_line()
+        if not reply.startswith('*'):
+            raise Exception(f'Unexpected reply {reply}')
+        return reply[1:].strip()
+
+    def next_line(self) -> str:
+        line = self.f.readline()
+        if not line:
+            raise Exception('Connection closed')
+        return line.rstrip('\n')
+
+    def close(self):
+        self.f.close()
+        self.sock.close()
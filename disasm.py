@@ -1,5 +1,12 @@
+import os
 import sys
+import glob
+import json
+import time
+import shutil
+import hashlib
 import argparse
+import concurrent.futures
 
 def disasm_s(s: str):
     if not s: return ''
@@ -9,7 +16,7 @@ def disasm_s(s: str):
     elif s[0] == '2': return f'CALL 0x{s[1:]}'
     elif s[0] == '3': return f'IF_NEQ V{s[1]},0x{s[2:]}'
     elif s[0] == '4': return f'IF_EQ V{s[1]},0x{s[2:]}'
-    elif s[0] == '5': return f'IF_NEQ V{s[1]},V{s[1]}'
+    elif s[0] == '5': return f'IF_NEQ V{s[1]},V{s[2]}'
     elif s[0] == '6': return f'LD V{s[1]},0x{s[2:]}'
     elif s[0] == '7': return f'ADD V{s[1]},0x{s[2:]}'
     elif s[0] == '8':
@@ -50,7 +57,7 @@ def disasm_octo(s: str):
     elif s[0] == '2': return f'{s[1:]}'
     elif s[0] == '3': return f'if v{s[1]} != {s[2:]} then'
     elif s[0] == '4': return f'if v{s[1]} == {s[2:]} then'
-    elif s[0] == '5': return f'if v{s[1]} != v{s[1]} then'
+    elif s[0] == '5': return f'if v{s[1]} != v{s[2]} then'
     elif s[0] == '6': return f'v{s[1]} := {s[2:]}'
     elif s[0] == '7': return f'v{s[1]} += {s[2:]}'
     elif s[0] == '8':
@@ -83,11 +90,308 @@ def disasm_octo(s: str):
         elif s[2:] == '65': return f'load v{s[1]}'
     return None
 
+# every opcode decoded once per syntax, on first use: DECODE_TABLES[octo]
+# is a list of 65536 entries, None where the opcode is not an instruction.
+# shared by the listings here and the emulators' debug/profile output.
+DECODE_TABLES = {}
+
+def decode_table(octo: bool = False) -> list:
+    t = DECODE_TABLES.get(octo)
+    if t is None:
+        f = disasm_octo if octo else disasm_s
+        t = DECODE_TABLES[octo] = [f(f'{i:04X}') for i in range(0x10000)]
+    return t
+
+def iter_sweep(data: bytes, octo: bool = False, force_opcode: bool = False):
+    # linear sweep from 0x200. yields (address, opcode, text) for an
+    # instruction, text being None for an opcode without a mnemonic (only
+    # with force_opcode), and (address, None, byte) for a byte taken as
+    # data.
+    table = decode_table(octo)
+    end = len(data) - 1
+    i = 0
+    while i <= end:
+        if i < end:
+            instr = (data[i] << 8) | data[i+1]
+            text = table[instr]
+            if text is not None or force_opcode:
+                yield 0x200+i, instr, text
+                i += 2
+                continue
+        yield 0x200+i, None, data[i]
+        i += 1
+
+def iter_listing(data: bytes, octo: bool = False, no_addr: bool = False, no_opcode: bool = False, force_opcode: bool = False):
+    # the classic listing, one line at a time.
+    data_len = len(data)
+    if 0x200+data_len > 0xfff:
+        yield f'# WARNING: data is {data_len} bytes, more than allowed {4096-0x200} bytes.'
+    yield ''
+    for i, instr, text in iter_sweep(data, octo, force_opcode):
+        if instr is None:
+            yield (
+                ('' if no_addr else f'0x{i:03X}    ')
+                + ('' if no_opcode else f'{text:02X}    ')
+                + f'$0x{text:02X}'
+            )
+        else:
+            yield (
+                ('' if no_addr else f'0x{i:03X}    ')
+                + ('' if no_opcode else f'{instr:04X}  ')
+                + (text if text else '<UNSPECIFIED>')
+            )
+
+def iter_records(data: bytes, octo: bool = False, force_opcode: bool = False):
+    # the linear sweep as dicts, for JSON Lines output.
+    for i, instr, text in iter_sweep(data, octo, force_opcode):
+        if instr is None:
+            yield {'addr': i, 'data': f'{text:02X}'}
+        else:
+            yield {'addr': i, 'opcode': f'{instr:04X}', 'text': text}
+
+def disasm_rom(data: bytes, octo: bool = False, no_addr: bool = False, no_opcode: bool = False, force_opcode: bool = False):
+    return list(iter_listing(data, octo, no_addr, no_opcode, force_opcode))
+
+# opcode kinds (top nibble) that skip the next instruction.
+SKIP_OPS = (0x3, 0x4, 0x5, 0x9, 0xe)
+# instructions that take a 12-bit address, as asm.py mnemonics.
+ADDRESS_OPS = {0x1: 'JMP', 0x2: 'CALL', 0xa: 'LDI', 0xb: 'JMPV0'}
+# bytes per $ line for data in traced listings.
+DATA_PER_LINE = 8
+
+def _valid(instr: int) -> bool:
+    if instr >> 12 == 0: return instr in (0x00e0, 0x00ee)
+    if instr >> 12 in (0x5, 0x9): return instr & 0xf == 0
+    return decode_table()[instr] is not None
+
+def trace(data: bytes, entry: int = 0x200):
+    # recursive descent from entry: follows jumps, calls, both ways out of
+    # skips and falls through everything else, decoding every address
+    # once. returns (code, targets, data_refs, indirect, invalid):
+    #     code       address -> opcode of every reachable instruction
+    #     targets    addresses jumped to or called
+    #     data_refs  ANNN operands
+    #     indirect   addresses of BNNN, whose targets are not followed
+    #     invalid    addresses where tracing ran into a bad opcode
+    end = 0x200 + len(data)
+    code = {}
+    targets = set(); data_refs = set()
+    indirect = []; invalid = []
+    work = [entry]
+    while work:
+        a = work.pop()
+        if a in code or a < 0x200 or a + 1 >= end: continue
+        instr = (data[a-0x200] << 8) | data[a-0x1ff]
+        if not _valid(instr):
+            invalid.append(a)
+            continue
+        code[a] = instr
+        op = instr >> 12; nnn = instr & 0xfff
+        if instr == 0x00ee:
+            continue
+        elif op == 0x1:
+            targets.add(nnn); work.append(nnn)
+            continue
+        elif op == 0x2:
+            targets.add(nnn); work.append(nnn)
+        elif op == 0xa:
+            data_refs.add(nnn)
+        elif op == 0xb:
+            targets.add(nnn); indirect.append(a)
+            continue
+        elif op in SKIP_OPS:
+            work.append(a+4)
+        work.append(a+2)
+    return code, targets, data_refs, sorted(indirect), sorted(invalid)
+
+def _layout(data: bytes, entry: int):
+    # what a traced listing shows where: (emitted, labels, indirect,
+    # invalid), emitted mapping address -> opcode.
+    code, targets, data_refs, indirect, invalid = trace(data, entry)
+    end = 0x200 + len(data)
+    # an instruction is emitted where one starts unless it overlaps the
+    # previous one; labels can go anywhere but the middle of one.
+    emitted = {}
+    a = 0x200
+    while a < end:
+        if a in code:
+            emitted[a] = code[a]
+            a += 2
+        else:
+            a += 1
+    inside = {a+1 for a in emitted}
+    labels = {}
+    for t in sorted(targets | data_refs):
+        if 0x200 <= t < end and t not in inside:
+            labels[t] = f'{"L" if t in code or t in targets else "D"}{t:03X}'
+    return emitted, labels, set(indirect), set(invalid)
+
+def iter_trace(data: bytes, entry: int = 0x200):
+    # listing of a recursive-descent trace in asm.py syntax: reachable
+    # code as instructions, everything else as $ data, with #labels on
+    # jump/call targets (L...) and ANNN operands (D...). assembling it
+    # gives back data byte for byte.
+    emitted, labels, indirect, invalid = _layout(data, entry)
+    end = 0x200 + len(data)
+    yield f'; traced from 0x{entry:03X}: {2*len(emitted)} bytes of code, {len(data)-2*len(emitted)} bytes of data'
+    yield f'; {len(indirect)} indirect jump(s), {len(invalid)} bad opcode(s) reached'
+    yield ''
+    yield '@200'
+    table = decode_table()
+    row = []
+    a = 0x200
+    while a < end:
+        if row and (a in labels or a in invalid or a in emitted or len(row) == DATA_PER_LINE):
+            yield '$' + ', '.join(row)
+            row.clear()
+        if a in labels:
+            yield f'#{labels[a]}'
+        if a in invalid:
+            yield '; bad opcode reached here, tracing stopped'
+        if a in emitted:
+            instr = emitted[a]
+            op = instr >> 12; nnn = instr & 0xfff
+            if a in indirect:
+                yield '; indirect jump, targets not followed'
+            if op in ADDRESS_OPS and nnn in labels:
+                yield f'    {ADDRESS_OPS[op]} #{labels[nnn]}'
+            else:
+                yield f'    {table[instr]}'
+            a += 2
+        else:
+            row.append(f'0x{data[a-0x200]:02X}')
+            a += 1
+    if row:
+        yield '$' + ', '.join(row)
+
+def iter_trace_records(data: bytes, entry: int = 0x200):
+    # the same trace as dicts, for JSON Lines output.
+    emitted, labels, indirect, invalid = _layout(data, entry)
+    table = decode_table()
+    end = 0x200 + len(data)
+    a = 0x200
+    while a < end:
+        if a in emitted:
+            instr = emitted[a]
+            r = {'addr': a, 'opcode': f'{instr:04X}', 'text': table[instr]}
+            size = 2
+        else:
+            r = {'addr': a, 'data': f'{data[a-0x200]:02X}'}
+            size = 1
+        if a in labels: r['label'] = labels[a]
+        if a in indirect: r['indirect'] = True
+        if a in invalid: r['invalid'] = True
+        yield r
+        a += size
+
+def disasm_trace(data: bytes, entry: int = 0x200):
+    return list(iter_trace(data, entry))
+
+def write_lines(f, lines):
+    # streams lines to f, newline-separated as the listings always were.
+    sep = ''
+    for line in lines:
+        f.write(sep)
+        f.write(line)
+        sep = '\n'
+
+def write_jsonl(f, records):
+    for r in records:
+        f.write(json.dumps(r))
+        f.write('\n')
+
+# batch mode.
+#
+# opts is a dict of the output options below. With --cache DIR the whole
+# output file of each ROM (the .lst listing or the .jsonl records, exactly
+# as written next to the ROM) is also kept in DIR, one flat file per entry
+# named by cache_key(): the SHA-256 of the ROM bytes, then CACHE_VERSION and
+# the names of the OPTIONS that are set. A hit copies that file to the
+# output instead of disassembling.
+#
+# Nothing is ever invalidated in place: the key is content-addressed, so a
+# changed ROM or a different option set simply hashes to a new entry, and
+# the ROM's name or location plays no part (renamed or duplicated ROMs
+# share an entry). When the disassembler's output for the same input
+# changes, CACHE_VERSION is bumped so every old key misses. Old entries are
+# not evicted; delete DIR to reclaim the space.
+OPTIONS = ('octo', 'no_addr', 'no_opcode', 'force_opcode', 'trace', 'jsonl')
+# bump when the output for the same ROM and options changes.
+CACHE_VERSION = 1
+# what a directory argument picks up.
+ROM_EXTENSIONS = ('.ch8', '.c8')
+
+def write_output(f, data: bytes, opts: dict):
+    if opts['jsonl']:
+        write_jsonl(f, iter_trace_records(data) if opts['trace'] else iter_records(data, opts['octo'], opts['force_opcode']))
+    elif opts['trace']:
+        write_lines(f, iter_trace(data))
+    else:
+        write_lines(f, iter_listing(data, opts['octo'], opts['no_addr'], opts['no_opcode'], opts['force_opcode']))
+
+def output_path(p: str, opts: dict) -> str:
+    return f'{p}.{"jsonl" if opts["jsonl"] else "lst"}'
+
+def cache_key(data: bytes, opts: dict) -> str:
+    h = hashlib.sha256(data)
+    h.update(f'|v{CACHE_VERSION}|'.encode())
+    h.update(','.join(k for k in OPTIONS if opts[k]).encode())
+    return h.hexdigest()
+
+def disasm_file(p: str, out: str, opts: dict, cache: str = None) -> dict:
+    # runs in a worker process for batches.
+    t = time.perf_counter()
+    hit = False
+    error = None
+    size = 0
+    try:
+        with open(p, 'rb') as f:
+            data = f.read()
+        size = len(data)
+        cached = os.path.join(cache, cache_key(data, opts)) if cache is not None else None
+        if cached is not None and os.path.exists(cached):
+            shutil.copyfile(cached, out)
+            hit = True
+        else:
+            with open(out, 'w') as f:
+                write_output(f, data, opts)
+            if cached is not None:
+                os.makedirs(cache, exist_ok=True)
+                # copy, then rename, so a crashed run leaves no partial entry.
+                shutil.copyfile(out, cached + '.tmp')
+                os.replace(cached + '.tmp', cached)
+    except Exception as e:
+        error = f'{type(e).__name__}: {e}'
+    return {'path': p, 'out': out, 'bytes': size, 'hit': hit, 'error': error, 'wall': time.perf_counter() - t}
+
+def expand(patterns: list) -> list:
+    # files as given, directories searched recursively for ROM_EXTENSIONS,
+    # anything else as a glob (** included).
+    res = []
+    for pat in patterns:
+        if os.path.isdir(pat):
+            for root, _, files in os.walk(pat):
+                res.extend(os.path.join(root, f) for f in sorted(files) if f.lower().endswith(ROM_EXTENSIONS))
+        elif os.path.exists(pat):
+            res.append(pat)
+        else:
+            res.extend(sorted(glob.glob(pat, recursive=True)))
+    return res
+
+def batch(paths: list, opts: dict, cache: str = None, jobs: int = None) -> list:
+    outs = [output_path(p, opts) for p in paths]
+    if len(paths) == 1:
+        return [disasm_file(paths[0], outs[0], opts, cache)]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+        return list(pool.map(disasm_file, paths, outs, [opts] * len(paths), [cache] * len(paths)))
+
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='CHIP-8 ROM Disassembler.')
     parser.add_argument('file',
         type=str,
+        nargs='+',
+        help='ROMs, directories (searched for .ch8/.c8) or globs.',
     )
     parser.add_argument('--octo',
         action='store_true',
@@ -105,36 +409,60 @@ if __name__ == '__main__':
         action='store_true',
         help='Assume all data are opcodes regardless of validity.'
     )
+    parser.add_argument('--trace',
+        action='store_true',
+        help='Only decode code reachable from 0x200; write the rest as data, in asm.py syntax with labels.',
+    )
+    parser.add_argument('--jsonl',
+        action='store_true',
+        help='Write one JSON object per instruction or data byte instead of a listing.',
+    )
+    parser.add_argument('-o', '--output',
+        type=str,
+        default=None,
+        help='For a single ROM, write here instead of <file>.lst (<file>.jsonl with --jsonl); - for stdout.',
+    )
+    parser.add_argument('--cache',
+        type=str,
+        default=None,
+        help='Keep outputs in this directory, keyed by the SHA-256 of the ROM and the options, and reuse them.',
+    )
+    parser.add_argument('-j', '--jobs',
+        type=int,
+        default=None,
+        help='Worker processes for several ROMs (default: one per CPU).',
+    )
     cmd = parser.parse_args(sys.argv[1:])
-    p = cmd.file
-    with open(p, 'rb') as f:
-        data = f.read()
-    data_len = len(data)
-    res = []
-    if 0x200+data_len > 0xfff:
-        res.append(f'# WARNING: data is {data_len} bytes, more than allowed {4096-0x200} bytes.')
-    res.append('')
-
-    i = 0x200
-    while i-0x200 < data_len:
-        s = f'{data[i-0x200]:02X}{data[i+1-0x200]:02X}'
-        disasm_res = (disasm_octo if cmd.octo else disasm_s)(s)
-        if disasm_res is None and not cmd.force_opcode:
-            res.append(
-                ('' if cmd.no_addr else f'0x{i:03X}    ')
-                + ('' if cmd.no_opcode else f'{data[i-0x200]:02X}    ')
-                + f'$0x{data[i-0x200]:02X}'
-            )
-            i += 1
-        else:
-            disasm_res = disasm_res if disasm_res else '<UNSPECIFIED>'
-            res.append(
-                ('' if cmd.no_addr else f'0x{i:03X}    ')
-                + ('' if cmd.no_opcode else f'{s}  ')
-                + f'{disasm_res}'
-            )
-            i += 2
+    opts = {k: getattr(cmd, k) for k in OPTIONS}
+    paths = expand(cmd.file)
+    if not paths:
+        print('No ROMs found.')
+        sys.exit(1)
+    if cmd.output == '-':
+        if len(paths) > 1:
+            parser.error('-o - takes a single ROM')
+        with open(paths[0], 'rb') as f:
+            write_output(sys.stdout, f.read(), opts)
+        sys.exit(0)
+    if cmd.output is not None:
+        if len(paths) > 1:
+            parser.error('-o takes a single ROM')
+        t = time.perf_counter()
+        results = [disasm_file(paths[0], cmd.output, opts, cmd.cache)]
+    else:
+        t = time.perf_counter()
+        results = batch(paths, opts, cmd.cache, cmd.jobs)
+    wall = time.perf_counter() - t
 
-    res_text = '\n'.join(res)
-    with open(f'{p}.lst', 'w') as f:
-        f.write(res_text)
+    failed = 0
+    for r in results:
+        if r['error']:
+            print(f"FAIL {r['path']}: {r['error']}")
+            failed += 1
+    hits = sum(1 for r in results if r['hit'])
+    total = sum(r['bytes'] for r in results)
+    print(
+        f'{len(results)} ROM(s): {hits} cached, {len(results) - hits - failed} disassembled, {failed} failed; '
+        f'{total:,} bytes in {wall:.3f}s ({total / wall / 1024 if wall else 0:,.0f} KiB/s)'
+    )
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,233 @@
+# Gym-style environments over the headless core, for training agents.
+#
+# Env wraps one Chip8. Observations are the framebuffer itself as a
+# (32, 8) uint8 NumPy view of Chip8.SCREEN (one bit per pixel, MSB is the
+# leftmost); nothing is copied, so an observation changes as the machine
+# runs -- copy it to keep it. pixels() unpacks it to (32, 64).
+#
+#     e = Env(rom)
+#     obs, info = e.reset(seed=1)
+#     obs, reward, terminated, truncated, info = e.step([4, 6], frameskip=4)
+#
+# Actions are the keys held down during the step, as an iterable of key
+# numbers or a 16-bit mask. Rewards come from an optional reward(m)
+# callable (default 0.0); an episode terminates when the program crashes
+# (an exception in the core). clone_state()/restore_state() are
+# Chip8.snapshot()/restore().
+#
+# VectorEnv runs n environments split over worker processes. Each worker
+# copies its framebuffers into one shared memory block after every call,
+# and the (n, 32, 8) observation array is a view on that block, so frames
+# never go through a pipe; only actions and infos do. The block is only
+# freed by close(), so use it as a context manager:
+#
+#     with VectorEnv(rom, 8) as v:
+#         obs, infos = v.reset(seed=1)
+
+import os
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+import chip8
+
+FRAME_BYTES = chip8.ROW_BYTES * chip8.SCREEN_HEIGHT
+
+
+def pixels(obs: np.ndarray) -> np.ndarray:
+    # (..., 32, 8) bitplanes -> (..., 32, 64) of 0/1.
+    return np.unpackbits(obs, axis=-1)
+
+
+def key_mask(action_keys) -> int:
+    if isinstance(action_keys, (int, np.integer)):
+        return int(action_keys) & 0xffff
+    res = 0
+    for k in action_keys:
+        res |= 1 << (k & 0xf)
+    return res
+
+
+class Env:
+    __slots__ = ('rom', 'm', 'obs', 'reward', 'terminated', 'error')
+
+    def __init__(self, rom, reward=None, **kwargs):
+        # rom is the program or a path to it; kwargs go to Chip8.
+        if isinstance(rom, str):
+            with open(rom, 'rb') as f:
+                rom = f.read()
+        self.rom = bytes(rom[:chip8.ROM_MAX])
+        self.m = chip8.Chip8(**kwargs)
+        self.reward = reward
+        self.reset()
+
+    def reset(self, seed: int = None):
+        m = self.m
+        if seed is not None:
+            m.SEED = seed
+        m.MEM[chip8.ROM_BASE:] = bytes(chip8.ROM_MAX)
+        m.reset()
+        m.load(self.rom)
+        # reset() replaces SCREEN, so the view is made again here; every
+        # other write to it is in place.
+        self.obs = np.frombuffer(m.SCREEN, np.uint8).reshape(chip8.SCREEN_HEIGHT, chip8.ROW_BYTES)
+        self.terminated = False
+        self.error = None
+        return self.obs, self.info()
+
+    def step(self, action_keys=(), frameskip: int = 1):
+        m = self.m
+        if self.terminated:
+            return self.obs, 0.0, True, False, self.info()
+        keys = key_mask(action_keys)
+        for k in range(16):
+            down = (keys >> k) & 1
+            if down != m.KEY_BUFFER[k]:
+                if down: m.key_down(k)
+                else: m.key_up(k)
+        try:
+            for _ in range(frameskip):
+                m.run_until_frame()
+        except Exception as e:
+            self.terminated = True
+            self.error = str(e)
+        reward = self.reward(m) if self.reward else 0.0
+        return self.obs, reward, self.terminated, False, self.info()
+
+    def info(self) -> dict:
+        m = self.m
+        res = {'pc': m.PC, 'cycles': m.CYCLES, 'frames': m.FRAMES, 'waitkey': m.WAITKEY}
+        if self.error:
+            res['error'] = self.error
+        return res
+
+    def clone_state(self) -> bytes:
+        return self.m.snapshot()
+
+    def restore_state(self, state: bytes):
+        self.m.restore(state)
+        self.terminated = False
+        self.error = None
+
+
+def _worker(conn, shm_name: str, first: int, count: int, rom: bytes, reward, kwargs: dict):
+    # serves envs first..first+count-1 of a VectorEnv until 'close'.
+    shm = shared_memory.SharedMemory(name=shm_name)
+    buf = shm.buf
+    envs = [Env(rom, reward, **kwargs) for _ in range(count)]
+    def publish():
+        for i, e in enumerate(envs):
+            o = (first + i) * FRAME_BYTES
+            buf[o:o+FRAME_BYTES] = e.m.SCREEN
+    try:
+        while True:
+            cmd, args = conn.recv()
+            if cmd == 'reset':
+                res = [e.reset(s)[1] for e, s in zip(envs, args)]
+            elif cmd == 'step':
+                actions, frameskip = args
+                res = [e.step(a, frameskip)[1:] for e, a in zip(envs, actions)]
+            elif cmd == 'clone':
+                res = [e.clone_state() for e in envs]
+            elif cmd == 'restore':
+                res = [e.restore_state(s) for e, s in zip(envs, args)]
+            else:
+                break
+            publish()
+            conn.send(res)
+    finally:
+        del buf
+        shm.close()
+        conn.close()
+
+
+class VectorEnv:
+    __slots__ = ('n', 'shm', 'obs', 'workers', 'slices')
+
+    def __init__(self, rom, n: int, workers: int = None, reward=None, **kwargs):
+        # reward must be picklable (a module-level function) to reach the
+        # workers.
+        if isinstance(rom, str):
+            with open(rom, 'rb') as f:
+                rom = f.read()
+        self.n = n
+        self.shm = shared_memory.SharedMemory(create=True, size=n * FRAME_BYTES)
+        self.workers = []
+        self.slices = []
+        try:
+            self.obs = np.ndarray((n, chip8.SCREEN_HEIGHT, chip8.ROW_BYTES), np.uint8, buffer=self.shm.buf)
+            self.obs[:] = 0
+            workers = max(1, min(n, workers or os.cpu_count() or 1))
+            first = 0
+            for w in range(workers):
+                count = n // workers + (w < n % workers)
+                parent, child = multiprocessing.Pipe()
+                p = multiprocessing.Process(
+                    target=_worker,
+                    args=(child, self.shm.name, first, count, bytes(rom), reward, kwargs),
+                    daemon=True,
+                )
+                p.start()
+                child.close()
+                self.workers.append((p, parent))
+                self.slices.append((first, first + count))
+                first += count
+        except BaseException:
+            # the segment outlives the process unless unlinked.
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def call(self, cmd: str, per_env=None, shared=None) -> list:
+        # sends cmd to every worker with its slice of per_env (or shared
+        # as is), and gathers the replies in env order.
+        for (_, conn), (a, b) in zip(self.workers, self.slices):
+            conn.send((cmd, per_env[a:b] if per_env is not None else shared))
+        res = []
+        for _, conn in self.workers:
+            res += conn.recv()
+        return res
+
+    def reset(self, seed=None):
+        # seed: one per env, an int (env k gets seed + k) or None.
+        if seed is None or isinstance(seed, int):
+            seed = [None if seed is None else seed + k for k in range(self.n)]
+        return self.obs, self.call('reset', list(seed))
+
+    def step(self, actions, frameskip: int = 1):
+        res = []
+        for (_, conn), (a, b) in zip(self.workers, self.slices):
+            conn.send(('step', ([key_mask(k) for k in actions[a:b]], frameskip)))
+        for _, conn in self.workers:
+            res += conn.recv()
+        rewards = np.array([r[0] for r in res], np.float64)
+        terminated = np.array([r[1] for r in res], bool)
+        truncated = np.zeros(self.n, bool)
+        return self.obs, rewards, terminated, truncated, [r[3] for r in res]
+
+    def clone_state(self) -> list:
+        return self.call('clone')
+
+    def restore_state(self, states: list):
+        self.call('restore', list(states))
+
+    def close(self):
+        # safe to call more than once.
+        for p, conn in self.workers:
+            try:
+                conn.send(('close', None))
+            except OSError:
+                pass
+            p.join()
+            conn.close()
+        self.workers = []
+        if self.shm is None:
+            return
+        self.obs = None
+        self.shm.close()
+        self.shm.unlink()
+        self.shm = None
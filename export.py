@@ -0,0 +1,316 @@
+# Headless screenshot and video export.
+#
+# Runs a ROM headless for N frames and writes what it shows as a PNG
+# sequence, an animated GIF, or a raw rgb24 stream for ffmpeg. No display
+# server or imaging library is needed.
+#
+#     python export.py ROM -o shots/%05d.png [-n 600] [--scale 10]
+#     python export.py ROM -o attract.gif [--log LOG]
+#     python export.py ROM -o - --format rgb24 | ffmpeg -f rawvideo -pix_fmt rgb24 -s 640x320 -r 60 -i - out.mp4
+#     python export.py ROM -o title.png --screenshot -n 120
+#
+# Consecutive identical frames are coalesced: each distinct frame is
+# scaled and encoded once, with a duration. A GIF frame gets that duration
+# as its delay; a PNG file is named after the frame it first appears on,
+# so the durations can be read off the names. rgb24 is a constant-rate
+# stream, so there the already-scaled frame is written out again.
+#
+# Scaling is done per framebuffer row: a lookup table maps each byte to
+# its 8 scaled pixels, and a scaled row is reused for every row that holds
+# the same 8 bytes.
+
+import os
+import sys
+import time
+import zlib
+import struct
+import argparse
+import chip8
+import replay
+
+SCALE = 10
+FORMATS = ('png', 'gif', 'rgb24')
+PIXEL_ON = (0xff, 0xff, 0xff)
+PIXEL_OFF = (0x00, 0x00, 0x00)
+# GIF delays are in 1/100s.
+GIF_TICKS = 100
+GIF_MAX_CODE = 4096
+
+
+class Scaler:
+    # turns SCREEN rows into scaled pixel rows, `on`/`off` bytes per pixel.
+    __slots__ = ('scale', 'lut', 'rows')
+
+    def __init__(self, scale: int, on: bytes, off: bytes):
+        self.scale = scale
+        self.lut = [
+            b''.join(on * scale if b & (0x80 >> i) else off * scale for i in range(8))
+            for b in range(256)
+        ]
+        # 8 framebuffer bytes -> one scaled pixel row.
+        self.rows = {}
+
+    def row(self, screen: bytes, y: int) -> bytes:
+        o = y * chip8.ROW_BYTES
+        key = screen[o:o+chip8.ROW_BYTES]
+        r = self.rows.get(key)
+        if r is None:
+            lut = self.lut
+            r = self.rows[key] = b''.join([lut[b] for b in key])
+        return r
+
+    def image(self, screen: bytes, y0: int = 0, y1: int = chip8.SCREEN_HEIGHT) -> bytes:
+        # rows y0..y1-1, each repeated scale times.
+        scale = self.scale
+        return b''.join([self.row(screen, y) * scale for y in range(y0, y1)])
+
+
+def frames(m: chip8.Chip8, n: int, log: replay.InputLog = None):
+    # yields (SCREEN, frame it first appeared on, frames shown) with
+    # consecutive identical frames coalesced.
+    events = log.events if log else []
+    i = 0
+    shown = None; start = 0
+    for frame in range(m.FRAMES, m.FRAMES + n):
+        while i < len(events) and events[i][0] <= frame:
+            _, k, down = events[i]
+            if down: m.key_down(k)
+            else: m.key_up(k)
+            i += 1
+        m.run_until_frame()
+        if shown is not None and not m.DIRTY:
+            continue
+        m.DIRTY = False
+        screen = bytes(m.SCREEN)
+        if screen == shown:
+            continue
+        if shown is not None:
+            yield shown, start, frame - start
+        shown = screen; start = frame
+    if shown is not None:
+        yield shown, start, m.FRAMES - start
+
+
+def _chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+
+def png_bytes(scaler: Scaler, screen: bytes) -> bytes:
+    # 8-bit palette image; every row uses filter 0.
+    w = chip8.SCREEN_WIDTH * scaler.scale
+    h = chip8.SCREEN_HEIGHT * scaler.scale
+    scale = scaler.scale
+    data = b''.join([(b'\x00' + scaler.row(screen, y)) * scale for y in range(chip8.SCREEN_HEIGHT)])
+    return b''.join((
+        b'\x89PNG\r\n\x1a\n',
+        _chunk(b'IHDR', struct.pack('>IIBBBBB', w, h, 8, 3, 0, 0, 0)),
+        _chunk(b'PLTE', bytes(PIXEL_OFF + PIXEL_ON)),
+        _chunk(b'IDAT', zlib.compress(data, 6)),
+        _chunk(b'IEND', b''),
+    ))
+
+
+def lzw(data: bytes, min_size: int) -> bytes:
+    # GIF-flavoured LZW: variable code width, LSB-first bit packing.
+    clear = 1 << min_size; eoi = clear + 1
+    out = bytearray()
+    acc = 0; nbits = 0
+    size = min_size + 1
+    table = {bytes([i]): i for i in range(clear)}
+    nxt = eoi + 1
+    acc |= clear << nbits; nbits += size
+    w = b''
+    for c in data:
+        wc = w + bytes((c,)) if w else bytes((c,))
+        if wc in table:
+            w = wc
+            continue
+        acc |= table[w] << nbits; nbits += size
+        while nbits >= 8:
+            out.append(acc & 0xff); acc >>= 8; nbits -= 8
+        if nxt == GIF_MAX_CODE:
+            acc |= clear << nbits; nbits += size
+            table = {bytes([i]): i for i in range(clear)}
+            nxt = eoi + 1
+            size = min_size + 1
+        else:
+            table[wc] = nxt
+            if nxt == 1 << size:
+                size += 1
+            nxt += 1
+        w = bytes((c,))
+    if w:
+        acc |= table[w] << nbits; nbits += size
+    acc |= eoi << nbits; nbits += size
+    while nbits > 0:
+        out.append(acc & 0xff); acc >>= 8; nbits -= 8
+    return bytes(out)
+
+
+class GifWriter:
+    # each frame only re-encodes the band of rows that changed since the
+    # previous one; the rest is left in place (disposal method 1).
+    __slots__ = ('f', 'scaler', 'shown', 'frames', 'ticks')
+
+    def __init__(self, f, scale: int):
+        self.f = f
+        self.scaler = Scaler(scale, b'\x01', b'\x00')
+        self.shown = None
+        # frames written so far and delay ticks handed out for them, so
+        # rounding does not drift.
+        self.frames = 0
+        self.ticks = 0
+        w = chip8.SCREEN_WIDTH * scale
+        h = chip8.SCREEN_HEIGHT * scale
+        f.write(b'GIF89a' + struct.pack('<HHBBB', w, h, 0x80, 0, 0) + bytes(PIXEL_OFF + PIXEL_ON))
+        # loop forever.
+        f.write(b'\x21\xff\x0bNETSCAPE2.0\x03\x01\x00\x00\x00')
+
+    def add(self, screen: bytes, count: int):
+        rb = chip8.ROW_BYTES
+        y0 = 0; y1 = chip8.SCREEN_HEIGHT
+        if self.shown is not None:
+            changed = [y for y in range(y1) if screen[y*rb:y*rb+rb] != self.shown[y*rb:y*rb+rb]]
+            y0 = changed[0]; y1 = changed[-1] + 1
+        self.shown = screen
+        self.frames += count
+        ticks = round(self.frames * GIF_TICKS / chip8.FRAME_RATE)
+        delay = ticks - self.ticks
+        self.ticks = ticks
+        scale = self.scaler.scale
+        data = lzw(self.scaler.image(screen, y0, y1), 2)
+        self.f.write(b''.join((
+            struct.pack('<BBBBHBB', 0x21, 0xf9, 4, 0x04, delay, 0, 0),
+            struct.pack('<BHHHHB', 0x2c, 0, y0 * scale, chip8.SCREEN_WIDTH * scale, (y1 - y0) * scale, 0),
+            b'\x02',
+            b''.join([bytes((len(data[i:i+255]),)) + data[i:i+255] for i in range(0, len(data), 255)]),
+            b'\x00',
+        )))
+
+    def close(self):
+        self.f.write(b'\x3b')
+
+
+def png_path(out: str, frame: int) -> str:
+    if '%' in out:
+        return out % frame
+    return os.path.join(out, f'{frame:05d}.png')
+
+
+def export(m: chip8.Chip8, n: int, out: str, fmt: str, scale: int = SCALE, log: replay.InputLog = None, screenshot: bool = False) -> dict:
+    # returns counts for the summary line.
+    stats = {'frames': 0, 'distinct': 0, 'bytes': 0}
+    if fmt == 'png':
+        scaler = Scaler(scale, b'\x01', b'\x00')
+        if '%' not in out and not screenshot:
+            os.makedirs(out, exist_ok=True)
+        last = None
+        for screen, start, count in frames(m, n, log):
+            stats['frames'] += count; stats['distinct'] += 1
+            if screenshot:
+                last = screen
+                continue
+            data = png_bytes(scaler, screen)
+            with open(png_path(out, start), 'wb') as f:
+                f.write(data)
+            stats['bytes'] += len(data)
+        if last is not None:
+            data = png_bytes(scaler, last)
+            with open(out, 'wb') as f:
+                f.write(data)
+            stats['bytes'] += len(data)
+    elif fmt == 'gif':
+        with open(out, 'wb') as f:
+            g = GifWriter(f, scale)
+            for screen, start, count in frames(m, n, log):
+                stats['frames'] += count; stats['distinct'] += 1
+                g.add(screen, count)
+            g.close()
+            stats['bytes'] = f.tell()
+    else:
+        scaler = Scaler(scale, bytes(PIXEL_ON), bytes(PIXEL_OFF))
+        f = sys.stdout.buffer if out == '-' else open(out, 'wb')
+        try:
+            for screen, start, count in frames(m, n, log):
+                stats['frames'] += count; stats['distinct'] += 1
+                data = scaler.image(screen)
+                for _ in range(count):
+                    f.write(data)
+                stats['bytes'] += len(data) * count
+        finally:
+            if f is not sys.stdout.buffer:
+                f.close()
+            else:
+                f.flush()
+    return stats
+
+
+def guess_format(out: str) -> str:
+    if out == '-' or out.endswith('.rgb'):
+        return 'rgb24'
+    if out.endswith('.gif'):
+        return 'gif'
+    return 'png'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export CHIP-8 output headless as PNG, GIF or raw rgb24.')
+    parser.add_argument('file',
+        type=str,
+    )
+    parser.add_argument('-o', '--output',
+        type=str,
+        required=True,
+        help="PNG name pattern (e.g. shots/%%05d.png) or directory, GIF file, or rgb24 file ('-' for stdout).",
+    )
+    parser.add_argument('--format',
+        choices=FORMATS,
+        default=None,
+        help='Output format (default: from the output name).',
+    )
+    parser.add_argument('-n', '--frames',
+        type=int,
+        default=600,
+        help='Frames to run (default: 600, 10s).',
+    )
+    parser.add_argument('--scale',
+        type=int,
+        default=SCALE,
+        help=f'Pixels per CHIP-8 pixel (default: {SCALE}).',
+    )
+    parser.add_argument('--screenshot',
+        default=False,
+        action='store_true',
+        help='PNG only: write just the last frame, to the output file.',
+    )
+    parser.add_argument('--log',
+        type=str,
+        default=None,
+        help='Drive input from this input log (replay.py); its seed and settings are used.',
+    )
+    parser.add_argument('--schip-compatible',
+        default=False,
+        action='store_true'
+    )
+    parser.add_argument('--seed',
+        type=int,
+        default=0,
+        help='Seed for the CXNN random number generator (default: 0).',
+    )
+    cmd = parser.parse_args(sys.argv[1:])
+    fmt = cmd.format or guess_format(cmd.output)
+    log = None
+    if cmd.log:
+        log = replay.InputLog.load(cmd.log)
+        m = log.machine()
+    else:
+        m = chip8.Chip8(schip_compatible=cmd.schip_compatible, seed=cmd.seed)
+    with open(cmd.file, 'rb') as f:
+        m.load(f.read())
+    t = time.perf_counter()
+    stats = export(m, cmd.frames, cmd.output, fmt, cmd.scale, log, cmd.screenshot)
+    wall = time.perf_counter() - t
+    print(
+        f"{stats['frames']} frames, {stats['distinct']} distinct, {stats['bytes']:,} bytes of {fmt} in {wall:.3f}s",
+        file=sys.stderr if cmd.output == '-' else sys.stdout,
+    )
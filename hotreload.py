@@ -0,0 +1,94 @@
+# Hot reload of ROM images into a running emulator.
+#
+# The emulator starts a ReloadServer, which accepts connections on a local
+# TCP port in a background thread and queues every image it receives. The
+# emulator's main loop calls poll() between frames and applies the newest
+# image with Chip8.reload(), so the core is never touched from the server
+# thread. asm.py --watch --push sends a new image after every rebuild.
+#
+# Message: RELOAD_HEADER, then the ROM image. The server answers with one
+# byte, RELOAD_OK or RELOAD_BAD.
+
+import queue
+import socket
+import struct
+import threading
+import chip8
+
+RELOAD_MAGIC = b'C8RL'
+# magic, flags, image length
+RELOAD_HEADER = struct.Struct('>4sBI')
+RELOAD_KEEP_REGISTERS = 0x1
+RELOAD_OK = b'\x01'
+RELOAD_BAD = b'\x00'
+RELOAD_HOST = '127.0.0.1'
+RELOAD_PORT = 0xc8c8
+
+
+def _recv_exact(conn: socket.socket, n: int) -> bytes:
+    res = bytearray()
+    while len(res) < n:
+        b = conn.recv(n - len(res))
+        if not b:
+            raise Exception('Connection closed mid-message')
+        res += b
+    return bytes(res)
+
+
+class ReloadServer:
+    __slots__ = ('sock', 'pending', 'thread', 'reloads')
+
+    def __init__(self, port: int = RELOAD_PORT, host: str = RELOAD_HOST):
+        self.sock = socket.create_server((host, port))
+        self.pending = queue.Queue()
+        self.reloads = 0
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+
+    def serve(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            with conn:
+                try:
+                    magic, flags, n = RELOAD_HEADER.unpack(_recv_exact(conn, RELOAD_HEADER.size))
+                    if magic != RELOAD_MAGIC or n > chip8.ROM_MAX:
+                        conn.sendall(RELOAD_BAD)
+                        continue
+                    self.pending.put((_recv_exact(conn, n), bool(flags & RELOAD_KEEP_REGISTERS)))
+                    conn.sendall(RELOAD_OK)
+                except Exception:
+                    continue
+
+    def poll(self, m: chip8.Chip8) -> bool:
+        # applies the newest pushed image, if any; older ones that piled
+        # up since the last poll are dropped. call between frames.
+        item = None
+        while True:
+            try:
+                item = self.pending.get_nowait()
+            except queue.Empty:
+                break
+        if item is None:
+            return False
+        data, keep_registers = item
+        m.reload(data, keep_registers)
+        self.reloads += 1
+        return True
+
+    def close(self):
+        self.sock.close()
+
+
+def push(data: bytes, keep_registers: bool = False, port: int = RELOAD_PORT, host: str = RELOAD_HOST) -> bool:
+    # sends an image to a running emulator; False if nobody accepted it.
+    try:
+        with socket.create_connection((host, port), timeout=1.0) as conn:
+            conn.sendall(RELOAD_HEADER.pack(
+                RELOAD_MAGIC, RELOAD_KEEP_REGISTERS if keep_registers else 0, len(data),
+            ) + data)
+            return conn.recv(1) == RELOAD_OK
+    except OSError:
+        return False
@@ -1,284 +1,64 @@
 import sys
 import ctypes
 import argparse
-import math
-import random
 import sdl2
 import sdl2.ext
 import time
-from dataclasses import dataclass
-from typing import Callable, Any, Union
+import chip8
+import rewind
+import replay
+import profiler
+import hotreload
+import debugserver
 
 CELL_SIZE = 10
 WINDOW_WIDTH = 64 * CELL_SIZE
 WINDOW_HEIGHT = 32 * CELL_SIZE
 RENDERER = None
-RECT = sdl2.SDL_Rect(x=0, y=0, w=0, h=0)
+TEXTURE = None
 
-V = [0 for _ in range(16)]
-MEM = [0 for _ in range(4096)]
-I = 0
-STK = [0 for _ in range(16)]
-SP = 0
-DELAY = 0
-SOUND = 0
-SCREEN = [0 for _ in range(64 * 32)]
-PC = 0x200
-KEY_BUFFER = {}
-WAITKEY = False
-WAITKEY_TARGET = None
-
-SCHIP_COMPATIBLE_FLAG = False
-
-# init font.
-FONT_BASE = 0x0
-FONT = [
-    0xf0, 0x90, 0x90, 0x90, 0xf0,
-    0x20, 0x60, 0x20, 0x20, 0x70,
-    0xf0, 0x10, 0xf0, 0x80, 0xf0,
-    0xf0, 0x10, 0xf0, 0x10, 0xf0,
-    0x90, 0x90, 0xf0, 0x10, 0x10,
-    0xf0, 0x80, 0xf0, 0x10, 0xf0,
-    0xf0, 0x80, 0xf0, 0x90, 0xf0,
-    0xf0, 0x10, 0x20, 0x40, 0x40,
-    0xf0, 0x90, 0xf0, 0x90, 0xf0,
-    0xf0, 0x90, 0xf0, 0x10, 0xf0,
-    0xf0, 0x90, 0xf0, 0x90, 0x90,
-    0xe0, 0x90, 0xe0, 0x90, 0xe0,
-    0xf0, 0x80, 0x80, 0x80, 0xf0,
-    0xe0, 0x90, 0x90, 0x90, 0xe0,
-    0xf0, 0x80, 0xf0, 0x80, 0xf0,
-    0xf0, 0x80, 0xf0, 0x80, 0x80,
+# the framebuffer is uploaded as a 64x32 ARGB8888 streaming texture once
+# per frame and scaled up to the window by the renderer.
+PIXEL_ON = (0xffffffff).to_bytes(4, 'little')
+PIXEL_OFF = (0xff000000).to_bytes(4, 'little')
+# one framebuffer byte -> its 8 pixels.
+PIXEL_LUT = [
+    b''.join(PIXEL_ON if b & (0x80 >> i) else PIXEL_OFF for i in range(8))
+    for b in range(256)
 ]
-for i, x in enumerate(FONT):
-    MEM[FONT_BASE+i] = x
-
-@dataclass
-class NotificationTimer:
-    interval_ms: int
-    notification_code: Union[int, None] = None
-    window_id: Union[int, None] = None
-
-    def __timer_callback(self, t):
-        # SDL_Event is a union so it should be done like in C.
-        # in C you do it like:
-        #     SDL_Event event;
-        #     SDL_memset(&event, 0, sizeof(event));
-        #     event.type = myEventType;
-        #     event.user.code = my_event_code;
-        #     event.user.data1 = significant_data;
-        #     event.user.data2 = 0;
-        # due to how ctypes work in python this would be a little
-        # bit weird in python.
-        wrapper_event = sdl2.events.SDL_Event()
-        event = sdl2.events.SDL_UserEvent(
-            type=self.event,
-            code=self.notification_code or 1,
-        )
-        if self.window_id is not None:
-            event.windowID = self.window_id
-        wrapper_event.type = self.event
-        wrapper_event.user = event
-        
-        sdl2.SDL_PushEvent(wrapper_event)
-        return t
-
-    def __post_init__(self):
-        self.event = sdl2.SDL_RegisterEvents(1)
-        if self.event == 0xffffffff:
-            raise Exception(f'No more event to register!')
-        self.__timer_handle = None
-        self.__c_timer_callback = sdl2.timer.SDL_TimerCallback(lambda x, _: self.__timer_callback(x))
-
-    def start(self):
-        if self.__timer_handle is not None:
-            sdl2.timer.SDL_RemoveTimer(self.__timer_handle)
-        self.__timer_handle = sdl2.timer.SDL_AddTimer(
-            self.interval_ms,
-            self.__c_timer_callback,
-            None
-        )
-    
-    def stop(self):
-        if self.__timer_handle is not None:
-            sdl2.timer.SDL_RemoveTimer(self.__timer_handle)
-        self.__timer_handle = None
-
-def step():
-    global I, SP, DELAY, SOUND, PC, WAITKEY, WAITKEY_TARGET, RUNNING
-    if WAITKEY:
-        return
-    # instr are 2-bytes long, big endian.
-    instr_1 = MEM[PC]; instr_2 = MEM[PC+1]
-    instr = (instr_1<<8)|instr_2
+PIXEL_PITCH = 64 * 4
+PIXELS = bytearray(PIXEL_PITCH * 32)
+PIXELS_PTR = ctypes.cast((ctypes.c_uint8 * len(PIXELS)).from_buffer(PIXELS), ctypes.c_void_p)
 
-    first_digit = (instr_1&0xf0)>>4
-    
-    if first_digit == 0:
-        if instr == 0x00e0:
-            for i in range(64 * 32): SCREEN[i] = False
-            sdl2.SDL_SetRenderDrawColor(RENDERER, 0, 0, 0, 0xff)
-            sdl2.SDL_RenderClear(RENDERER)
-            sdl2.SDL_RenderPresent(RENDERER)
-            PC += 2
-        elif instr == 0x00ee:
-            SP -= 1
-            if SP < 0: raise Error('stack underflow')
-            PC = STK[SP]
-        else:
-            print(f'Unsupported instruction {instr:04X}')
-            raise Exception()
-            PC += 2
-    elif first_digit == 1:
-        NNN = instr&0x0fff
-        PC = NNN
-    elif first_digit == 2:
-        NNN = instr&0x0fff
-        STK[SP] = PC+2
-        SP += 1
-        PC = NNN
-    elif first_digit == 3:
-        X = (instr&0x0f00)>>8; NN = instr&0x00ff
-        if V[X] == NN: PC += 2
-        PC += 2
-    elif first_digit == 4:
-        X = (instr&0x0f00)>>8; NN = instr&0x00ff
-        if V[X] != NN: PC += 2
-        PC += 2
-    elif first_digit == 5:
-        X = (instr&0x0f00)>>8; Y = (instr&0x00f0)>>4
-        if V[X] == V[Y]: PC += 2
-        PC += 2
-    elif first_digit == 6:
-        X = (instr&0x0f00)>>8; NN = instr&0x00ff
-        V[X] = NN; V[X] %= 256
-        PC += 2
-    elif first_digit == 7:
-        X = (instr&0x0f00)>>8; NN = instr&0x00ff
-        V[X] += NN; V[X] %= 256
-        PC += 2
-    elif first_digit == 8:
-        X = (instr&0x0f00)>>8; Y = (instr&0x00f0)>>4
-        S3 = (instr&0x000f)
-        if S3 == 0:
-            V[X] = V[Y]
-        elif S3 == 1:
-            V[X] |= V[Y]
-        elif S3 == 2:
-            V[X] &= V[Y]
-        elif S3 == 3:
-            V[X] ^= V[Y]
-        elif S3 == 4:
-            V[X] += V[Y]
-            if V[X] >= 256: V[0xf] = 1
-            V[X] %= 256
-        elif S3 == 5:
-            V[X] -= V[Y]
-            if V[X] >= 0: V[0xf] = 1
-            V[X] %= 256
-        elif S3 == 6:
-            V[0xf] = (V[X] if SCHIP_COMPATIBLE_FLAG else V[Y]) & 0x1
-            V[X] = (V[X] if SCHIP_COMPATIBLE_FLAG else V[Y]) >> 1
-        elif S3 == 7:
-            V[X] = V[Y] - V[X]
-            if V[X] >= 0: V[0xf] = 1
-            V[X] %= 256
-        elif S3 == 0xe:
-            V[0xf] = ((V[X] if SCHIP_COMPATIBLE_FLAG else V[Y]) & 0x80) >> 7
-            V[X] = (V[X] if SCHIP_COMPATIBLE_FLAG else V[Y]) << 1
-            V[X] %= 256
-        PC += 2
-    elif first_digit == 9:
-        X = (instr&0x0f00)>>8; Y = (instr&0x00f0)>>4
-        if V[X] != V[Y]: PC += 2
-        PC += 2
-    elif first_digit == 0x0a:
-        NNN = instr&0x0fff
-        I = NNN
-        PC += 2
-    elif first_digit == 0x0b:
-        NNN = instr&0x0fff
-        PC = NNN + V[0]
-    elif first_digit == 0x0c:
-        X = (instr&0x0f00)>>8; NN = instr&0x00ff
-        V[X] = math.floor(random.random()*256) & NN
-        PC += 2
-    elif first_digit == 0x0d:
-        X = (instr&0x0f00)>>8; Y = (instr&0x00f0)>>4; N = instr&0x000f
-        draw_sprite(V[X], V[Y], N)
-        PC += 2
-    elif first_digit == 0x0e:
-        X = (instr&0x0f00)>>8; NN = instr&0x00ff
-        if NN == 0x9e:
-            if V[X] in KEY_BUFFER and KEY_BUFFER[V[X]]: PC += 2
-            PC += 2
-        elif NN == 0xa1:
-            if V[X] not in KEY_BUFFER or not KEY_BUFFER[V[X]]: PC += 2
-            PC += 2
-        else:
-            print(f'Unsupported instr {instr:04X}')
-            PC += 2
-    elif first_digit == 0x0f:
-        X = (instr&0x0f00)>>8; NN = instr&0x00ff
-        if NN == 0x07:
-            V[X] = DELAY
-        elif NN == 0x0a:
-            WAITKEY = True
-            WAITKEY_TARGET = X
-        elif NN == 0x15:
-            DELAY = V[X]
-        elif NN == 0x18:
-            SOUND = V[X]
-        elif NN == 0x1e:
-            I += V[X]
-        elif NN == 0x29:
-            I = FONT_BASE + (V[X]%0x10) * 5
-        elif NN == 0x33:
-            store_bcd(X)
-        elif NN == 0x55:
-            for z in range(X+1):
-                MEM[I+z] = V[z]
-            if not SCHIP_COMPATIBLE_FLAG:
-                I = I + X + 1; I %= 4096
-        elif NN == 0x65:
-            for z in range(X+1):
-                V[z] = MEM[I+z]
-            if not SCHIP_COMPATIBLE_FLAG:
-                I = I + X + 1; I %= 4096
-        PC += 2
+MACHINE = chip8.Chip8()
+IPS = chip8.CYCLES_PER_FRAME * chip8.FRAME_RATE
+TURBO = False
+# F5 saves the machine state here, F9 loads it back.
+STATE_PATH = None
+# holding Backspace steps back through this history one frame at a time.
+REWIND = rewind.Rewind()
+# --record writes every key transition here; rewinding and loading states
+# are disabled meanwhile since they would make the log unreplayable.
+RECORD_PATH = None
+# --profile: a profiler.Profile attached to MACHINE, and where to save it.
+PROFILE = None
+PROFILE_PATH = None
+# --listen: a hotreload.ReloadServer; images pushed to it (asm.py --watch
+# --push) replace the program between frames.
+RELOAD = None
+# --debug-server: a debugserver.DebugServer. its commands run between
+# frames; while it holds the machine paused no frames are run.
+DEBUG_SERVER = None
 
-
-def draw_sprite(X: int, Y: int, N: int):
-    X %= 0x40; Y %= 0x20
-    turned_off = False
-    for i in range(N):
-        b = f'{MEM[I+i]:08b}'
-        for x in range(X, min(0x40, X+8)):
-            y = Y+i; y %= 0x20
-            j = x-X
-            prev = SCREEN[y*64+x]
-            SCREEN[y*64+x] ^= int(b[j])
-            current = SCREEN[y*64+x]
-            if prev == 1 and current == 0: turned_off = True
-            sdl2.SDL_SetRenderDrawColor(RENDERER,
-                0xff if current else 0,
-                0xff if current else 0,
-                0xff if current else 0,
-                0xff
-            )
-            RECT.x = x * CELL_SIZE
-            RECT.y = y * CELL_SIZE
-            RECT.w = CELL_SIZE
-            RECT.h = CELL_SIZE
-            sdl2.SDL_RenderFillRect(RENDERER, RECT)
+def render():
+    # called once per presented frame. the texture is only re-uploaded when the
+    # core marks the framebuffer dirty.
+    if MACHINE.DIRTY:
+        PIXELS[:] = b''.join([PIXEL_LUT[b] for b in MACHINE.SCREEN])
+        sdl2.SDL_UpdateTexture(TEXTURE, None, PIXELS_PTR, PIXEL_PITCH)
+        MACHINE.DIRTY = False
+    sdl2.SDL_RenderCopy(RENDERER, TEXTURE, None, None)
     sdl2.SDL_RenderPresent(RENDERER)
-    V[0xf] = int(turned_off)
-
-
-def store_bcd(X: int):
-    x = V[X]
-    a = x // 100; b = (x % 100) // 10; c = x % 10
-    MEM[I] = a; MEM[I+1] = b; MEM[I+2] = c
 
 
 KEYMAP = {
@@ -301,19 +81,8 @@ KEYMAP = {
 }
 
 
-def load_rom(p: str):
-    with open(p, 'rb') as f:
-        data = f.read()
-    data_len = len(data)
-    if 0x200+data_len > 0xfff:
-        print(f'WARNING: data is {data_len} bytes, more than allowed {4096-0x200} bytes.')
-    end_mem = min(4096, 0x200+data_len)
-    print(f'Loading from 0x200 to 0x{end_mem:03X}')
-    for i in range(data_len):
-        MEM[0x200+i] = data[i]
-
 def main(title: str):
-    global RENDERER, DELAY, SOUND, WAITKEY, WAITKEY_TARGET
+    global RENDERER, TEXTURE
     sdl2.SDL_Init(sdl2.SDL_INIT_VIDEO)
     window = sdl2.SDL_CreateWindow(
         title.encode('utf-8'),
@@ -326,35 +95,71 @@ def main(title: str):
         -1,
         sdl2.SDL_RENDERER_SOFTWARE
     )
-    TIMED_TIMER = NotificationTimer(
-        interval_ms=int(1000/60),
+    TEXTURE = sdl2.SDL_CreateTexture(
+        RENDERER,
+        sdl2.SDL_PIXELFORMAT_ARGB8888,
+        sdl2.SDL_TEXTUREACCESS_STREAMING,
+        64, 32
     )
+    MACHINE.CYCLES_PER_FRAME = chip8.cycles_per_frame(IPS)
+    clock = chip8.FrameClock(turbo=TURBO)
+    # in turbo mode frames are not throttled but still only shown at 60Hz.
+    present_interval = 1 / chip8.FRAME_RATE
+    next_present = time.perf_counter()
+    record = replay.InputLog.for_machine(MACHINE) if RECORD_PATH else None
     running = True
-    event = sdl2.SDL_Event()
-    TIMED_TIMER.start()
+    rewinding = False
     while running:
-        event_list = sdl2.ext.get_events()
-        for event in event_list:
+        t = time.perf_counter()
+        for event in sdl2.ext.get_events():
             if event.type == sdl2.SDL_QUIT:
-                break
+                running = False
             elif event.type == sdl2.SDL_KEYDOWN:
-                if event.key.keysym.scancode in KEYMAP:
-                    KEY_BUFFER[KEYMAP[event.key.keysym.scancode]] = True
-                    if WAITKEY:
-                        V[WAITKEY_TARGET] = KEYMAP[event.key.keysym.scancode]
-                        WAITKEY = False
+                if event.key.keysym.scancode == sdl2.SDL_SCANCODE_F5:
+                    chip8.save_state(MACHINE, STATE_PATH)
+                elif event.key.keysym.scancode == sdl2.SDL_SCANCODE_F9 and not record:
+                    chip8.load_state(MACHINE, STATE_PATH)
+                    REWIND.clear()
+                elif event.key.keysym.scancode == sdl2.SDL_SCANCODE_BACKSPACE and not record:
+                    rewinding = True
+                elif event.key.keysym.scancode in KEYMAP and not event.key.repeat:
+                    if record: record.record(MACHINE.FRAMES, KEYMAP[event.key.keysym.scancode], True)
+                    MACHINE.key_down(KEYMAP[event.key.keysym.scancode])
             elif event.type == sdl2.SDL_KEYUP:
-                if event.key.keysym.scancode in KEYMAP:
-                    KEY_BUFFER[KEYMAP[event.key.keysym.scancode]] = False
-
-            elif event.type == TIMED_TIMER.event:
-                if DELAY > 0: DELAY -= 1
-                if SOUND > 0: SOUND -= 1
+                if event.key.keysym.scancode == sdl2.SDL_SCANCODE_BACKSPACE:
+                    rewinding = False
+                elif event.key.keysym.scancode in KEYMAP:
+                    if record: record.record(MACHINE.FRAMES, KEYMAP[event.key.keysym.scancode], False)
+                    MACHINE.key_up(KEYMAP[event.key.keysym.scancode])
+        if PROFILE: PROFILE.add_time('events', time.perf_counter() - t)
+        if RELOAD and not record and RELOAD.poll(MACHINE):
+            REWIND.clear()
+        if DEBUG_SERVER: DEBUG_SERVER.poll()
 
-            step()
-            sdl2.SDL_RenderPresent(RENDERER)
+        if rewinding:
+            REWIND.step_back(MACHINE)
+        elif not (DEBUG_SERVER and DEBUG_SERVER.paused):
+            try:
+                MACHINE.run_until_frame()
+            except chip8.Break as e:
+                DEBUG_SERVER.stop(e.reason)
+            REWIND.push(MACHINE)
+        t = time.perf_counter()
+        if TURBO:
+            if t >= next_present:
+                render()
+                next_present = t + present_interval
+        else:
+            render()
+        if PROFILE: PROFILE.add_time('render', time.perf_counter() - t)
+        clock.wait()
 
-    # TIMED_TIMER.stop()
+    if record:
+        record.frames = MACHINE.FRAMES
+        record.save(RECORD_PATH)
+        print(f'Input log saved to {RECORD_PATH}')
+    sdl2.SDL_DestroyTexture(TEXTURE)
+    sdl2.SDL_DestroyRenderer(RENDERER)
     sdl2.SDL_DestroyWindow(window)
     sdl2.SDL_Quit()
     return 0
@@ -369,10 +174,86 @@ if __name__ == '__main__':
         default=False,
         action='store_true'
     )
+    parser.add_argument('--ips',
+        type=int,
+        default=IPS,
+        help=f'Instructions per second, a multiple of {chip8.FRAME_RATE} (run in {chip8.FRAME_RATE}Hz frames; default: {IPS}).',
+    )
+    parser.add_argument('--turbo',
+        default=False,
+        action='store_true',
+        help='Do not throttle to 60 frames per second.',
+    )
+    parser.add_argument('--seed',
+        type=int,
+        default=None,
+        help='Seed for the CXNN random number generator.',
+    )
+    parser.add_argument('--record',
+        type=str,
+        default=None,
+        help='Record key input to this file for replay.py.',
+    )
+    parser.add_argument('--profile',
+        type=str,
+        default=None,
+        help='Profile execution; print a report at exit and write JSON here.',
+    )
+    parser.add_argument('--rewind-mb',
+        type=float,
+        default=rewind.MEMORY_CAP / (1024 * 1024),
+        help='Memory cap for the rewind history, in MiB.',
+    )
+    parser.add_argument('--translate',
+        default=False,
+        action='store_true',
+        help='Run translated basic blocks instead of interpreting.',
+    )
+    parser.add_argument('--listen',
+        type=int,
+        nargs='?',
+        const=hotreload.RELOAD_PORT,
+        default=None,
+        help=f'Accept hot-reloaded ROM images on this local port (default: {hotreload.RELOAD_PORT}).',
+    )
+    parser.add_argument('--debug-server',
+        type=debugserver.parse_address,
+        nargs='?',
+        const=debugserver.DEBUG_PORT,
+        default=None,
+        help=f'Start paused and serve the debug protocol on this local port or Unix socket path (default: {debugserver.DEBUG_PORT}).',
+    )
     cmd = parser.parse_args(sys.argv[1:])
-    load_rom(cmd.file)
+    chip8.load_rom(MACHINE, cmd.file)
+    STATE_PATH = f'{cmd.file}.state'
     new_title = 'CHIP-8'
     if cmd.schip_compatible:
-        SCHIP_COMPATIBLE_FLAG = True
+        MACHINE.SCHIP_COMPATIBLE_FLAG = True
         new_title += ' [S-Chip Semantics Compatible]'
+    if cmd.translate:
+        MACHINE.TRANSLATE = True
+    if cmd.ips < chip8.FRAME_RATE or cmd.ips % chip8.FRAME_RATE:
+        parser.error(f'--ips must be a multiple of {chip8.FRAME_RATE}, got {cmd.ips}')
+    IPS = cmd.ips
+    if cmd.seed is not None:
+        MACHINE.reseed(cmd.seed)
+    RECORD_PATH = cmd.record
+    if cmd.profile:
+        PROFILE = MACHINE.PROFILE = profiler.Profile()
+        PROFILE_PATH = cmd.profile
+    REWIND.cap = int(cmd.rewind_mb * 1024 * 1024)
+    if cmd.listen is not None:
+        RELOAD = hotreload.ReloadServer(cmd.listen)
+    if cmd.debug_server is not None:
+        DEBUG_SERVER = debugserver.DebugServer(MACHINE, cmd.debug_server)
+        new_title += ' [Debug server]'
+    if cmd.turbo:
+        TURBO = True
+        new_title += ' [Turbo]'
     main(new_title)
+    if MACHINE.TRANSLATE:
+        print(MACHINE.block_stats())
+    print('rewind:', REWIND.stats())
+    if PROFILE:
+        print(PROFILE.report(MACHINE))
+        PROFILE.save(PROFILE_PATH, MACHINE)
@@ -1,73 +1,56 @@
 import sys
-import math
-import random
 import tkinter
 import time
 import argparse
-import queue
-import threading
-
-TIMED_COMMAND_QUEUE = queue.Queue()
-NOTIFY_QUEUE = queue.Queue()
-TIMED_THREAD = None
+import chip8
+import debugger
+import profiler
+import hotreload
+import debugserver
 
 CELL_SIZE = 10
 WINDOW_WIDTH = 64 * CELL_SIZE
 WINDOW_HEIGHT = 32 * CELL_SIZE
 
-root = tkinter.Tk()
-root.title('CHIP-8')
-canvas_main = tkinter.Canvas(root, bg="black", height=WINDOW_HEIGHT, width=WINDOW_WIDTH)
+root = None
+canvas_main = None
+# the framebuffer is loaded into FRAME_SRC (64x32) as PGM data, then
+# zoomed into FRAME_IMAGE, the single image item shown on the canvas.
+FRAME_SRC = None
+FRAME_IMAGE = None
+PGM_HEADER = b'P5 64 32 255\n'
+# one framebuffer byte -> its 8 grey pixels.
+PGM_LUT = [
+    bytes(0xff if b & (0x80 >> i) else 0 for i in range(8))
+    for b in range(256)
+]
+FRAME_INTERVAL = 1 / 60
 
-V = [0 for _ in range(16)]
-MEM = [0 for _ in range(4096)]
-I = 0
-STK = [0 for _ in range(16)]
-SP = 0
-DELAY = 0
-SOUND = 0
-SCREEN = [0 for _ in range(64 * 32)]
-PC = 0x200
-KEY_BUFFER = {}
-WAITKEY = False
-WAITKEY_TARGET = None
+# DELAY/SOUND are read off the monotonic clock, so no timer thread.
+MACHINE = chip8.ClockedChip8()
+# SPEED-/SPEED+ scale the timer clock by SPEED_STEP, down to SPEED_MIN.
+SPEED_SCALE = 1.0
+SPEED_STEP = 0.1
+SPEED_MIN = 0.1
+# F5 saves the machine state here, F9 loads it back.
+STATE_PATH = None
+# --profile: a profiler.Profile attached to MACHINE, and where to save it.
+PROFILE = None
+PROFILE_PATH = None
+# --listen: a hotreload.ReloadServer, polled once per frame interval.
+RELOAD = None
+# what the canvas currently shows, so unchanged frames are skipped.
+SHOWN = b''
+# instructions run between two root.update() calls.
+STEPS_PER_UPDATE = 10
 RUNNING = True
 
-DEBUG_FLAG = False
-SCHIP_COMPATIBLE_FLAG = False
-
-for y in range(32):
-    for x in range(64):
-        i = y * 64 + x
-        canvas_main.create_rectangle(
-            x * CELL_SIZE, y * CELL_SIZE,
-            x * CELL_SIZE + CELL_SIZE, y * CELL_SIZE + CELL_SIZE,
-            fill='black',
-            outline='black',
-        )
-canvas_main.pack()
-
-FONT_BASE = 0x0
-FONT = [
-    0xf0, 0x90, 0x90, 0x90, 0xf0,
-    0x20, 0x60, 0x20, 0x20, 0x70,
-    0xf0, 0x10, 0xf0, 0x80, 0xf0,
-    0xf0, 0x10, 0xf0, 0x10, 0xf0,
-    0x90, 0x90, 0xf0, 0x10, 0x10,
-    0xf0, 0x80, 0xf0, 0x10, 0xf0,
-    0xf0, 0x80, 0xf0, 0x90, 0xf0,
-    0xf0, 0x10, 0x20, 0x40, 0x40,
-    0xf0, 0x90, 0xf0, 0x90, 0xf0,
-    0xf0, 0x90, 0xf0, 0x10, 0xf0,
-    0xf0, 0x90, 0xf0, 0x90, 0x90,
-    0xe0, 0x90, 0xe0, 0x90, 0xe0,
-    0xf0, 0x80, 0x80, 0x80, 0xf0,
-    0xe0, 0x90, 0x90, 0x90, 0xe0,
-    0xf0, 0x80, 0xf0, 0x80, 0xf0,
-    0xf0, 0x80, 0xf0, 0x80, 0x80,
-]
-for i, x in enumerate(FONT):
-    MEM[FONT_BASE+i] = x
+# --debug: a debugger.Debugger on MACHINE. the machine runs at full speed
+# until a breakpoint or watchpoint triggers, then the prompt takes over.
+DEBUGGER = None
+# --debug-server: a debugserver.DebugServer; tools drive the machine
+# through it instead of the prompt. polled once per frame interval.
+DEBUG_SERVER = None
 
 def _N(s: str) -> int:
     r = 0
@@ -78,249 +61,90 @@ def _N(s: str) -> int:
         elif 'A' <= i <= 'F': r += ord(i) - ord('A') + 10
     return r
 
-def disasm_s(s: str, next_s: str = ''):
-    if not s: return ''
-    elif s == '00E0': return 'CLEAR_SCREEN'
-    elif s == '00EE': return 'RET'
-    elif s[0] == '1': return f'JMP 0x{s[1:]}'
-    elif s[0] == '2': return f'CALL 0x{s[1:]}'
-    elif s[0] == '3': return f'IF_NEQ V{s[1]},0x{s[2:]}: {disasm_s(next_s)}'
-    elif s[0] == '4': return f'IF_EQ V{s[1]},0x{s[2:]}: {disasm_s(next_s)}'
-    elif s[0] == '5': return f'IF_NEQ V{s[1]},V{s[1]}: {disasm_s(next_s)}'
-    elif s[0] == '6': return f'LD V{s[1]},0x{s[2:]}'
-    elif s[0] == '7': return f'ADD V{s[1]},0x{s[2:]}'
-    elif s[0] == '8':
-        if s[3] == '0': return f'LD V{s[1]},V{s[2]}'
-        elif s[3] == '1': return f'OR V{s[1]},V{s[2]}'
-        elif s[3] == '2': return f'AND V{s[1]},V{s[2]}'
-        elif s[3] == '3': return f'XOR V{s[1]},V{s[2]}'
-        elif s[3] == '4': return f'ADDC V{s[1]},V{s[2]}'
-        elif s[3] == '5': return f'SUBC V{s[1]},V{s[2]}'
-        elif s[3] == '6': return f'SHR V{s[1]},V{s[2]}'
-        elif s[3] == '7': return f'SUB2 V{s[1]},V{s[2]}'
-        elif s[3] == 'E': return f'SHL V{s[1]},V{s[2]}'
-    elif s[0] == '9': return f'IF_EQ V{s[1]},V{s[2]}: {disasm_s(next_s)}'
-    elif s[0] == 'A': return f'LDI 0x{s[1:]}'
-    elif s[0] == 'B': return f'JMP V0+0x{s[1:]}'
-    elif s[0] == 'C': return f'RANDOM V{s[1]},0x{s[2:]}'
-    elif s[0] == 'D': return f'DRAW V{s[1]},V{s[2]},0x{s[3]}'
-    elif s[0] == 'E':
-        if s[2:] == '9E': return f'IF_NOTKEY V{s[1]}: {disasm_s(next_s)}'
-        elif s[2:] == 'A1': return f'IF_KEY V{s[1]}: {disasm_s(next_s)}'
-    elif s[0] == 'F':
-        if s[2:] == '07': return f'GET_DELAY V{s[1]}'
-        elif s[2:] == '0A': return f'WAITKEY V{s[1]}'
-        elif s[2:] == '15': return f'SET_DELAY V{s[1]}'
-        elif s[2:] == '18': return f'SET_SOUND V{s[1]}'
-        elif s[2:] == '1E': return f'ADD I,V{s[1]}'
-        elif s[2:] == '29': return f'CHAR V{s[1]}'
-        elif s[2:] == '33': return f'BCD V{s[1]}'
-        elif s[2:] == '55': return f'STR {s[1]}'
-        elif s[2:] == '65': return f'LDR {s[1]}'
-    return '<UNSPECIFIED>'
+DEBUG_HELP = """\
+s [N]            step N instructions (default 1)
+c                continue until a breakpoint or watchpoint
+b ADDR [COND]    break at ADDR, optionally only when COND holds (e.g. V3 == 5)
+d ADDR           delete the breakpoint at ADDR
+w ADDR [LEN]     break after FX55/FX33 writes to ADDR..ADDR+LEN-1
+dw ADDR [LEN]    delete watchpoints
+l                list breakpoints and watchpoints
+m<ADDR>          show a memory byte
+v<N>             show a register
+q                quit"""
+
+def prompt() -> int:
+    # returns how many instructions to step, or 0 to continue.
+    m = MACHINE
+    print(debugger.dump(m))
+    while True:
+        line = input('>> ').strip()
+        if not line: continue
+        words = line.split(None, 2)
+        c = words[0].lower()
+        try:
+            if c == 'q': sys.exit(0)
+            elif c == 's': return _N(words[1]) if len(words) > 1 else 1
+            elif c == 'c': return 0
+            elif c == 'b': DEBUGGER.set_breakpoint(_N(words[1]), words[2] if len(words) > 2 else None)
+            elif c == 'd': DEBUGGER.clear_breakpoint(_N(words[1]))
+            elif c == 'w': DEBUGGER.set_watchpoint(_N(words[1]), _N(words[2]) if len(words) > 2 else 1)
+            elif c == 'dw': DEBUGGER.clear_watchpoint(_N(words[1]), _N(words[2]) if len(words) > 2 else 1)
+            elif c == 'l': print(DEBUGGER.describe())
+            elif c[0] == 'm':
+                a = _N(line[1:].strip())
+                print(f'0x{a:04X} {m.MEM[a]}')
+            elif c[0] == 'v':
+                d = m.V[_N(line[1:].strip())]
+                print(f'V{line[1:].strip()} = {d:02X} ({d})')
+            else: print(DEBUG_HELP)
+        except Exception as e:
+            print(e)
 
 def exec():
-    global I, SP, DELAY, SOUND, PC, WAITKEY, WAITKEY_TARGET, RUNNING
+    global RUNNING
     print('Interpreter started.')
+    m = MACHINE
+    next_frame = time.monotonic()
+    # with --debug, start paused at the entry point.
+    paused = DEBUGGER is not None
+    steps = 0
     while RUNNING:
+        if paused and not m.WAITKEY:
+            steps = prompt()
+            DEBUGGER.resume()
+            paused = steps > 0
         try:
-            if NOTIFY_QUEUE.get_nowait() == 'END':
-                RUNNING = False
-                continue
-        except:
-            pass
-        if WAITKEY:
-            root.update()
-            continue
-        # instr are 2-bytes long, big endian.
-        instr_1 = MEM[PC]; instr_2 = MEM[PC+1]
-        s = f'{instr_1:02X}{instr_2:02X}'
-        if DEBUG_FLAG:
-            next_s = '' if PC >= 4095 else f'{MEM[PC+2]:02X}{MEM[PC+2]:02X}'
-            print(f'PC=0x{PC:04X} [{s}] {disasm_s(s, next_s)}')
-            print(f'I={I:04X} DELAY={DELAY:04X} SOUND={SOUND:04X}')
-            print(' '.join([f'V{i:01X}=0x{V[i]:02X}({V[i]})' for i in range(0, 8)]))
-            print(' '.join([f'V{i:01X}=0x{V[i]:02X}({V[i]})' for i in range(8, 16)]))
-            print(f'SP: {SP} STK: {STK}')
-            prompt = None
-            while True:
-                prompt = input('>> ').lower()
-                if not prompt: continue
-                elif prompt == 'q': sys.exit(0)
-                elif prompt == 's': break
-                elif prompt[0] == 'm':
-                    m = _N(prompt[1:])
-                    print(f'0x{m:04X} {MEM[m]}')
-                elif prompt[0] == 'v':
-                    d = V[_N(prompt[1:])]
-                    print(f'V{prompt[1]} = {d:02X} ({d})')
-
-        if s[0] == '0':
-            if s == '00E0':
-                for i in range(64 * 32):
-                    SCREEN[i] = False
-                    canvas_main.itemconfigure(i,
-                        fill='black',
-                        outline='black',
-                    )
-                PC += 2
-            elif s == '00EE':
-                SP -= 1
-                if SP < 0: raise Error('stack underflow')
-                PC = STK[SP]
-                root.update()
+            if not (DEBUG_SERVER and DEBUG_SERVER.paused):
+                m.run(steps if paused else STEPS_PER_UPDATE)
+        except chip8.Break as e:
+            if DEBUG_SERVER:
+                DEBUG_SERVER.stop(e.reason)
             else:
-                print(f'Unsupported instruction {s}')
-                raise Exception()
-                PC += 2
-        elif s[0] == '1':
-            NNN = _N(s[1:])
-            PC = NNN
-            root.update()
-        elif s[0] == '2':
-            NNN = _N(s[1:])
-            STK[SP] = PC+2
-            SP += 1
-            PC = NNN
-            root.update()
-        elif s[0] == '3':
-            X = _N(s[1]); NN = _N(s[2:])
-            if V[X] == NN: PC += 2
-            PC += 2
-        elif s[0] == '4':
-            X = _N(s[1]); NN = _N(s[2:])
-            if V[X] != NN: PC += 2
-            PC += 2
-        elif s[0] == '5':
-            X = _N(s[1]); Y = _N(s[2])
-            if V[X] == V[Y]: PC += 2
-            PC += 2
-        elif s[0] == '6':
-            X = _N(s[1]); NN = _N(s[2:])
-            V[X] = NN; V[X] %= 256
-            PC += 2
-        elif s[0] == '7':
-            X = _N(s[1]); NN = _N(s[2:])
-            V[X] += NN; V[X] %= 256
-            PC += 2
-        elif s[0] == '8':
-            X = _N(s[1]); Y = _N(s[2])
-            if s[3] == '0':
-                V[X] = V[Y]
-            elif s[3] == '1':
-                V[X] |= V[Y]
-            elif s[3] == '2':
-                V[X] &= V[Y]
-            elif s[3] == '3':
-                V[X] ^= V[Y]
-            elif s[3] == '4':
-                V[X] += V[Y]
-                if V[X] >= 256: V[0xf] = 1
-                V[X] %= 256
-            elif s[3] == '5':
-                V[X] -= V[Y]
-                if V[X] >= 0: V[0xf] = 1
-                V[X] %= 256
-            elif s[3] == '6':
-                V[0xf] = (V[X] if SCHIP_COMPATIBLE_FLAG else V[Y]) & 0x1
-                V[X] = (V[X] if SCHIP_COMPATIBLE_FLAG else V[Y]) >> 1
-            elif s[3] == '7':
-                V[X] = V[Y] - V[X]
-                if V[X] >= 0: V[0xf] = 1
-                V[X] %= 256
-            elif s[3] == 'E':
-                V[0xf] = ((V[X] if SCHIP_COMPATIBLE_FLAG else V[Y]) & 0x80) >> 7
-                V[X] = (V[X] if SCHIP_COMPATIBLE_FLAG else V[Y]) << 1
-                V[X] %= 256
-            PC += 2
-        elif s[0] == '9':
-            X = _N(s[1]); Y = _N(s[2])
-            if V[X] != V[Y]: PC += 2
-            PC += 2
-        elif s[0] == 'A':
-            NNN = _N(s[1:])
-            I = NNN
-            PC += 2
-        elif s[0] == 'B':
-            NNN = _N(s[1:])
-            PC = NNN + V[0]
-        elif s[0] == 'C':
-            X = _N(s[1]); NN = _N(s[2:])
-            V[X] = math.floor(random.random()*256) & NN
-            PC += 2
-        elif s[0] == 'D':
-            X = _N(s[1]); Y = _N(s[2]); N = _N(s[3])
-            draw_sprite(V[X], V[Y], N)
-            PC += 2
-        elif s[0] == 'E':
-            X = _N(s[1])
-            if s[2:] == '9E':
-                if V[X] in KEY_BUFFER and KEY_BUFFER[V[X]]: PC += 2
-                PC += 2
-            elif s[2:] == 'A1':
-                if V[X] not in KEY_BUFFER or not KEY_BUFFER[V[X]]: PC += 2
-                PC += 2
-            else:
-                print(f'Unsupported instr {s}')
-                PC += 2
-        elif s[0] == 'F':
-            X = _N(s[1])
-            if s[2:] == '07':
-                # V[X] = DELAY
-                TIMED_COMMAND_QUEUE.put_nowait(('G_DELAY', V[X]))
-                V[X] = NOTIFY_QUEUE.get()                
-            elif s[2:] == '0A':
-                WAITKEY = True
-                WAITKEY_TARGET = X
-            elif s[2:] == '15':
-                # DELAY = V[X]
-                TIMED_COMMAND_QUEUE.put_nowait(('S_DELAY', V[X]))
-            elif s[2:] == '18':
-                # SOUND = V[X]
-                TIMED_COMMAND_QUEUE.put_nowait(('S_SOUND', V[X]))
-            elif s[2:] == '1E':
-                I += V[X]
-            elif s[2:] == '29':
-                I = FONT_BASE + (V[X]%0x10) * 5
-            elif s[2:] == '33':
-                store_bcd(X)
-            elif s[2:] == '55':
-                for z in range(X+1):
-                    MEM[I+z] = V[z]
-                if not SCHIP_COMPATIBLE_FLAG:
-                    I = I + X + 1; I %= 4096
-            elif s[2:] == '65':
-                for z in range(X+1):
-                    V[z] = MEM[I+z]
-                if not SCHIP_COMPATIBLE_FLAG:
-                    I = I + X + 1; I %= 4096
-            PC += 2
-        
+                print(e.reason)
+                paused = True
+        now = time.monotonic()
+        if now >= next_frame:
+            if RELOAD: RELOAD.poll(m)
+            if DEBUG_SERVER: DEBUG_SERVER.poll()
+            if m.DIRTY:
+                redraw()
+                if PROFILE: PROFILE.add_time('render', time.monotonic() - now)
+            next_frame = now + FRAME_INTERVAL
+        t = time.monotonic()
+        root.update()
+        if PROFILE: PROFILE.add_time('events', time.monotonic() - t)
 
-def draw_sprite(X: int, Y: int, N: int):
-    X %= 0x40; Y %= 0x20
-    turned_off = False
-    for i in range(N):
-        b = f'{MEM[I+i]:08b}'
-        for x in range(X, min(0x40, X+8)):
-            y = Y+i; y %= 0x20
-            j = x-X
-            prev = SCREEN[y*64+x]
-            SCREEN[y*64+x] ^= int(b[j])
-            current = SCREEN[y*64+x]
-            if prev == 1 and current == 0: turned_off = True
-            canvas_main.itemconfigure(y*64+x+1,
-                fill='white' if current else 'black',
-                outline='white' if current else 'black',
-            )
-            
-    root.update()
-    V[0xf] = int(turned_off)
 
-def store_bcd(X: int):
-    x = V[X]
-    a = x // 100; b = (x % 100) // 10; c = x % 10
-    MEM[I] = a; MEM[I+1] = b; MEM[I+2] = c
+def redraw():
+    global SHOWN
+    MACHINE.DIRTY = False
+    screen = bytes(MACHINE.SCREEN)
+    if screen == SHOWN:
+        return
+    SHOWN = screen
+    FRAME_SRC.configure(data=PGM_HEADER + b''.join([PGM_LUT[b] for b in screen]), format='PPM')
+    FRAME_IMAGE.tk.call(FRAME_IMAGE, 'copy', FRAME_SRC, '-zoom', CELL_SIZE, CELL_SIZE)
 
 KEYMAP = {
     '1': 1,
@@ -342,71 +166,40 @@ KEYMAP = {
 }
 
 def handle_key_down(e):
-    global WAITKEY
+    global SPEED_SCALE
     if e.keysym == 'minus':
-        TIMED_COMMAND_QUEUE.put_nowait(('SPEED-', None))
+        SPEED_SCALE = max(SPEED_MIN, round(SPEED_SCALE - SPEED_STEP, 2))
+        MACHINE.set_clock_scale(SPEED_SCALE)
     elif e.keysym == 'equal':
-        TIMED_COMMAND_QUEUE.put_nowait(('SPEED+', None))
+        SPEED_SCALE = round(SPEED_SCALE + SPEED_STEP, 2)
+        MACHINE.set_clock_scale(SPEED_SCALE)
+    elif e.keysym == 'F5':
+        chip8.save_state(MACHINE, STATE_PATH)
+    elif e.keysym == 'F9':
+        chip8.load_state(MACHINE, STATE_PATH)
     elif e.keysym in KEYMAP:
-        KEY_BUFFER[KEYMAP[e.keysym]] = True
-        if WAITKEY:
-            print(WAITKEY_TARGET, KEYMAP[e.keysym])
-            V[WAITKEY_TARGET] = KEYMAP[e.keysym]
-            WAITKEY = False
+        MACHINE.key_down(KEYMAP[e.keysym])
 
 def handle_key_up(e):
     if e.keysym in KEYMAP:
-        KEY_BUFFER[KEYMAP[e.keysym]] = False
-
-def load_rom(p: str):
-    with open(p, 'rb') as f:
-        data = f.read()
-    data_len = len(data)
-    if 0x200+data_len > 0xfff:
-        print(f'WARNING: data is {data_len} bytes, more than allowed {4096-0x200} bytes.')
-    end_mem = min(4096, 0x200+data_len)
-    print(f'Loading from 0x200 to 0x{end_mem:03X}')
-    for i in range(data_len):
-        MEM[0x200+i] = data[i]
+        MACHINE.key_up(KEYMAP[e.keysym])
 
 def handle_destroy(e):
-    TIMED_COMMAND_QUEUE.put_nowait(('END', None))
-    NOTIFY_QUEUE.put_nowait('END')
+    global RUNNING
     RUNNING = False
 
-root.bind('<Key>', handle_key_down)
-root.bind('<KeyRelease>', handle_key_up)
-root.bind('<Destroy>', handle_destroy)
-
-def timed_thread():
-    SPEED_FACTOR = 100
-    DELAY = 0
-    SOUND = 0
-    while True:
-        try:
-            # t = 'G_DELAY' | 'S_DELAY' | 'S_SOUND' | 'END'
-            # v is None if t is 'G_DELAY' or 'END'.
-            t, v = TIMED_COMMAND_QUEUE.get_nowait()
-            if t == 'G_DELAY':
-                NOTIFY_QUEUE.put_nowait(DELAY)
-            elif t == 'S_DELAY':
-                DELAY = v
-            elif t == 'S_SOUND':
-                SOUND = v
-            elif t == 'END':
-                break
-            elif t == 'SPEED-':
-                SPEED_FACTOR -= 10
-                if SPEED_FACTOR < 10:
-                    SPEED_FACTOR = 10
-            elif t == 'SPEED+':
-                SPEED_FACTOR += 10
-        except:
-            pass
-        finally:
-            time.sleep(1/SPEED_FACTOR)
-            if DELAY > 0: DELAY -= 1
-            if SOUND > 0: SOUND -= 1
+def init_window(title: str):
+    global root, canvas_main, FRAME_SRC, FRAME_IMAGE
+    root = tkinter.Tk()
+    root.title(title)
+    canvas_main = tkinter.Canvas(root, bg="black", height=WINDOW_HEIGHT, width=WINDOW_WIDTH, highlightthickness=0)
+    FRAME_SRC = tkinter.PhotoImage(width=64, height=32)
+    FRAME_IMAGE = tkinter.PhotoImage(width=WINDOW_WIDTH, height=WINDOW_HEIGHT)
+    canvas_main.create_image(0, 0, image=FRAME_IMAGE, anchor='nw')
+    canvas_main.pack()
+    root.bind('<Key>', handle_key_down)
+    root.bind('<KeyRelease>', handle_key_up)
+    root.bind('<Destroy>', handle_destroy)
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='CHIP-8 Emulator.')
@@ -416,23 +209,67 @@ if __name__ == '__main__':
     parser.add_argument('--debug',
         default=False,
         action='store_true',
+        help='Start paused in the debug prompt; run at full speed between breakpoints.',
     )
     parser.add_argument('--schip-compatible',
         default=False,
         action='store_true'
     )
+    parser.add_argument('--seed',
+        type=int,
+        default=None,
+        help='Seed for the CXNN random number generator.',
+    )
+    parser.add_argument('--profile',
+        type=str,
+        default=None,
+        help='Profile execution; print a report at exit and write JSON here.',
+    )
+    parser.add_argument('--translate',
+        default=False,
+        action='store_true',
+        help='Run translated basic blocks instead of interpreting.',
+    )
+    parser.add_argument('--listen',
+        type=int,
+        nargs='?',
+        const=hotreload.RELOAD_PORT,
+        default=None,
+        help=f'Accept hot-reloaded ROM images on this local port (default: {hotreload.RELOAD_PORT}).',
+    )
+    parser.add_argument('--debug-server',
+        type=debugserver.parse_address,
+        nargs='?',
+        const=debugserver.DEBUG_PORT,
+        default=None,
+        help=f'Start paused and serve the debug protocol on this local port or Unix socket path (default: {debugserver.DEBUG_PORT}).',
+    )
     cmd = parser.parse_args(sys.argv[1:])
-    load_rom(cmd.file)
+    chip8.load_rom(MACHINE, cmd.file)
+    STATE_PATH = f'{cmd.file}.state'
     new_title = 'CHIP-8'
     if cmd.schip_compatible:
-        SCHIP_COMPATIBLE_FLAG = True
+        MACHINE.SCHIP_COMPATIBLE_FLAG = True
         new_title += ' [S-Chip Semantics Compatible]'
-    if cmd.debug:
-        DEBUG_FLAG = True
+    if cmd.translate:
+        MACHINE.TRANSLATE = True
+    if cmd.seed is not None:
+        MACHINE.reseed(cmd.seed)
+    if cmd.profile:
+        PROFILE = MACHINE.PROFILE = profiler.Profile()
+        PROFILE_PATH = cmd.profile
+    if cmd.listen is not None:
+        RELOAD = hotreload.ReloadServer(cmd.listen)
+    if cmd.debug_server is not None:
+        DEBUG_SERVER = debugserver.DebugServer(MACHINE, cmd.debug_server)
+        new_title += ' [Debug server]'
+    elif cmd.debug:
+        DEBUGGER = debugger.Debugger(MACHINE)
         new_title += ' [Debug mode]'
-    root.title(new_title)
-    TIMED_THREAD = threading.Thread(
-        target=timed_thread,
-    )
-    TIMED_THREAD.start()
+    init_window(new_title)
     exec()
+    if MACHINE.TRANSLATE:
+        print(MACHINE.block_stats())
+    if PROFILE:
+        print(PROFILE.report(MACHINE))
+        PROFILE.save(PROFILE_PATH, MACHINE)
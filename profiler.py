@@ -0,0 +1,86 @@
+# Execution profiler.
+#
+# Attach a Profile to a machine (m.PROFILE = Profile()) and run() switches
+# to Chip8.run_profiled(), which counts executions per opcode and per PC
+# and times DXYN. Frontends add their own sections (rendering, event
+# polling) with add_time(). report() ranks everything by hotness; save()
+# writes the same data as JSON.
+
+import json
+import chip8
+import disasm
+
+
+class Profile:
+    __slots__ = ('ops', 'pcs', 'times', 'calls')
+
+    def __init__(self):
+        self.ops = [0] * 0x10000
+        self.pcs = [0] * 4096
+        self.times = {}
+        self.calls = {}
+
+    def add_time(self, name: str, dt: float):
+        self.times[name] = self.times.get(name, 0.0) + dt
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    def classes(self) -> dict:
+        res = {}
+        for instr, c in enumerate(self.ops):
+            if c:
+                k = chip8.opcode_class(instr)
+                res[k] = res.get(k, 0) + c
+        return res
+
+    def to_dict(self, m: chip8.Chip8 = None) -> dict:
+        res = {
+            'instructions': sum(self.ops),
+            'classes': dict(sorted(self.classes().items(), key=lambda x: -x[1])),
+            'pcs': {
+                f'0x{pc:03X}': c
+                for pc, c in sorted(enumerate(self.pcs), key=lambda x: -x[1]) if c
+            },
+            'times': {
+                k: {'seconds': v, 'calls': self.calls[k]}
+                for k, v in sorted(self.times.items(), key=lambda x: -x[1])
+            },
+        }
+        if m is not None:
+            res['opcodes_at_pc'] = {
+                f'0x{pc:03X}': f'{m.MEM[pc]:02X}{m.MEM[(pc+1)&0xfff]:02X}'
+                for pc, c in enumerate(self.pcs) if c
+            }
+        return res
+
+    def report(self, m: chip8.Chip8 = None, top: int = 20) -> str:
+        # m, when given, is used to show the opcode currently at each PC.
+        d = self.to_dict()
+        total = d['instructions'] or 1
+        res = [f"{d['instructions']} instructions"]
+        res.append('')
+        res.append('time:')
+        for k, v in d['times'].items():
+            res.append(f"  {k:16} {v['seconds']:10.4f}s  {v['calls']:8} calls")
+        run = self.times.get('run', 0.0)
+        if run:
+            interp = run - self.times.get('draw_sprite', 0.0)
+            res.append(f"  {'interpretation':16} {interp:10.4f}s  ({d['instructions'] / run:,.0f} ips incl. DXYN)")
+        res.append('')
+        res.append('opcode classes:')
+        for k, c in d['classes'].items():
+            res.append(f'  {k}  {c:12}  {c*100/total:6.2f}%')
+        res.append('')
+        res.append(f'hottest {top} PCs:')
+        for pc, c in list(d['pcs'].items())[:top]:
+            a = int(pc, 16)
+            if m is not None:
+                instr = (m.MEM[a]<<8)|m.MEM[(a+1)&0xfff]
+                op = f'  {instr:04X}  {disasm.decode_table()[instr] or "<UNSPECIFIED>":20}'
+            else:
+                op = ''
+            res.append(f'  {pc}{op}  {c:12}  {c*100/total:6.2f}%')
+        return '\n'.join(res)
+
+    def save(self, p: str, m: chip8.Chip8 = None):
+        with open(p, 'w') as f:
+            json.dump(self.to_dict(m), f, indent=2)
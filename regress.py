@@ -0,0 +1,184 @@
+# Headless ROM regression runner.
+#
+# Every ROM listed in the manifest runs for a fixed number of frames with
+# a scripted key sequence; the framebuffer is hashed at chosen frames and
+# compared against the golden values stored in the manifest.
+#
+#     python regress.py [test/regress.json] [-j N] [--update]
+#         [--json report.json] [--junit report.xml]
+#
+# Manifest format:
+#     {"roms": [{
+#         "name": "keypad",                # optional, defaults to rom
+#         "rom": "keypad.8asm.ch8",       # relative to the manifest
+#         "frames": 120,
+#         "ips": 600,                      # optional, a multiple of 60
+#         "schip_compatible": false,       # optional
+#         "translate": false,              # optional
+#         "seed": 0,                       # optional, CXNN seed
+#         "input": "game.c8in",            # optional replay.py log; its
+#                                          # seed/ips/quirk/keys apply
+#         "keys": [[30, 10, 1], [40, 10, 0]],  # [frame, key, down]
+#         "checkpoints": {"10": "<sha1>", "60": "<sha1>"}
+#     }]}
+
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import concurrent.futures
+import xml.etree.ElementTree as ET
+import chip8
+import replay
+
+
+def screen_hash(m: chip8.Chip8) -> str:
+    return hashlib.sha1(m.framebuffer()).hexdigest()
+
+
+def run_case(base: str, case: dict) -> dict:
+    # runs in a worker process; returns what was observed, not a verdict.
+    if 'input' in case:
+        log = replay.InputLog.load(os.path.join(base, case['input']))
+        m = log.machine(case.get('translate', False))
+        events = log.events
+    else:
+        m = chip8.Chip8(
+            schip_compatible=case.get('schip_compatible', False),
+            cycles_per_frame=chip8.cycles_per_frame(case.get('ips', chip8.CYCLES_PER_FRAME * chip8.FRAME_RATE)),
+            translate=case.get('translate', False),
+            seed=case.get('seed', 0),
+        )
+        events = case.get('keys', [])
+    with open(os.path.join(base, case['rom']), 'rb') as f:
+        m.load(f.read())
+    keys = {}
+    for frame, k, down in events:
+        keys.setdefault(frame, []).append((k, down))
+    checkpoints = {int(f) for f in case.get('checkpoints', {})}
+    hashes = {}
+    error = None
+    t = time.perf_counter()
+    try:
+        for frame in range(case['frames']):
+            for k, down in keys.get(frame, ()):
+                if down: m.key_down(k)
+                else: m.key_up(k)
+            m.run_until_frame()
+            if frame+1 in checkpoints:
+                hashes[str(frame+1)] = screen_hash(m)
+    except Exception as e:
+        error = f'{type(e).__name__}: {e} (PC=0x{m.PC:03X})'
+    wall = time.perf_counter() - t
+    return {
+        'name': case.get('name', case['rom']),
+        'rom': case['rom'],
+        'frames': m.FRAMES,
+        'cycles': m.CYCLES,
+        'wall': wall,
+        'ips': m.CYCLES / wall if wall else 0.0,
+        'hashes': hashes,
+        'error': error,
+    }
+
+
+def check(case: dict, result: dict) -> list:
+    failures = []
+    if result['error']:
+        failures.append(result['error'])
+    for frame, golden in case.get('checkpoints', {}).items():
+        got = result['hashes'].get(frame)
+        if got != golden:
+            failures.append(f'frame {frame}: expected {golden}, got {got}')
+    return failures
+
+
+def write_junit(p: str, results: list, wall: float):
+    suite = ET.Element('testsuite',
+        name='chip8-regress',
+        tests=str(len(results)),
+        failures=str(sum(1 for r in results if r['failures'])),
+        time=f'{wall:.3f}',
+    )
+    for r in results:
+        tc = ET.SubElement(suite, 'testcase',
+            classname='regress',
+            name=r['name'],
+            time=f"{r['wall']:.3f}",
+        )
+        if r['failures']:
+            ET.SubElement(tc, 'failure', message=r['failures'][0]).text = '\n'.join(r['failures'])
+    ET.ElementTree(suite).write(p, encoding='utf-8', xml_declaration=True)
+
+
+def main(cmd) -> int:
+    with open(cmd.manifest, 'r') as f:
+        manifest = json.load(f)
+    base = os.path.dirname(os.path.abspath(cmd.manifest))
+    cases = manifest['roms']
+    for case in cases:
+        if 'ips' in case and 'input' not in case:
+            try:
+                chip8.cycles_per_frame(case['ips'])
+            except Exception as e:
+                print(f"{case.get('name', case['rom'])}: {e}")
+                return 1
+    t = time.perf_counter()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=cmd.jobs) as pool:
+        results = list(pool.map(run_case, [base] * len(cases), cases))
+    wall = time.perf_counter() - t
+
+    failed = 0
+    for case, r in zip(cases, results):
+        if cmd.update:
+            case['checkpoints'] = r['hashes']
+        r['failures'] = [] if cmd.update and not r['error'] else check(case, r)
+        status = 'FAIL' if r['failures'] else 'ok'
+        print(f"{status:4} {r['name']:32} {r['frames']:6} frames {r['wall']:8.3f}s {r['ips']:12,.0f} ips")
+        for msg in r['failures']:
+            print(f'     {msg}')
+        failed += bool(r['failures'])
+    print(f'{len(results)-failed}/{len(results)} passed in {wall:.3f}s')
+
+    if cmd.update:
+        with open(cmd.manifest, 'w') as f:
+            json.dump(manifest, f, indent=2)
+            f.write('\n')
+    if cmd.json:
+        with open(cmd.json, 'w') as f:
+            json.dump({'wall': wall, 'results': results}, f, indent=2)
+    if cmd.junit:
+        write_junit(cmd.junit, results, wall)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='CHIP-8 headless ROM regression runner.')
+    parser.add_argument('manifest',
+        type=str,
+        nargs='?',
+        default=os.path.join('test', 'regress.json'),
+    )
+    parser.add_argument('-j', '--jobs',
+        type=int,
+        default=None,
+        help='Worker processes (default: one per CPU).',
+    )
+    parser.add_argument('--update',
+        action='store_true',
+        help='Record the observed hashes as the new golden values.',
+    )
+    parser.add_argument('--json',
+        type=str,
+        default=None,
+        help='Write a JSON report here.',
+    )
+    parser.add_argument('--junit',
+        type=str,
+        default=None,
+        help='Write a JUnit XML report here.',
+    )
+    cmd = parser.parse_args(sys.argv[1:])
+    sys.exit(main(cmd))
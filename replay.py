@@ -0,0 +1,146 @@
+# Deterministic input logs and max-speed replay.
+#
+# A log holds everything needed to reproduce a run of the headless core:
+# the RNG seed, instructions per frame, the quirk flag, the number of
+# frames recorded, and every key transition as a (frame, key, down)
+# triple. An event at frame F is applied right before frame F runs, i.e.
+# while Chip8.FRAMES == F.
+#
+# File layout: LOG_HEADER, then one LOG_EVENT per key transition.
+#
+#     python replay.py ROM LOG [--translate] [--frames N] [--profile OUT.json]
+
+import sys
+import time
+import struct
+import hashlib
+import argparse
+import chip8
+import profiler
+
+LOG_MAGIC = b'C8IN'
+LOG_VERSION = 2
+# magic, version, flags, seed, cycles per frame, frames, event count
+LOG_HEADER = struct.Struct('>4sBBIIII')
+# frame, key | LOG_DOWN
+LOG_EVENT = struct.Struct('>IB')
+LOG_DOWN = 0x80
+LOG_SCHIP = 0x1
+
+
+class InputLog:
+    __slots__ = ('seed', 'cycles_per_frame', 'schip_compatible', 'frames', 'events')
+
+    def __init__(self, seed: int, cycles_per_frame: int = chip8.CYCLES_PER_FRAME, schip_compatible: bool = False):
+        self.seed = seed
+        self.cycles_per_frame = cycles_per_frame
+        self.schip_compatible = schip_compatible
+        self.frames = 0
+        self.events = []
+
+    @classmethod
+    def for_machine(cls, m: chip8.Chip8):
+        return cls(m.SEED, m.CYCLES_PER_FRAME, m.SCHIP_COMPATIBLE_FLAG)
+
+    def record(self, frame: int, k: int, down: bool):
+        self.events.append((frame, k, bool(down)))
+
+    def machine(self, translate: bool = False) -> chip8.Chip8:
+        return chip8.Chip8(
+            schip_compatible=self.schip_compatible,
+            cycles_per_frame=self.cycles_per_frame,
+            translate=translate,
+            seed=self.seed,
+        )
+
+    def to_bytes(self) -> bytes:
+        pack = LOG_EVENT.pack
+        return LOG_HEADER.pack(
+            LOG_MAGIC, LOG_VERSION,
+            LOG_SCHIP if self.schip_compatible else 0,
+            self.seed & 0xffffffff, self.cycles_per_frame,
+            self.frames, len(self.events),
+        ) + b''.join([pack(f, k | (LOG_DOWN if down else 0)) for f, k, down in self.events])
+
+    @classmethod
+    def from_bytes(cls, data: bytes):
+        magic, version, flags, seed, cycles_per_frame, frames, count = LOG_HEADER.unpack_from(data)
+        if magic != LOG_MAGIC:
+            raise Exception('Bad input log: wrong magic')
+        if version != LOG_VERSION:
+            raise Exception(f'Unsupported input log version {version}')
+        log = cls(seed, cycles_per_frame, bool(flags & LOG_SCHIP))
+        log.frames = frames
+        log.events = [
+            (f, b & 0x7f, bool(b & LOG_DOWN))
+            for f, b in LOG_EVENT.iter_unpack(data[LOG_HEADER.size:LOG_HEADER.size+count*LOG_EVENT.size])
+        ]
+        return log
+
+    def save(self, p: str):
+        with open(p, 'wb') as f:
+            f.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, p: str):
+        with open(p, 'rb') as f:
+            return cls.from_bytes(f.read())
+
+
+def replay(m: chip8.Chip8, log: InputLog, frames: int = None) -> int:
+    # feeds the log into m as fast as possible; no event loop, no
+    # rendering. returns the number of frames run.
+    frames = log.frames if frames is None else frames
+    events = log.events
+    i = 0; n = len(events)
+    run_until_frame = m.run_until_frame
+    for frame in range(m.FRAMES, m.FRAMES + frames):
+        while i < n and events[i][0] <= frame:
+            _, k, down = events[i]
+            if down: m.key_down(k)
+            else: m.key_up(k)
+            i += 1
+        run_until_frame()
+    return frames
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replay a CHIP-8 input log headless.')
+    parser.add_argument('file',
+        type=str,
+    )
+    parser.add_argument('log',
+        type=str,
+    )
+    parser.add_argument('--translate',
+        default=False,
+        action='store_true',
+        help='Run translated basic blocks instead of interpreting.',
+    )
+    parser.add_argument('--frames',
+        type=int,
+        default=None,
+        help='Frames to run (default: as many as were recorded).',
+    )
+    parser.add_argument('--profile',
+        type=str,
+        default=None,
+        help='Profile execution; print a report and write JSON here.',
+    )
+    cmd = parser.parse_args(sys.argv[1:])
+    log = InputLog.load(cmd.log)
+    m = log.machine(cmd.translate)
+    if cmd.profile:
+        m.PROFILE = profiler.Profile()
+    with open(cmd.file, 'rb') as f:
+        m.load(f.read())
+    t = time.perf_counter()
+    frames = replay(m, log, cmd.frames)
+    wall = time.perf_counter() - t
+    print(f'{frames} frames ({frames / chip8.FRAME_RATE:.1f}s of play), {m.CYCLES} instructions in {wall:.3f}s')
+    print(f'{m.CYCLES / wall if wall else 0:,.0f} ips, x{frames / chip8.FRAME_RATE / wall if wall else 0:.1f} realtime')
+    print(f'framebuffer sha1 {hashlib.sha1(m.framebuffer()).hexdigest()}')
+    if m.PROFILE:
+        print()
+        print(m.PROFILE.report(m))
+        m.PROFILE.save(cmd.profile, m)
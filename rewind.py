@@ -0,0 +1,95 @@
+# Rewind buffer.
+#
+# Keeps the last few minutes of machine states in a bounded amount of
+# memory. History is a ring of segments; each segment starts with a
+# zlib-compressed keyframe (a full Chip8.snapshot()) followed by one
+# entry per frame holding the zlib-compressed XOR against the previous
+# frame. Stepping back XORs the newest delta out of the current state;
+# only crossing into an older segment replays that segment's deltas
+# forward from its keyframe. When the cap is exceeded the oldest whole
+# segment is dropped, since no later segment depends on it.
+
+import time
+import zlib
+import collections
+import chip8
+
+# frames between two keyframes.
+KEYFRAME_INTERVAL = 120
+# default memory cap for the compressed history, in bytes.
+MEMORY_CAP = 8 * 1024 * 1024
+
+
+class Rewind:
+    __slots__ = ('segments', 'current', 'size', 'frames', 'cap', 'interval', 'push_time', 'pushes')
+
+    def __init__(self, cap: int = MEMORY_CAP, interval: int = KEYFRAME_INTERVAL):
+        self.cap = cap
+        self.interval = interval
+        self.push_time = 0.0
+        self.pushes = 0
+        self.clear()
+
+    def clear(self):
+        # each segment is [keyframe, delta, delta, ...].
+        self.segments = collections.deque()
+        self.current = None
+        self.size = 0
+        self.frames = 0
+
+    def push(self, m: chip8.Chip8):
+        # records m's state as the newest frame.
+        t = time.perf_counter()
+        s = m.snapshot()
+        cur = int.from_bytes(s, 'big')
+        if self.current is None or len(self.segments[-1]) - 1 >= self.interval:
+            blob = zlib.compress(s, 1)
+            self.segments.append([blob])
+        else:
+            blob = zlib.compress((cur ^ self.current).to_bytes(chip8.STATE_SIZE, 'big'), 1)
+            self.segments[-1].append(blob)
+        self.current = cur
+        self.size += len(blob)
+        self.frames += 1
+        while self.size > self.cap and len(self.segments) > 1:
+            seg = self.segments.popleft()
+            self.size -= sum(len(b) for b in seg)
+            self.frames -= len(seg)
+        self.push_time += time.perf_counter() - t
+        self.pushes += 1
+
+    def pop(self) -> bytes:
+        # drops the newest frame and returns the state of the one before
+        # it, or None when only the oldest frame is left.
+        if self.frames <= 1:
+            return None
+        seg = self.segments[-1]
+        blob = seg.pop()
+        self.size -= len(blob)
+        self.frames -= 1
+        if seg:
+            self.current ^= int.from_bytes(zlib.decompress(blob), 'big')
+        else:
+            self.segments.pop()
+            seg = self.segments[-1]
+            cur = int.from_bytes(zlib.decompress(seg[0]), 'big')
+            for d in seg[1:]:
+                cur ^= int.from_bytes(zlib.decompress(d), 'big')
+            self.current = cur
+        return self.current.to_bytes(chip8.STATE_SIZE, 'big')
+
+    def step_back(self, m: chip8.Chip8) -> bool:
+        s = self.pop()
+        if s is None:
+            return False
+        m.restore(s)
+        return True
+
+    def stats(self) -> dict:
+        return {
+            'frames': self.frames,
+            'seconds': self.frames / chip8.FRAME_RATE,
+            'bytes': self.size,
+            'cap': self.cap,
+            'push_us': self.push_time / self.pushes * 1e6 if self.pushes else 0.0,
+        }
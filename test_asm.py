@@ -0,0 +1,98 @@
+# Unit tests for the assembler and linker, mostly as round trips through
+# the disassembler.
+#
+#     python -m pytest -q
+
+import random
+import pytest
+import asm
+import disasm
+from test_chip8 import random_program
+
+KEYPAD = 'test/keypad.8asm'
+
+
+def test_every_instruction_assembles_from_its_disassembly():
+    table = disasm.decode_table()
+    for instr, text in enumerate(table):
+        if text is None or not disasm._valid(instr):
+            continue
+        assert asm.tokenize(text) == (asm.T_INSTR, instr, None), text
+
+
+def test_keypad_source_matches_its_rom():
+    with open(KEYPAD) as f:
+        source = f.read()
+    with open(f'{KEYPAD}.ch8', 'rb') as f:
+        rom = f.read()
+    assert asm.compile_source(source, KEYPAD) == rom
+    assert asm.build([KEYPAD]) == rom
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_traced_listing_assembles_back(seed):
+    rom = random_program(random.Random(seed))
+    # some data after the code, reached only through ANNN.
+    rom += bytes([0xa2, 0x00, 0xf0, 0x0d, 0x12])
+    listing = '\n'.join(disasm.iter_trace(rom))
+    assert asm.compile_source(listing) == rom
+
+
+def test_keypad_traced_listing_assembles_back():
+    with open(f'{KEYPAD}.ch8', 'rb') as f:
+        rom = f.read()
+    assert asm.compile_source('\n'.join(disasm.iter_trace(rom))) == rom
+
+
+def test_source_without_org_starts_at_rom_base():
+    source = '#loop\nJMP #loop\n'
+    assert asm.compile_source(source) == bytes([0x12, 0x00])
+    assert asm.link([asm.assemble(source)]) == bytes([0x12, 0x00])
+
+
+def test_link_places_and_resolves_across_objects():
+    a = asm.assemble('CALL #sub\n#spin\nJMP #spin\n', 'a')
+    b = asm.assemble('#sub\nLD V0,1\nRET\n', 'b')
+    c = asm.assemble('@210\n#data\n$1,2\n', 'c')
+    assert asm.link([a, b, c]) == bytes([
+        0x22, 0x04, 0x12, 0x02,  # a at 200
+        0x60, 0x01, 0x00, 0xee,  # b at 204
+        0, 0, 0, 0, 0, 0, 0, 0,  # gap
+        0x01, 0x02,              # c at 210
+    ])
+
+
+def test_object_file_round_trip():
+    obj = asm.assemble('@300\n#a\nJMP #b\n$7,8,9\n#c\nLDI #a\n', 'x')
+    back = asm.ObjectFile.from_bytes(obj.to_bytes(), 'x')
+    for attr in ('name', 'org', 'code', 'labels', 'relocations'):
+        assert getattr(back, attr) == getattr(obj, attr), attr
+
+
+@pytest.mark.parametrize('objects', [
+    ['JMP #nowhere\n'],
+    ['#a\nCLEAR_SCREEN\n', '#a\nRET\n'],
+    ['@200\n$1,2,3,4\n', '@202\n$5\n'],
+    ['@100\nRET\n'],
+])
+def test_link_failures_return_nothing(objects):
+    assert asm.link([asm.assemble(s) for s in objects]) == b''
+
+
+@pytest.mark.parametrize('source', [
+    'ADD V1,\n',
+    'LD V1,V2,V3\n',
+    'BOGUS\n',
+    'RET\n@300\nRET\n',
+    '#a\n#a\nRET\n',
+])
+def test_assemble_rejects(source):
+    assert asm.assemble(source) is None
+
+
+def test_diagnostics_name_the_source(capsys):
+    assert asm.compile_source('JMP #nowhere\nADD V1,\n', 'game.c8s') == b''
+    out = capsys.readouterr().out
+    assert out == 'game.c8s:(L2) Unsupported instruction: ADD V1,\n'
+    assert asm.compile_source('JMP #nowhere\n', 'game.c8s') == b''
+    assert capsys.readouterr().out == 'game.c8s:(L1) Undefined label nowhere\n'
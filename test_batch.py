@@ -0,0 +1,70 @@
+# BatchChip8 against the scalar core: every instance must stay in lockstep
+# with a Chip8 running the same program from the same seed.
+#
+#     python -m pytest -q
+
+import random
+import pytest
+import chip8
+from test_chip8 import random_program
+
+np = pytest.importorskip('numpy')
+import batch
+
+N = 16
+SEED = 77
+
+
+def scalar_state(m: chip8.Chip8) -> tuple:
+    return (m.PC, m.I, m.SP, list(m.STK), bytes(m.V), bytes(m.MEM), bytes(m.SCREEN),
+            m.DELAY, m.SOUND, m.WAITKEY, m.CYCLES, m.RNG)
+
+
+def test_lockstep_with_scalar():
+    rng = random.Random(SEED)
+    programs = [random_program(rng) for _ in range(N)]
+    b = batch.BatchChip8(N, seed=SEED)
+    machines = []
+    for k, p in enumerate(programs):
+        b.load(p, [k])
+        m = chip8.Chip8(seed=SEED + k)
+        m.load(p)
+        machines.append(m)
+    halted = [False] * N
+    for frame in range(60):
+        if frame == 20:
+            b.key_down(5)
+            for m in machines: m.key_down(5)
+        b.run_until_frame()
+        for k, m in enumerate(machines):
+            if halted[k]:
+                continue
+            try:
+                m.run_until_frame()
+            except Exception:
+                # the batch stops the instance on the faulting instruction.
+                halted[k] = True
+                assert b.HALTED[k]
+                continue
+            assert not b.HALTED[k]
+            assert scalar_state(b.machine(k)) == scalar_state(m), (frame, k)
+    assert not all(halted)
+
+
+def test_waitkey_blocks_only_its_instance():
+    b = batch.BatchChip8(2, seed=0)
+    b.load(bytes([0xf3, 0x0a, 0x12, 0x02]), [0])  # WAITKEY V3, then spin
+    b.load(bytes([0x12, 0x00]), [1])              # spin
+    assert b.run(5) == 6
+    assert list(b.WAITKEY) == [True, False]
+    b.key_down(9)
+    assert b.V[0, 3] == 9 and not b.WAITKEY[0]
+
+
+def test_faults_halt_instead_of_raising():
+    b = batch.BatchChip8(2, seed=0)
+    b.load(bytes([0x00, 0xee]), [0])  # stack underflow
+    b.load(bytes([0x12, 0x00]), [1])
+    b.run(3)
+    assert list(b.HALTED) == [True, False]
+    assert b.PC[0] == chip8.ROM_BASE
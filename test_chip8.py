@@ -0,0 +1,336 @@
+# Unit tests for the headless core: flag results of the 8XY_ opcodes when
+# VF is an operand, DXYN clipping/wrapping and collision, save states, and
+# translated mode against the interpreter.
+#
+#     python -m pytest -q
+
+import random
+import pytest
+import chip8
+
+
+def machine(*instrs: int, **regs) -> chip8.Chip8:
+    # a machine with the given opcodes at ROM_BASE; regs like V1=3, I=0x300.
+    m = chip8.Chip8(seed=0)
+    m.load(b''.join(i.to_bytes(2, 'big') for i in instrs))
+    for k, v in regs.items():
+        if k[0] == 'V':
+            m.V[int(k[1:], 16)] = v
+        else:
+            setattr(m, k, v)
+    return m
+
+
+def rows(m: chip8.Chip8) -> list:
+    return [m.row(y) for y in range(chip8.SCREEN_HEIGHT)]
+
+
+# 8XY_ with X == F: the flag is written after the result, so it wins.
+
+@pytest.mark.parametrize('vf, v1, flag', [(0xff, 0x01, 1), (0x01, 0x01, 0)])
+def test_8xy4_vf_destination_gets_carry(vf, v1, flag):
+    m = machine(0x8f14, VF=vf, V1=v1)
+    m.step()
+    assert m.V[0xf] == flag
+
+
+@pytest.mark.parametrize('vf, v1, flag', [(5, 3, 1), (3, 5, 0), (4, 4, 1)])
+def test_8xy5_vf_destination_gets_not_borrow(vf, v1, flag):
+    m = machine(0x8f15, VF=vf, V1=v1)
+    m.step()
+    assert m.V[0xf] == flag
+
+
+@pytest.mark.parametrize('vf, v1, flag', [(3, 5, 1), (5, 3, 0)])
+def test_8xy7_vf_destination_gets_not_borrow(vf, v1, flag):
+    m = machine(0x8f17, VF=vf, V1=v1)
+    m.step()
+    assert m.V[0xf] == flag
+
+
+def test_8xy4_vf_source_is_read_before_the_flag():
+    m = machine(0x81f4, V1=0x10, VF=0x20)
+    m.step()
+    assert (m.V[1], m.V[0xf]) == (0x30, 0)
+
+
+@pytest.mark.parametrize('instr, v1, flag', [(0x8f16, 0x03, 1), (0x8f1e, 0x80, 1), (0x8f1e, 0x01, 0)])
+def test_shifts_vf_destination_gets_shifted_out_bit(instr, v1, flag):
+    m = machine(instr, V1=v1)
+    m.step()
+    assert m.V[0xf] == flag
+
+
+def test_8xy5_result_and_flag():
+    m = machine(0x8015, V0=3, V1=5)
+    m.step()
+    assert (m.V[0], m.V[0xf]) == (0xfe, 0)
+
+
+# DXYN
+
+def sprite_machine(x: int, y: int, sprite: bytes) -> chip8.Chip8:
+    # DRAW V0,V1,len(sprite) with the sprite at 0x300.
+    m = machine(0xd010 | len(sprite), V0=x, V1=y, I=0x300)
+    m.MEM[0x300:0x300+len(sprite)] = sprite
+    return m
+
+
+def test_dxyn_clips_at_the_right_edge():
+    m = sprite_machine(60, 0, b'\xff')
+    m.step()
+    assert m.row(0) == 0xf
+    assert not any(rows(m)[1:])
+    assert m.V[0xf] == 0
+
+
+def test_dxyn_wraps_vertically():
+    m = sprite_machine(0, 31, b'\x80\x40')
+    m.step()
+    assert m.row(31) == 1 << 63
+    assert m.row(0) == 1 << 62
+
+
+def test_dxyn_start_position_wraps():
+    m = sprite_machine(64 + 2, 32 + 1, b'\x80')
+    m.step()
+    assert m.row(1) == 1 << 61
+
+
+def test_dxyn_collision_erases_and_sets_vf():
+    m = sprite_machine(10, 5, b'\x81')
+    m.MEM[0x202:0x204] = b'\xd0\x11'
+    m.step()
+    assert m.V[0xf] == 0
+    m.step()
+    assert m.V[0xf] == 1
+    assert not any(rows(m))
+
+
+def test_dxyn_clipped_pixels_do_not_collide():
+    # the part clipped at x=63 does not wrap onto x=0.
+    m = sprite_machine(60, 0, b'\xff')
+    m.SCREEN[0] = 0xf0
+    m.step()
+    assert m.V[0xf] == 0
+    assert m.row(0) == (0xf0 << 56) | 0xf
+
+
+def test_dxyn_collision_at_the_bottom_edge():
+    m = sprite_machine(0, 31, b'\x80\x80')
+    m.SCREEN[0] = 0x80
+    m.step()
+    assert m.V[0xf] == 1
+    assert m.row(0) == 0
+    assert m.row(31) == 1 << 63
+
+
+def test_dxyn_marks_dirty():
+    m = sprite_machine(0, 0, b'\x80')
+    m.DIRTY = False
+    m.step()
+    assert m.DIRTY
+
+
+# save states
+
+PROGRAM = bytes([
+    0x22, 0x08,  # 200 CALL 0x208
+    0xf0, 0x0a,  # 202 WAITKEY V0
+    0x12, 0x04,  # 204 JMP 0x204
+    0x00, 0x00,  # 206
+    0x60, 0x2a,  # 208 LD V0,0x2a
+    0xf0, 0x15,  # 20A SET_DELAY V0
+    0xf0, 0x18,  # 20C SET_SOUND V0
+    0xc1, 0xff,  # 20E RAND V1,0xff
+    0xa0, 0x00,  # 210 LDI 0x000
+    0xd0, 0x05,  # 212 DRAW V0,V0,5
+    0x00, 0xee,  # 214 RET
+])
+
+
+def test_snapshot_restore_round_trip():
+    m = chip8.Chip8(schip_compatible=True, cycles_per_frame=7, seed=1234)
+    m.load(PROGRAM)
+    m.key_down(3)
+    m.run_until_frame()
+    m.run(5)
+    assert m.WAITKEY
+    state = m.snapshot()
+    assert len(state) == chip8.STATE_SIZE
+
+    r = chip8.Chip8()
+    r.restore(state)
+    assert r.snapshot() == state
+    for attr in ('PC', 'I', 'SP', 'STK', 'DELAY', 'SOUND', 'CYCLES', 'FRAMES', 'RNG',
+                 'WAITKEY', 'WAITKEY_TARGET', 'SCHIP_COMPATIBLE_FLAG', 'CYCLES_PER_FRAME'):
+        assert getattr(r, attr) == getattr(m, attr), attr
+    assert (r.V, r.MEM, r.SCREEN, r.KEY_BUFFER) == (m.V, m.MEM, m.SCREEN, m.KEY_BUFFER)
+
+    # both carry on identically, including the RNG.
+    for x in (m, r):
+        x.key_down(7)
+        x.MEM[0x206:0x208] = b'\xc2\xff'
+        x.PC = 0x206
+        x.run_until_frame()
+    assert r.snapshot() == m.snapshot()
+
+
+def test_restore_keeps_translated_blocks_consistent():
+    m = chip8.Chip8(seed=0, translate=True)
+    m.load(PROGRAM)
+    state = m.snapshot()
+    m.run(20)
+    m.restore(state)
+    assert not m.BLOCKS
+    m.run(20)
+    r = chip8.Chip8(seed=0)
+    r.restore(state)
+    r.run(20)
+    assert r.snapshot() == m.snapshot()
+
+
+@pytest.mark.parametrize('mutate, message', [
+    (lambda s: s[:-1], 'bytes'),
+    (lambda s: b'XXXX' + s[4:], 'magic'),
+    (lambda s: s[:4] + bytes([chip8.STATE_VERSION + 1]) + s[5:], 'version'),
+])
+def test_restore_rejects_bad_states(mutate, message):
+    m = chip8.Chip8(seed=0)
+    with pytest.raises(Exception, match=message):
+        m.restore(mutate(m.snapshot()))
+
+
+# translated mode
+
+def outcome(m: chip8.Chip8, cycles: int):
+    # the state after running, or the error that stopped it.
+    try:
+        m.run(cycles)
+    except Exception as e:
+        return str(e), m.PC
+    return m.snapshot()
+
+
+def at_zero(code: bytes, rom: bytes, translate: bool) -> chip8.Chip8:
+    # a machine starting at 0x000 with code there and rom at ROM_BASE.
+    m = chip8.Chip8(seed=0, translate=translate)
+    m.load(rom)
+    m.MEM[0:len(code)] = code
+    m.PC = 0
+    return m
+
+
+# 000: ADD V4,1 / JMP 200, then at 200 a routine that stores over 0x000
+# through a write that wraps past 0xFFF and jumps back there.
+WRAP_CODE = bytes([0x74, 0x01, 0x12, 0x00])
+
+
+def test_wrapping_fx55_invalidates_blocks_at_zero():
+    rom = bytes([
+        0x35, 0x01,  # 200 SE V5,1
+        0x12, 0x0a,  # 202 JMP 0x20A
+        0x12, 0x04,  # 204 JMP 0x204
+        0x00, 0x00,  # 206
+        0x00, 0x00,  # 208
+        0x62, 0x64,  # 20A LD V2,0x64
+        0x63, 0x55,  # 20C LD V3,0x55
+        0x65, 0x01,  # 20E LD V5,1
+        0xaf, 0xfe,  # 210 LDI 0xFFE
+        0xf3, 0x55,  # 212 LD [I],V3 -> FFE, FFF, 000, 001
+        0x10, 0x00,  # 214 JMP 0x000 -> LD V4,0x55
+    ])
+    results = [outcome(at_zero(WRAP_CODE, rom, t), 40) for t in (False, True)]
+    assert results[0] == results[1]
+    m = chip8.Chip8()
+    m.restore(results[0])
+    assert m.V[4] == 0x55
+
+
+def test_wrapping_fx33_invalidates_blocks_at_zero():
+    rom = bytes([
+        0x63, 0xff,  # 200 LD V3,0xFF
+        0xaf, 0xfe,  # 202 LDI 0xFFE
+        0xf3, 0x33,  # 204 BCD V3 -> FFE, FFF, 000
+        0x10, 0x00,  # 206 JMP 0x000 -> 0x0501, unsupported
+    ])
+    results = [outcome(at_zero(WRAP_CODE, rom, t), 40) for t in (False, True)]
+    assert results[0] == results[1]
+    assert results[0] == ('Unsupported instruction 0501', 0x000)
+
+
+def random_program(rng: random.Random, length: int = 48) -> bytes:
+    # length random instructions that keep running: jumps stay on
+    # instructions of the program, there are no calls, and it ends in a
+    # jump to itself. stores may still overwrite it.
+    end = chip8.ROM_BASE + 2 * length
+    res = []
+    for _ in range(length):
+        x = rng.randrange(16); y = rng.randrange(16); nn = rng.randrange(256)
+        res.append(rng.choice((
+            0x00e0,
+            0x1000 | rng.randrange(chip8.ROM_BASE, end + 2, 2),
+            0x3000 | x << 8 | nn,
+            0x4000 | x << 8 | nn,
+            0x5000 | x << 8 | y << 4,
+            0x6000 | x << 8 | nn,
+            0x7000 | x << 8 | nn,
+            0x8000 | x << 8 | y << 4 | rng.choice((0, 1, 2, 3, 4, 5, 6, 7, 0xe)),
+            0x9000 | x << 8 | y << 4,
+            0xa000 | rng.randrange(end, 0x1000),
+            0xc000 | x << 8 | nn,
+            0xd000 | x << 8 | y << 4 | rng.randrange(16),
+            0xf000 | x << 8 | rng.choice((0x07, 0x15, 0x18, 0x1e, 0x29, 0x33, 0x55, 0x65)),
+        )))
+    res.append(0x1000 | end)
+    return b''.join(i.to_bytes(2, 'big') for i in res)
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_translated_matches_interpreter(seed):
+    rng = random.Random(seed)
+    program = random_program(rng)
+    budgets = [rng.randrange(1, 80) for _ in range(30)]
+    results = []
+    for translate in (False, True):
+        m = chip8.Chip8(seed=seed, translate=translate)
+        m.load(program)
+        trail = []
+        for n in budgets:
+            r = outcome(m, n)
+            trail.append(r)
+            if isinstance(r, tuple):
+                break
+            m.tick()
+        results.append(trail)
+    assert results[0] == results[1]
+
+
+def test_translated_sees_self_modifying_code():
+    program = bytes([
+        0x74, 0x01,  # 200 ADD V4,1
+        0x60, 0x75,  # 202 LD V0,0x75 -> 0x200 becomes ADD V5,1
+        0xa2, 0x00,  # 204 LDI 0x200
+        0xf0, 0x55,  # 206 LD [I],V0
+        0x12, 0x00,  # 208 JMP 0x200
+    ])
+    for budget in (1, 3, 7, 50):
+        results = []
+        for translate in (False, True):
+            m = chip8.Chip8(seed=0, translate=translate)
+            m.load(program)
+            for _ in range(10):
+                m.run(budget)
+            results.append(m.snapshot())
+        assert results[0] == results[1]
+
+
+@pytest.mark.parametrize('ips, cpf', [(60, 1), (600, 10), (720, 12)])
+def test_cycles_per_frame(ips, cpf):
+    assert chip8.cycles_per_frame(ips) == cpf
+
+
+@pytest.mark.parametrize('ips', [0, 59, 100, 610])
+def test_cycles_per_frame_refuses_uneven_rates(ips):
+    with pytest.raises(Exception, match='multiple of 60'):
+        chip8.cycles_per_frame(ips)